@@ -0,0 +1,187 @@
+# amivoice.py
+"""
+AmiVoice 非同期API（音声認識 + 感情分析）のクライアント。
+
+test.py の手順（ジョブを POST → 10秒ごとに GET で状態確認）を、
+1本の asyncio イベントループ（バックグラウンドスレッド）と1つの aiohttp セッションで行う。
+- 複数の発話のジョブを同時に投げ、それぞれの状態確認も並行して行う
+- 状態確認の間隔は最初は短く、長引くほど長くする（POLL_SCHEDULE）
+- submit() は concurrent.futures.Future を返すので、スレッドから待つことも、
+  完了時のコールバック（結果を保存する処理など）を登録することもできる
+
+接続先は RABBIT_AMIVOICE_ENDPOINT（amivoice_mock.py のローカルサーバーも指定できる）、
+APPKEY は AMIVOICE_APP_KEY で指定する。
+"""
+import os
+import time
+import atexit
+import asyncio
+import threading
+import urllib.parse
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional, Sequence
+
+import aiohttp
+
+AMIVOICE_ENDPOINT = os.environ.get("RABBIT_AMIVOICE_ENDPOINT", "https://acp-api-async.amivoice.com/v1/recognitions")
+AMIVOICE_APP_KEY = os.environ.get("AMIVOICE_APP_KEY")
+# 1件のジョブを待つ上限（秒）
+AMIVOICE_TIMEOUT = float(os.environ.get("RABBIT_AMIVOICE_TIMEOUT", "60"))
+# 状態確認の間隔（秒）。最後の値をそれ以降も使う
+POLL_SCHEDULE: Sequence[float] = (0.3, 0.5, 0.5, 1.0, 1.0, 2.0, 3.0, 5.0, 10.0)
+# 同時に投げるジョブの上限
+MAX_CONCURRENT_JOBS = 8
+
+AMIVOICE_DOMAIN = {
+    "grammarFileNames": "-a-general",  # 会話のジャンルによってエンジンを変更できます
+    "loggingOptOut": "False",          # ログ保存
+    "sentimentAnalysis": "True",       # 感情分析を有効にする
+    "keepFillerToken": "1",            # フィラーを残す
+}
+
+
+class AmiVoiceError(Exception):
+    """ジョブの登録・実行に失敗した"""
+
+
+class AmiVoiceClient:
+    """
+    AmiVoice 非同期APIのクライアント。専用スレッドでイベントループを動かし、
+    submit() で投げたジョブをそのループ上で並行して処理する。
+    """
+
+    def __init__(self, app_key: Optional[str] = AMIVOICE_APP_KEY, endpoint: str = AMIVOICE_ENDPOINT,
+                 timeout: float = AMIVOICE_TIMEOUT, poll_schedule: Sequence[float] = POLL_SCHEDULE,
+                 max_concurrent_jobs: int = MAX_CONCURRENT_JOBS, domain: Optional[Dict[str, str]] = None):
+        self.app_key = app_key
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = timeout
+        self.poll_schedule = poll_schedule
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.domain = dict(AMIVOICE_DOMAIN if domain is None else domain)
+        self.completed = 0
+        self.failed = 0
+        self.polls = 0
+        self.latencies = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.app_key)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="amivoice", daemon=True).start()
+                self._loop = loop
+                atexit.register(self.close)
+            return self._loop
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        return self._session
+
+    def submit(self, wav_data: bytes, content_id: str = "utterance.wav") -> Future:
+        """WAVのバイト列でジョブを投げ、結果（レスポンスのJSON）が入る Future を返す"""
+        return asyncio.run_coroutine_threadsafe(self.recognize(wav_data, content_id), self._ensure_loop())
+
+    def recognize_sync(self, wav_data: bytes, content_id: str = "utterance.wav") -> dict:
+        """submit() して結果を待つ。失敗はすべて AmiVoiceError にする"""
+        future = self.submit(wav_data, content_id)
+        try:
+            return future.result(self.timeout + 5)
+        except FutureTimeoutError as e:
+            future.cancel()
+            raise AmiVoiceError(f"{self.timeout + 5:.0f}秒以内に結果が返りませんでした") from e
+
+    async def recognize(self, wav_data: bytes, content_id: str = "utterance.wav") -> dict:
+        """ジョブを登録し、完了するまで状態を確認して結果を返す"""
+        if not self.enabled:
+            raise AmiVoiceError("AMIVOICE_APP_KEY が設定されていません")
+        session = await self._get_session()
+        start = time.perf_counter()
+        async with self._semaphore:
+            try:
+                session_id = await self._create_job(session, wav_data, content_id)
+                result = await self._wait_for_result(session, session_id, start + self.timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.failed += 1
+                raise AmiVoiceError(f"AmiVoice との通信に失敗しました: {e}") from e
+            except (ValueError, TypeError, AttributeError, KeyError) as e:
+                # 応答がJSONでない・想定した形でない（json の JSONDecodeError は ValueError）
+                self.failed += 1
+                raise AmiVoiceError(f"AmiVoice の応答を読めませんでした: {e}") from e
+            except AmiVoiceError:
+                self.failed += 1
+                raise
+        latency = time.perf_counter() - start
+        self.completed += 1
+        self.latencies.append(latency)
+        print(f"[AmiVoice] ジョブ {session_id} 完了: {latency:.2f}秒")
+        return result
+
+    async def _create_job(self, session: aiohttp.ClientSession, wav_data: bytes, content_id: str) -> str:
+        domain = dict(self.domain, contentId=content_id)
+        form = aiohttp.FormData()
+        form.add_field("u", self.app_key)
+        form.add_field("d", " ".join(f"{key}={urllib.parse.quote(value)}" for key, value in domain.items()))
+        form.add_field("a", wav_data, filename=content_id, content_type="application/octet-stream")
+        async with session.post(self.endpoint, data=form) as response:
+            if response.status != 200:
+                raise AmiVoiceError(f"ジョブの登録に失敗しました: HTTP {response.status} {await response.text()}")
+            body = await response.json(content_type=None)
+        if "sessionid" not in body:
+            raise AmiVoiceError(f"ジョブの登録に失敗しました: {body.get('message')} ({body.get('code')})")
+        return body["sessionid"]
+
+    async def _wait_for_result(self, session: aiohttp.ClientSession, session_id: str, deadline: float) -> dict:
+        headers = {"Authorization": f"Bearer {self.app_key}"}
+        attempt = 0
+        while True:
+            delay = self.poll_schedule[min(attempt, len(self.poll_schedule) - 1)]
+            if time.perf_counter() + delay > deadline:
+                raise AmiVoiceError(f"ジョブ {session_id} が {self.timeout:.0f}秒以内に完了しませんでした")
+            await asyncio.sleep(delay)
+            attempt += 1
+            self.polls += 1
+            async with session.get(f"{self.endpoint}/{session_id}", headers=headers) as response:
+                if response.status != 200:
+                    raise AmiVoiceError(f"状態の取得に失敗しました: HTTP {response.status} {await response.text()}")
+                result = await response.json(content_type=None)
+            status = result.get("status")
+            if status == "completed":
+                return result
+            if status == "error":
+                raise AmiVoiceError(f"ジョブ {session_id} がエラーになりました: {result.get('message')}")
+
+    def close(self) -> None:
+        """セッションとイベントループを閉じる"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result(5)
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "polls": self.polls,
+            "latency_mean": sum(latencies) / len(latencies) if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+
+def sentiment_segments(result: dict) -> list:
+    """レスポンスから感情分析のセグメントを取り出す"""
+    return (result.get("sentiment_analysis") or {}).get("segments", [])
@@ -0,0 +1,360 @@
+# amivoice_ingest.py
+"""
+AmiVoice の結果ファイル（data.json の形式）を少しずつ読み込んで取り込むツール。
+
+json.load はファイル全体を一度にメモリへ載せるため、何時間分もの結果では重い。
+AmiVoiceStreamParser はファイルをチャンク（既定 64KiB）ずつ読み、JSONの構造（括弧・キー）だけを追って、
+- segments[].results[].tokens[] の各トークン → Token
+- sentiment_analysis.segments[] の各セグメント → SentimentSegment
+になったところで、その要素だけを json でデコードして返す。
+メモリに載るのは読みかけのチャンクと要素1つ分だけで、ファイルの大きさによらない。
+bulk_load() はこれらを batch_size 件ずつまとめて取り込み先に渡す。
+
+使い方:
+    python amivoice_ingest.py data.json --dry-run
+    python amivoice_ingest.py archive/*.json --batch-size 1000
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple, Union
+
+CHUNK_SIZE = 64 * 1024
+# 要素1つの上限（これを超えても閉じない要素は壊れたファイルとみなす）
+MAX_RECORD_CHARS = 1024 * 1024
+INGEST_BATCH_SIZE = 500
+TOKENS_TABLE = "amivoice_tokens"
+SENTIMENT_TABLE = "amivoice_sentiment_segments"
+
+TOKEN_PATH = ("segments", "item", "results", "item", "tokens", "item")
+SENTIMENT_PATH = ("sentiment_analysis", "segments", "item")
+# metadata に残すトップレベルのキー。全文の "text" など、録音の長さに比例して大きくなる値は読み飛ばす
+METADATA_KEYS = ("session_id", "status", "code", "message")
+
+_STRING_SPECIAL = re.compile(r'[\\"]')
+
+# AmiVoice の感情分析の指標（SentimentSegment.values の並び）
+SENTIMENT_METRICS = (
+    "energy", "content", "upset", "aggression", "stress", "uncertainty", "excitement", "concentration",
+    "emo_cog", "hesitation", "brain_power", "embarrassment", "intensive_thinking", "imagination_activity",
+    "extreme_emotion", "passionate", "atmosphere", "anticipation", "dissatisfaction", "confidence",
+)
+
+
+class AmiVoiceParseError(ValueError):
+    """結果ファイルのJSONが壊れている"""
+
+
+class Token(NamedTuple):
+    session_id: str
+    segment: int        # segments[] の何番目か
+    result: int         # results[] の何番目か
+    index: int          # tokens[] の何番目か
+    written: str
+    spoken: str
+    start_ms: int
+    end_ms: int
+    confidence: float
+    label: Optional[str]
+
+    def as_row(self) -> dict:
+        return self._asdict()
+
+
+class SentimentSegment(NamedTuple):
+    session_id: str
+    index: int
+    start_ms: int
+    end_ms: int
+    values: Tuple[Optional[float], ...]   # SENTIMENT_METRICS の順
+
+    def as_row(self) -> dict:
+        row = {"session_id": self.session_id, "index": self.index, "start_ms": self.start_ms, "end_ms": self.end_ms}
+        row.update(zip(SENTIMENT_METRICS, self.values))
+        return row
+
+
+Record = Union[Token, SentimentSegment]
+
+
+class _Container:
+    """読みかけのオブジェクト・配列（オブジェクトなら今のキー、配列なら今の添字）"""
+    __slots__ = ("is_object", "key", "expect_key", "index")
+
+    def __init__(self, is_object: bool):
+        self.is_object = is_object
+        self.key = None
+        self.expect_key = is_object
+        self.index = -1
+
+
+class AmiVoiceStreamParser:
+    """
+    AmiVoice の結果を1ファイル分、少しずつ読んで Token / SentimentSegment を順に返す。
+    トップレベルの値のうち METADATA_KEYS のもの（session_id など）は metadata に入る。
+    それ以外の文字列は、中身をメモリに溜めずに読み飛ばす。
+    """
+
+    def __init__(self, fp: TextIO, source: str = "", chunk_size: int = CHUNK_SIZE):
+        self.fp = fp
+        self.source = source
+        self.chunk_size = chunk_size
+        self.metadata: Dict[str, object] = {}
+        self.bytes_read = 0
+        self.max_buffer = 0
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._stack: List[_Container] = []
+        self._decoder = json.JSONDecoder()
+
+    @property
+    def session_id(self) -> str:
+        return str(self.metadata.get("session_id") or self.source)
+
+    # ---- 読み込み ----
+    def _fill(self) -> bool:
+        """読み終えた部分を捨てて次のチャンクを足す。ファイルの終わりなら False"""
+        if self._eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        self.bytes_read += len(chunk)
+        self.max_buffer = max(self.max_buffer, len(self._buf))
+        if not chunk:
+            self._eof = True
+        return bool(chunk)
+
+    def _peek(self) -> Optional[str]:
+        """空白を読み飛ばして次の文字を返す（ファイルの終わりなら None）"""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return None
+
+    def _read_string(self) -> str:
+        """文字列のトークン（引用符を含む）を読む"""
+        start = self._pos + 1
+        while True:
+            end = self._buf.find('"', start)
+            while end != -1:
+                backslashes = 0
+                while self._buf[end - 1 - backslashes] == "\\":
+                    backslashes += 1
+                if backslashes % 2 == 0:
+                    break
+                end = self._buf.find('"', end + 1)
+            if end != -1:
+                token = self._buf[self._pos:end + 1]
+                self._pos = end + 1
+                return token
+            start = len(self._buf) - self._pos
+            if not self._fill():
+                raise AmiVoiceParseError(f"{self.source}: 文字列が閉じていません")
+            # _fill で読み終えた部分が捨てられたので、探し始める位置を付け直す
+            start = max(1, start)
+
+    def _skip_string(self) -> None:
+        """文字列のトークンを、読んだ部分を捨てながら読み飛ばす（どれだけ長くてもチャンク1つ分しか持たない）"""
+        pos = self._pos + 1
+        while True:
+            match = _STRING_SPECIAL.search(self._buf, pos)
+            while match is not None and match.group() == "\\":
+                # エスケープされた次の1文字は飛ばす（チャンクの境目をまたぐこともある）
+                pos = match.start() + 2
+                match = _STRING_SPECIAL.search(self._buf, pos)
+            if match is not None:
+                self._pos = match.end()
+                return
+            overshoot = max(0, pos - len(self._buf))
+            self._pos = len(self._buf)
+            if not self._fill():
+                raise AmiVoiceParseError(f"{self.source}: 文字列が閉じていません")
+            pos = self._pos + overshoot
+
+    def _read_scalar(self) -> str:
+        """数値・true・false・null のトークンを読む"""
+        while True:
+            end = self._pos
+            while end < len(self._buf) and self._buf[end] not in ",}] \t\r\n":
+                end += 1
+            if end < len(self._buf) or self._eof:
+                token = self._buf[self._pos:end]
+                self._pos = end
+                return token
+            self._fill()
+
+    def _decode_value(self):
+        """取り出す要素を丸ごとデコードする（途中で切れていれば次のチャンクを足して読み直す）"""
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                if len(self._buf) - self._pos > MAX_RECORD_CHARS or not self._fill():
+                    raise AmiVoiceParseError(f"{self.source}: 要素を読めませんでした: {e}") from e
+                continue
+            self._pos = end
+            return value
+
+    def _path(self) -> tuple:
+        return tuple(c.key if c.is_object else "item" for c in self._stack)
+
+    def _indices(self) -> tuple:
+        return tuple(c.index for c in self._stack if not c.is_object)
+
+    # ---- 構造を追う ----
+    def __iter__(self) -> Iterator[Record]:
+        stack = self._stack
+        while True:
+            c = self._peek()
+            if c is None:
+                if stack:
+                    raise AmiVoiceParseError(f"{self.source}: ファイルが途中で終わっています")
+                return
+            top = stack[-1] if stack else None
+            if c == ",":
+                if top is not None and top.is_object:
+                    top.expect_key = True
+                self._pos += 1
+                continue
+            if c == ":":
+                top.expect_key = False
+                self._pos += 1
+                continue
+            if c in "}]":
+                stack.pop()
+                self._pos += 1
+                continue
+            if top is not None and top.is_object and top.expect_key:
+                if c != '"':
+                    raise AmiVoiceParseError(f"{self.source}: キーがありません（{c!r}）")
+                top.key = json.loads(self._read_string())
+                continue
+
+            # ここから値
+            if top is not None and not top.is_object:
+                top.index += 1
+            path = self._path()
+            if path == TOKEN_PATH:
+                yield self._token(self._decode_value())
+            elif path == SENTIMENT_PATH:
+                yield self._sentiment(self._decode_value())
+            elif c == "{":
+                stack.append(_Container(True))
+                self._pos += 1
+            elif c == "[":
+                stack.append(_Container(False))
+                self._pos += 1
+            else:
+                keep = len(stack) == 1 and top.is_object and top.key in METADATA_KEYS
+                if c == '"' and not keep:
+                    self._skip_string()
+                    continue
+                token = self._read_string() if c == '"' else self._read_scalar()
+                if keep:
+                    try:
+                        self.metadata[top.key] = json.loads(token)
+                    except json.JSONDecodeError as e:
+                        raise AmiVoiceParseError(f"{self.source}: 値を読めませんでした: {token[:40]}") from e
+
+    def _token(self, item: dict) -> Token:
+        segment, result, index = self._indices()
+        return Token(self.session_id, segment, result, index, item.get("written", ""), item.get("spoken", ""),
+                     int(item.get("starttime", 0)), int(item.get("endtime", 0)),
+                     float(item.get("confidence", 0.0)), item.get("label"))
+
+    def _sentiment(self, item: dict) -> SentimentSegment:
+        (index,) = self._indices()
+        return SentimentSegment(self.session_id, index, int(item.get("starttime", 0)), int(item.get("endtime", 0)),
+                                tuple(item.get(key) for key in SENTIMENT_METRICS))
+
+
+def iter_records(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Record]:
+    """結果ファイル1つ分の Token / SentimentSegment を順に返す"""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from AmiVoiceStreamParser(f, source=os.path.basename(path), chunk_size=chunk_size)
+
+
+def bulk_load(records: Iterable[Record], sinks: Dict[type, Callable[[List[dict]], object]],
+              batch_size: int = INGEST_BATCH_SIZE) -> Dict[str, int]:
+    """
+    レコードを種類ごとに batch_size 件ずつまとめて sinks[型]（行のリストを取り込む関数）に渡す。
+    メモリに溜めるのは種類ごとに batch_size 件まで。種類ごとの件数を返す。
+    """
+    batches: Dict[type, List[dict]] = {kind: [] for kind in sinks}
+    counts = {kind.__name__: 0 for kind in sinks}
+    for record in records:
+        kind = type(record)
+        batch = batches.get(kind)
+        if batch is None:
+            continue
+        batch.append(record.as_row())
+        counts[kind.__name__] += 1
+        if len(batch) >= batch_size:
+            sinks[kind](batch)
+            batches[kind] = []
+    for kind, batch in batches.items():
+        if batch:
+            sinks[kind](batch)
+    return counts
+
+
+def _supabase_sinks(tokens_table: str, sentiment_table: str) -> Dict[type, Callable[[List[dict]], object]]:
+    from config import supabase
+
+    def table_sink(table: str):
+        return lambda rows: supabase.table(table).insert(rows).execute()
+    return {Token: table_sink(tokens_table), SentimentSegment: table_sink(sentiment_table)}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AmiVoice の結果ファイルを少しずつ読んで取り込む")
+    parser.add_argument("paths", nargs="+", help="結果のJSONファイル")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--tokens-table", default=TOKENS_TABLE)
+    parser.add_argument("--sentiment-table", default=SENTIMENT_TABLE)
+    parser.add_argument("--dry-run", action="store_true", help="取り込まずに件数と速度だけ表示する")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        sinks = {Token: lambda rows: None, SentimentSegment: lambda rows: None}
+    else:
+        sinks = _supabase_sinks(args.tokens_table, args.sentiment_table)
+
+    for path in args.paths:
+        start = time.perf_counter()
+        try:
+            counts = bulk_load(iter_records(path, args.chunk_size), sinks, args.batch_size)
+        except AmiVoiceParseError as e:
+            print("読み込みに失敗しました:", e)
+            continue
+        elapsed = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{path}: トークン {counts['Token']}件, 感情分析 {counts['SentimentSegment']}件 "
+              f"({size_mb:.1f}MB, {elapsed:.2f}秒, {size_mb / max(elapsed, 1e-9):.1f}MB/秒)")
+    peak = _peak_rss_mb()
+    if peak is not None:
+        print(f"最大メモリ使用量: {peak:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# amivoice_mock.py
+"""
+AmiVoice 非同期APIのローカルモックサーバー。
+
+本物のAPIと同じく POST でジョブを受け付けて sessionid を返し、GET で状態を返す。
+ジョブは --delay 秒たつまで "processing"、その後 "completed" になり、
+data.json（実際のAPIのレスポンス）の感情分析セグメントを、送られた音声の長さに合わせて返す。
+
+使い方:
+    python amivoice_mock.py --port 8765 --delay 1.0
+    RABBIT_AMIVOICE_ENDPOINT=http://127.0.0.1:8765/v1/recognitions AMIVOICE_APP_KEY=mock python main.py
+"""
+import io
+import os
+import json
+import time
+import uuid
+import wave
+import argparse
+
+from aiohttp import web
+
+SAMPLE_RESPONSE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.json")
+
+
+def _audio_millis(data: bytes) -> int:
+    try:
+        with wave.open(io.BytesIO(data), "rb") as w:
+            return int(w.getnframes() * 1000 / w.getframerate())
+    except (wave.Error, EOFError):
+        return 0
+
+
+class MockAmiVoiceServer:
+    """ジョブを覚えておき、登録から delay 秒で完了にする"""
+
+    def __init__(self, delay: float = 1.0, sample_path: str = SAMPLE_RESPONSE, fail_every: int = 0):
+        self.delay = delay
+        self.fail_every = fail_every
+        with open(sample_path, "r", encoding="utf-8") as f:
+            self.sample = json.load(f)
+        self.jobs = {}
+        self.requests = 0
+
+    def _segments(self, duration_ms: int) -> list:
+        """サンプルのセグメントを、音声の長さに収まるように時刻をずらして返す"""
+        segments = self.sample.get("sentiment_analysis", {}).get("segments", [])
+        if not segments or duration_ms <= 0:
+            return []
+        result = []
+        step = max(1, duration_ms // len(segments))
+        for i, segment in enumerate(segments):
+            result.append(dict(segment, starttime=i * step, endtime=min(duration_ms, (i + 1) * step)))
+        return result
+
+    async def create(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        number = self.requests
+        form = await request.post()
+        if not form.get("u"):
+            return web.json_response({"code": "-", "message": "received illegal service authorization"})
+        audio = form.get("a")
+        data = audio.file.read() if hasattr(audio, "file") else b""
+        session_id = uuid.uuid4().hex[:24]
+        failed = bool(self.fail_every) and number % self.fail_every == 0
+        self.jobs[session_id] = {"created": time.monotonic(), "duration_ms": _audio_millis(data), "failed": failed}
+        return web.json_response({"sessionid": session_id, "text": "..."})
+
+    async def status(self, request: web.Request) -> web.Response:
+        job = self.jobs.get(request.match_info["session_id"])
+        if job is None:
+            return web.json_response({"code": "-", "message": "session not found"}, status=404)
+        session_id = request.match_info["session_id"]
+        if time.monotonic() - job["created"] < self.delay:
+            return web.json_response({"session_id": session_id, "status": "processing"})
+        if job["failed"]:
+            return web.json_response({"session_id": session_id, "status": "error", "message": "mock failure"})
+        return web.json_response(dict(
+            self.sample,
+            session_id=session_id,
+            status="completed",
+            sentiment_analysis={"segments": self._segments(job["duration_ms"])},
+        ))
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/recognitions", self.create)
+        app.router.add_get("/v1/recognitions/{session_id}", self.status)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AmiVoice 非同期APIのモックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=1.0, help="ジョブが完了するまでの秒数")
+    parser.add_argument("--fail-every", type=int, default=0, help="N件に1件をエラーにする（0なら失敗しない）")
+    args = parser.parse_args()
+    web.run_app(MockAmiVoiceServer(args.delay, fail_every=args.fail_every).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
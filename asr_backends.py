@@ -0,0 +1,299 @@
+# asr_backends.py
+"""
+音声認識(ASR)バックエンドの切り替え。
+
+- GoogleASR: speech_recognition の recognize_google（発話ごとにインターネット往復が発生する）
+- WhisperASR: ローカルの Whisper。起動時に一度だけモデルを読み込んで常駐させ、
+  メモリ上のPCMをそのまま文字起こしする
+- HedgedASR: 同じ発話をクラウドとローカルに同時に投げ、信頼度が基準を超えた最初の結果を使う
+
+使うバックエンドは環境変数 RABBIT_ASR_BACKEND（"google" / "whisper" / "hedged"）で選ぶ。
+入力は AudioBuffer（16kHz・モノラル・int16）で、各バックエンドが必要な形式に一度だけ変換する。
+認識できなかったときは speech_recognition と同じく sr.UnknownValueError を、
+サービスに接続できなかったときは sr.RequestError を送出する。
+"""
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional
+
+import numpy as np
+import speech_recognition as sr
+
+from audio_buffer import AudioBuffer
+
+ASR_BACKEND = os.environ.get("RABBIT_ASR_BACKEND", "google")
+WHISPER_MODEL = os.environ.get("RABBIT_WHISPER_MODEL", "small")
+# ヘッジ認識で「良い結果」とみなす信頼度（Googleは信頼度が返らないとき0.5になる）
+HEDGE_CONFIDENCE_THRESHOLD = float(os.environ.get("RABBIT_ASR_HEDGE_CONFIDENCE", "0.5"))
+HEDGE_TIMEOUT = float(os.environ.get("RABBIT_ASR_HEDGE_TIMEOUT", "15"))
+ASR_LANGUAGE = "ja-JP"
+ASR_SAMPLE_RATE = AudioBuffer.sample_rate
+
+
+class ASRResult:
+    """認識結果（テキスト・信頼度・バックエンド名・処理時間）"""
+
+    def __init__(self, text: str, confidence: float, backend: str, latency: float, audio_seconds: float):
+        self.text = text
+        self.confidence = confidence
+        self.backend = backend
+        self.latency = latency
+        self.audio_seconds = audio_seconds
+
+    @property
+    def real_time_factor(self) -> float:
+        """処理時間 / 音声の長さ（1未満なら実時間より速い）"""
+        return self.latency / self.audio_seconds if self.audio_seconds else 0.0
+
+    def __repr__(self) -> str:
+        return (f"ASRResult(text={self.text!r}, confidence={self.confidence:.2f}, "
+                f"backend={self.backend!r}, latency={self.latency:.2f}s)")
+
+
+class ASRBackend:
+    """ASRバックエンドの共通インターフェース"""
+
+    name = "base"
+
+    def load(self) -> None:
+        """モデルの読み込みなど、起動時に済ませておく準備（不要なら何もしない）"""
+
+    def recognize(self, audio: AudioBuffer) -> ASRResult:
+        raise NotImplementedError
+
+
+class GoogleASR(ASRBackend):
+    """Google Web Speech API による認識"""
+
+    name = "google"
+
+    def __init__(self, language: str = ASR_LANGUAGE):
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio: AudioBuffer) -> ASRResult:
+        start = time.perf_counter()
+        text, confidence = self.recognizer.recognize_google(audio.to_audio_data(), language=self.language,
+                                                            with_confidence=True)
+        return ASRResult(text, float(confidence), self.name, time.perf_counter() - start, audio.duration)
+
+
+class WhisperASR(ASRBackend):
+    """
+    常駐モデルによる Whisper の認識。
+    cold_load_seconds にモデル読み込み時間、cold_latency に初回推論の時間、
+    warm_latencies に2回目以降の推論時間を記録する。
+    """
+
+    name = "whisper"
+
+    def __init__(self, model_name: str = WHISPER_MODEL, language: str = "ja", device: Optional[str] = None):
+        self.model_name = model_name
+        self.language = language
+        self.device = device
+        self.model = None
+        self.cold_load_seconds: Optional[float] = None
+        self.cold_latency: Optional[float] = None
+        self.warm_latencies: List[float] = []
+        self.real_time_factors: List[float] = []
+        self._fp16 = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """モデルを読み込み、無音で一度推論してウォームアップする"""
+        with self._lock:
+            if self.model is not None:
+                return
+            import torch
+            import whisper
+            device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+            self._fp16 = device == "cuda"
+            start = time.perf_counter()
+            self.model = whisper.load_model(self.model_name, device=device)
+            self.cold_load_seconds = time.perf_counter() - start
+            print(f"[ASR] Whisper({self.model_name}, {device}) を読み込みました: {self.cold_load_seconds:.1f}秒")
+            start = time.perf_counter()
+            self.model.transcribe(np.zeros(ASR_SAMPLE_RATE, dtype=np.float32),
+                                  language=self.language, fp16=self._fp16)
+            self.cold_latency = time.perf_counter() - start
+            print(f"[ASR] Whisper ウォームアップ: {self.cold_latency:.2f}秒")
+
+    def transcribe(self, pcm: np.ndarray) -> ASRResult:
+        """16kHz モノラル float32 のPCMを文字起こしする"""
+        self.load()
+        start = time.perf_counter()
+        with self._lock:
+            result = self.model.transcribe(pcm, language=self.language, fp16=self._fp16)
+        latency = time.perf_counter() - start
+        seconds = len(pcm) / ASR_SAMPLE_RATE
+        self.warm_latencies.append(latency)
+        if seconds:
+            self.real_time_factors.append(latency / seconds)
+
+        text = result.get("text", "").strip()
+        segments = result.get("segments", [])
+        if not text or (segments and all(seg.get("no_speech_prob", 0) > 0.6 for seg in segments)):
+            raise sr.UnknownValueError()
+        # 平均対数尤度を 0〜1 の信頼度に変換する
+        logprobs = [seg.get("avg_logprob", 0.0) for seg in segments]
+        confidence = float(np.exp(np.mean(logprobs))) if logprobs else 0.0
+        asr_result = ASRResult(text, confidence, self.name, latency, seconds)
+        print(f"[ASR] Whisper: {latency:.2f}秒 (RTF {asr_result.real_time_factor:.2f})")
+        return asr_result
+
+    def recognize(self, audio: AudioBuffer) -> ASRResult:
+        return self.transcribe(audio.to_float32())
+
+    def stats(self) -> dict:
+        warm = self.warm_latencies
+        return {
+            "cold_load_seconds": self.cold_load_seconds,
+            "cold_latency": self.cold_latency,
+            "warm_latency_mean": float(np.mean(warm)) if warm else None,
+            "warm_latency_p90": float(np.percentile(warm, 90)) if warm else None,
+            "real_time_factor_mean": float(np.mean(self.real_time_factors)) if self.real_time_factors else None,
+            "calls": len(warm),
+        }
+
+
+class LatencyHistogram:
+    """レイテンシの度数分布（上限秒ごとのバケット）"""
+
+    BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.samples = 0
+
+    def observe(self, seconds: float) -> None:
+        for i, upper in enumerate(self.BUCKETS):
+            if seconds <= upper:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.samples += 1
+
+    def as_dict(self) -> Dict[str, int]:
+        return {(f"<={upper}s" if upper != float("inf") else ">8.0s"): count
+                for upper, count in zip(self.BUCKETS, self.counts)}
+
+
+class HedgedASR(ASRBackend):
+    """
+    複数のバックエンドに同じ発話を同時に投げ、信頼度が confidence_threshold 以上の
+    最初の結果を返す。負けた側は結果を待たずに打ち切る（実行前なら取り消し、
+    実行中のものは完了しても結果を捨てる）。どれも基準に届かなければ、
+    揃った結果のうち最も信頼度の高いものを返す。
+    実行中の認識は途中で止められない（Whisper はモデルのロックも持ったまま）ので、
+    負けてまだ走っているバックエンドは、それが終わるまで次の発話の競争から外す。
+    バックエンドごとの勝ち数・見送った回数とレイテンシ分布を記録する。
+    """
+
+    name = "hedged"
+
+    def __init__(self, backends: List[ASRBackend], confidence_threshold: float = HEDGE_CONFIDENCE_THRESHOLD,
+                 timeout: float = HEDGE_TIMEOUT):
+        self.backends = backends
+        self.confidence_threshold = confidence_threshold
+        self.timeout = timeout
+        self.wins: Dict[str, int] = {backend.name: 0 for backend in backends}
+        self.histograms: Dict[str, LatencyHistogram] = {backend.name: LatencyHistogram() for backend in backends}
+        self.skipped: Dict[str, int] = {backend.name: 0 for backend in backends}
+        # 負けたあともまだ走っている認識（バックエンド名 → Future）
+        self._stragglers: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(backends) * 2, thread_name_prefix="asr-hedge")
+
+    def load(self) -> None:
+        for backend in self.backends:
+            backend.load()
+
+    def _run(self, backend: ASRBackend, audio: AudioBuffer) -> ASRResult:
+        start = time.perf_counter()
+        try:
+            return backend.recognize(audio)
+        finally:
+            # 負けた側も含めて、完了までの時間を記録する
+            with self._lock:
+                self.histograms[backend.name].observe(time.perf_counter() - start)
+
+    def _win(self, result: ASRResult) -> ASRResult:
+        with self._lock:
+            self.wins[result.backend] += 1
+        print(f"[ASR] ヘッジ認識: {result.backend} を採用 (信頼度 {result.confidence:.2f}, {result.latency:.2f}秒)")
+        return result
+
+    def _available(self) -> List[ASRBackend]:
+        """前の発話で負けた認識がまだ走っているバックエンドを除く（全部走っていれば全部使う）"""
+        with self._lock:
+            busy = {name for name, future in self._stragglers.items() if not future.done()}
+            self._stragglers = {name: self._stragglers[name] for name in busy}
+            available = [backend for backend in self.backends if backend.name not in busy]
+            if not busy or not available:
+                return self.backends
+            for name in busy:
+                self.skipped[name] += 1
+        print(f"[ASR] ヘッジ認識: 前の認識が終わっていない {', '.join(sorted(busy))} を今回は使いません")
+        return available
+
+    def recognize(self, audio: AudioBuffer) -> ASRResult:
+        backends = self._available()
+        futures = {self._executor.submit(self._run, backend, audio): backend for backend in backends}
+        pending = set(futures)
+        results: List[ASRResult] = []
+        errors: List[Exception] = []
+        deadline = time.monotonic() + self.timeout
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if result.confidence >= self.confidence_threshold:
+                        return self._win(result)
+                    results.append(result)
+        finally:
+            for future in pending:
+                if not future.cancel():
+                    with self._lock:
+                        self._stragglers[futures[future].name] = future
+
+        if results:
+            return self._win(max(results, key=lambda r: r.confidence))
+        if any(isinstance(e, sr.RequestError) for e in errors) and len(errors) == len(backends):
+            raise sr.RequestError("すべての音声認識バックエンドが失敗しました")
+        raise sr.UnknownValueError()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(self.wins.values())
+            return {
+                name: {
+                    "wins": self.wins[name],
+                    "win_rate": self.wins[name] / total if total else 0.0,
+                    "skipped": self.skipped[name],
+                    "latency_mean": hist.total / hist.samples if hist.samples else None,
+                    "latency_histogram": hist.as_dict(),
+                }
+                for name, hist in self.histograms.items()
+            }
+
+
+def create_asr_backend(name: str = ASR_BACKEND) -> ASRBackend:
+    """設定名からASRバックエンドを作る"""
+    if name == "hedged":
+        return HedgedASR([GoogleASR(), WhisperASR()])
+    if name == "whisper":
+        return WhisperASR()
+    if name == "google":
+        return GoogleASR()
+    raise ValueError(f"不明なASRバックエンドです: {name}")
@@ -1,121 +1,126 @@
 # audio.py
 import threading
 import os
-import sounddevice as sd
-import tempfile
-from gtts import gTTS
 import speech_recognition as sr
 import time
 # from pyAudioAnalysis import audioTrainTest as aT
+from tts_cache import TTSCache
+from tts_backends import TTSSelector, GTTSBackend, LocalTTSBackend
+from speech_pipeline import PipelinedSpeaker
+from audio_output import PlaybackEngine
+from echo import PlaybackTimeline, EchoGate, ECHO_GATE_ENABLED
+from speech_queue import SpeechWorker, PRIORITY_NOTIFICATION, PRIORITY_TASK, PRIORITY_CHAT
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from capture import CaptureService
+from noise_floor import NoiseFloorEstimator
+from asr_backends import create_asr_backend
+from utterance import Utterance
+from audio_buffer import AudioBuffer
+from amivoice import AmiVoiceClient, AmiVoiceError, sentiment_segments
+from sentiment import summarize_segments
+from write_behind import WriteBehindWriter
+from emotion_state import EmotionStateModel
+from emotion_classifier import EmotionClassifier
+from replay import AUDIO_SCRIPT, AUDIO_SINK, scripted_input_factory, null_output_factory
+from wake_word import WakeWordSpotter, WAKE_WORD_SEARCH_SECONDS
+from streaming import PartialTranscriber, PARTIAL_INTERVAL_SECONDS
 
-speech_lock = threading.Lock()
 # 設定情報をconfig.pyからインポート
 from config import OPENAI_API_KEY, SUPABASE_URL, SUPABASE_KEY, CURRENT_USER_ID, supabase
 
+# 合成済み音声のディスクキャッシュ（固定フレーズは2回目以降すぐに再生できる）
+tts_cache = TTSCache()
+# gTTSを優先し、遅延・失敗時はオフラインのpyttsx3で話す
+tts_selector = TTSSelector(tts_cache, GTTSBackend(), LocalTTSBackend())
+# 再生した音声の時刻と音量の記録（マイクに回り込んだ自分の声を聞き取らないために使う）
+playback_timeline = PlaybackTimeline()
+# 出力ストリームを開いたままにする再生エンジン（mpg123のプロセス起動をなくす）
+# RABBIT_AUDIO_SINK=null / record ならスピーカーの代わりに音声を捨てる（または録っておく）
+output_stream_factory = null_output_factory(record=AUDIO_SINK == "record") if AUDIO_SINK in ("null", "record") else None
+playback_engine = PlaybackEngine(timeline=playback_timeline, stream_factory=output_stream_factory)
+# 読み上げと重なる入力フレームを抑制するゲート（RABBIT_ECHO_GATE=0 で無効）
+echo_gate = EchoGate(playback_timeline) if ECHO_GATE_ENABLED else None
+# マイク入力を常時リングバッファに溜めるキャプチャサービス（デバイスを開き直さない）
+# RABBIT_AUDIO_SCRIPT を指定すると、マイクの代わりに台本のWAVと無音を順に流す
+input_stream_factory = scripted_input_factory(AUDIO_SCRIPT) if AUDIO_SCRIPT else None
+# （台本のときは保存済みの雑音レベルを使わず、毎回台本の無音から調整して結果を再現できるようにする）
+capture_service = CaptureService(echo_gate=echo_gate, stream_factory=input_stream_factory,
+                                 noise_floor=NoiseFloorEstimator(path=None) if AUDIO_SCRIPT else None)
+# 音声認識バックエンド（RABBIT_ASR_BACKEND で選択。Whisperは起動時にモデルを読み込んで常駐させる）
+asr_backend = create_asr_backend()
+# 発話中に途中結果を出すか（RABBIT_ASR_STREAMING。既定ではローカルのWhisperのときだけ有効）
+ASR_STREAMING_ENABLED = os.environ.get("RABBIT_ASR_STREAMING", "1" if asr_backend.name == "whisper" else "0") == "1"
+# 「ラビット」の呼びかけを検出するキーワードスポッター（お手本未登録ならすべて通す）
+wake_word_spotter = WakeWordSpotter()
+# pyAudioAnalysis による感情分類を発話ごとに行うか（RABBIT_EMOTION_CLASSIFIER=1 で有効）
+EMOTION_CLASSIFICATION_ENABLED = os.environ.get("RABBIT_EMOTION_CLASSIFIER") == "1"
+# 録音した音声の保存先（未設定なら保存しない）
+AUDIO_ARCHIVE_DIR = os.environ.get("RABBIT_AUDIO_ARCHIVE_DIR")
 
 #########################################
 # ① 音声認識・感情分析関連の関数
 #########################################
 
-def speak(text: str):
-    """テキストをgTTSを用いて読み上げる関数"""
-    with speech_lock:
-        try:
-            tts = gTTS(text=text, lang="ja")
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                temp_filename = fp.name
-            tts.save(temp_filename)
-            os.system("mpg123 -q " + temp_filename)
-        finally:
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
-
-def analyze_sentiment(file_path: str) -> dict:
-    """
-    ダミーの感情分析結果を返す関数です。
-    ※ 実際には、ここで音声ファイル(file_path)を対象にAPI呼び出し等を実施してください。
-    """
-    # 例として、1件のダミーセグメントを返す
-    return {
-        "segments": [
-            {
-                "starttime": 0,
-                "endtime": 3000,
-                "energy": 10,
-                "stress": 20,
-                "confidence": 30
-            }
-        ]
-    }
+def synthesize(text: str, lang: str = "ja") -> str:
+    """
+    テキストを音声合成し、キャッシュ済み音声ファイル(MP3/WAV)のパスを返す関数。
+    一度合成したフレーズはディスクキャッシュから返すため、ネットワーク通信が発生しない。
+    gTTSが遅い・失敗するときはpyttsx3のローカル合成に切り替える。
+    """
+    return tts_selector.synthesize(text, lang)
 
-def process_sentiment_and_save(file_path: str, recognized_text: str) -> None:
+def archive_audio(audio: AudioBuffer, prefix: str = "utterance") -> None:
     """
-    指定された音声ファイルに対して感情分析を行い、各指標の平均値を計算して
-    認識結果の全文(recognized_text)とともにSupabaseのsentiment_averagesテーブルへ保存します。
+    アーカイブが有効（RABBIT_AUDIO_ARCHIVE_DIR が設定されている）ときだけ、
+    録音した音声をWAVファイルとして保存する関数。通常はディスクに書き込まない。
     """
-    sentiment_result = analyze_sentiment(file_path)
-    segments = sentiment_result.get("segments", [])
-    if not segments:
-        print("感情分析のセグメントが見つかりませんでした。")
+    if not AUDIO_ARCHIVE_DIR:
         return
+    os.makedirs(AUDIO_ARCHIVE_DIR, exist_ok=True)
+    file_name = f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}.wav"
+    with open(os.path.join(AUDIO_ARCHIVE_DIR, file_name), "wb") as f:
+        f.write(audio.wav_bytes())
 
-    sums = {}
-    counts = {}
-    for seg in segments:
-        for key, value in seg.items():
-            if key in ("starttime", "endtime"):
-                continue
-            if isinstance(value, (int, float)):
-                sums[key] = sums.get(key, 0) + value
-                counts[key] = counts.get(key, 0) + 1
-    averages = {key: sums[key] / counts[key] for key in sums}
-    print("感情分析の平均値:", averages)
+def play_file(audio_path: str) -> bool:
+    """合成済みの音声ファイルを常駐の出力ストリームで再生し、最後まで再生できたかを返す関数"""
+    return playback_engine.play(audio_path)
 
-    data = {
-        "user_id": CURRENT_USER_ID,
-        "talk": recognized_text,
-        # 必要に応じて平均値なども保存可能
-        # "energy": averages.get("energy"),
-        # "stress": averages.get("stress"),
-        # "confidence": averages.get("confidence"),
-    }
-    emotions = supabase.table("sentiment_averages").insert(data).execute()
-    print("Supabaseへの登録結果:", emotions)
+# 文ごとに合成と再生を重ねて、長い返答でもすぐに話し始める
+pipelined_speaker = PipelinedSpeaker(synthesize, play_file)
+# 読み上げは1本のワーカーが優先度順に処理する（タスク通知 > タスク登録 > 雑談）
+speech_worker = SpeechWorker(pipelined_speaker.speak, playback_engine.stop)
 
-def get_latest_sentiment_data(user_id: str) -> dict:
+def speak_async(text: str, priority: int = PRIORITY_CHAT, max_age: float = None) -> Future:
     """
-    指定ユーザーの最新の感情分析レコードをSupabaseから取得する。
+    読み上げを予約してすぐに戻る関数。
+    返り値の Future は読み上げ終了で True、破棄・中断で False になる。
+    max_age 秒以内に読み上げが始まらなければ破棄する。
     """
-    res = supabase.table("sentiment_averages") \
-                .select("*") \
-                .eq("user_id", user_id) \
-                .order("created_at", desc=True) \
-                .limit(1) \
-                .execute()
-    data = res.data
-    if data and len(data) > 0:
-        return data[0]
-    else:
-        return {}
+    return speech_worker.submit(text, priority=priority, max_age=max_age)
 
-def generate_ai_emotions_from_record(record: dict) -> str:
-    """
-    Supabaseに保存された感情分析結果レコード(record)をもとに、
-    簡単な解釈文を生成します。（例：エネルギー、ストレスの傾向など）
-    ※ 必要に応じて内容をカスタマイズしてください。
-    """
-    # ダミーの結果を返す例
-    return "エネルギーは平均的で、ストレスは低い状態です。"
+def speak(text: str, priority: int = PRIORITY_CHAT) -> bool:
+    """テキストを読み上げ、終わるまで待つ関数（文単位で合成しながら再生する）"""
+    return speak_async(text, priority=priority).result()
+
+def stop_speaking() -> None:
+    """ユーザーが話し始めたときに呼び、再生中の読み上げと待ちの雑談を打ち切る関数"""
+    speech_worker.barge_in()
+
+# 読み上げ中にユーザーが話し始めたら読み上げを打ち切る（RABBIT_BARGE_IN=0 で無効）
+# 自分の声と区別するためにエコーゲートを使うので、エコーゲートが無効なときは行わない
+BARGE_IN_ENABLED = os.environ.get("RABBIT_BARGE_IN", "1") == "1" and echo_gate is not None
+if BARGE_IN_ENABLED:
+    capture_service.watch_barge_in(speech_worker.is_speaking, stop_speaking)
 
-def recognize_speech_from_file(file_path: str) -> str:
+def recognize_speech_from_file(source_file) -> str:
     """
-    録音済みのWAVファイル(file_path)から音声認識を実施し、テキストを返す。
+    録音済みのWAVファイルから音声認識を実施し、テキストを返す。
+    source_file にはファイルパスのほか、WAVのバイト列を入れた io.BytesIO も渡せる。
     """
-    recognizer = sr.Recognizer()
-    with sr.AudioFile(file_path) as source:
-        audio = recognizer.record(source)
+    audio = AudioBuffer.from_file(source_file)
     try:
-        text = recognizer.recognize_google(audio, language="ja-JP")
+        text = asr_backend.recognize(audio).text
         return text
     except sr.UnknownValueError:
         print("音声を認識できませんでした。")
@@ -128,12 +133,12 @@ def recognize_speech_from_file(file_path: str) -> str:
 # ② 感情分類関連の関数（pyAudioAnalysis利用）
 #########################################
 
-# モデル名とタイプ（ファイルの存在・パス、拡張子などを確認してください）
-# MODEL_NAME = "mySVMModel"
-# MODEL_TYPE = "svm"
+# 感情分類モデル（emotion_svm_model / emotion_svm_modelMEANS）は最初に一度だけ読み込んで使い回す
+emotion_classifier = EmotionClassifier()
 
 def record_audio(filename, duration=3, sr=16000):
     """マイクから音声を録音し、WAVファイルとして保存する関数"""
+    import sounddevice as sd
     print("録音開始...")
     try:
         audio = sd.rec(int(duration * sr), samplerate=sr, channels=1)
@@ -146,26 +151,15 @@ def record_audio(filename, duration=3, sr=16000):
 
 def classify_emotion(file_path: str) -> str:
     """
-    pyAudioAnalysis の file_classification を用いて、ファイルの感情分類を実施する関数。
-    分類結果（感情ラベル）を返します。
+    音声ファイルの感情分類を実施する関数。分類結果（感情ラベル）を返します。
+    （常駐している emotion_classifier で分類する。発話の音声は classify_emotion_from_buffer を使う）
     """
     try:
-        result, probability, class_names = aT.file_classification(file_path, MODEL_NAME, MODEL_TYPE)
+        return emotion_classifier.classify(AudioBuffer.from_file(file_path))
     except Exception as e:
         print("分類中にエラーが発生しました:", e)
         return None
 
-    if not isinstance(class_names, list):
-        print("モデルが見つからないか、分類に失敗しました。")
-        return None
-
-    try:
-        emotion_label = class_names[int(result)]
-        return emotion_label
-    except Exception as e:
-        print("感情ラベルの取得に失敗しました:", e)
-        return None
-
 def get_voice_input(timeout=5):
     """
     マイクから音声入力を取得し、Googleの音声認識APIで日本語テキストに変換する関数
@@ -234,8 +228,8 @@ if __name__ == "__main__":
         # ①：感情分析＆Supabase登録処理
         # process_sentiment_and_save(audio_file, recognized_text)
         
-        # # 最新の感情分析レコードからAI解釈結果を取得
-        # record_data = get_latest_sentiment_data(CURRENT_USER_ID)
+        # # 今の気分からAI解釈結果を取得
+        # record_data = get_current_emotions(CURRENT_USER_ID)
         # if record_data:
         #     ai_emotions = generate_ai_emotions_from_record(record_data)
         #     print("感情分析の情報:", ai_emotions)
@@ -288,95 +282,68 @@ speech_lock = threading.Lock()
 
 
 
-# analyze_sentiment 関数を先に定義する
-def analyze_sentiment(file_path: str) -> dict:
-    """
-    ダミーの感情分析結果を返す関数です。
-    実際には、ここで音声ファイル (file_path) を分析するAPI等にリクエストし、結果を取得してください。
-    以下はサンプルとして2件のセグメントを返す例です。
-    """
-    return {
-        "segments": [
-            # {
-            #     "starttime": 1000,
-            #     "endtime": 2000,
-            #     "energy": 3,
-            #     "content": 0,
-            #     "upset": 0,
-            #     "aggression": 0,
-            #     "stress": 10,
-            #     "uncertainty": 15,
-            #     "excitement": 12,
-            #     "concentration": 8,
-            #     "emo_cog": 20,
-            #     "hesitation": 5,
-            #     "brain_power": 25,
-            #     "embarrassment": 0,
-            #     "intensive_thinking": 30,
-            #     "imagination_activity": 7,
-            #     "extreme_emotion": 0,
-            #     "passionate": 0,
-            #     "atmosphere": 0,
-            #     "anticipation": 10,
-            #     "dissatisfaction": 0,
-            #     "confidence": 14
-            # },
-            # {
-            #     "starttime": 2100,
-            #     "endtime": 3000,
-            #     "energy": 2,
-            #     "content": 0,
-            #     "upset": 0,
-            #     "aggression": 0,
-            #     "stress": 20,
-            #     "uncertainty": 15,
-            #     "excitement": 14,
-            #     "concentration": 10,
-            #     "emo_cog": 22,
-            #     "hesitation": 6,
-            #     "brain_power": 27,
-            #     "embarrassment": 0,
-            #     "intensive_thinking": 32,
-            #     "imagination_activity": 5,
-            #     "extreme_emotion": 1,
-            #     "passionate": 0,
-            #     "atmosphere": -1,
-            #     "anticipation": 8,
-            #     "dissatisfaction": 0,
-            #     "confidence": 16
-            # }
-        ]
-    }
+def _insert_sentiment_rows(rows: list) -> None:
+    res = supabase.table("sentiment_averages").insert(rows).execute()
+    print("Supabaseへの登録結果:", len(res.data or []), "件")
+
+# sentiment_averages への登録を、ジャーナルに書いてからまとめて後で送るバッファ
+sentiment_writer = WriteBehindWriter(_insert_sentiment_rows, name="感情分析の保存")
+# 感情分析の結果の集計・保存（ジャーナルへの fsync を含む）を AmiVoice のイベントループから外して行うスレッド。
+# 1本にして、発話の順に保存する
+sentiment_save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sentiment-save")
 
-#音声認識を保存する
+# ユーザーごとの気分（感情分析の指標を時間で減衰させて平均したもの）。解釈文はここから作る
+emotion_state = EmotionStateModel()
 
-def process_sentiment_and_save(file_path: str, recognized_text: str) -> None:
+# AmiVoice の感情分析クライアント（AMIVOICE_APP_KEY が未設定ならダミーの空結果を返す）
+amivoice_client = AmiVoiceClient()
+
+def analyze_sentiment(wav_data: bytes) -> dict:
+    """
+    音声データ (wav_data: WAV形式のバイト列) を AmiVoice の非同期APIで感情分析し、
+    {"segments": [...]} を返す関数です。ジョブの状態確認は最初は短い間隔で行います。
+    AMIVOICE_APP_KEY が設定されていない、または失敗した場合は空のセグメントを返します。
     """
-    指定された音声ファイル（file_path）に対して感情分析を実施し、
-    セグメントごとに各指標の平均値を計算した上で、認識結果の全文（recognized_text）とともに
-    Supabase の sentiment_averages テーブルに保存します。
+    if not amivoice_client.enabled:
+        return {"segments": []}
+    try:
+        result = amivoice_client.recognize_sync(wav_data)
+    except AmiVoiceError as e:
+        print("感情分析に失敗しました:", e)
+        return {"segments": []}
+    return {"segments": sentiment_segments(result)}
+
+
+def aggregate_sentiment(segments: list) -> dict:
     """
-    # ダミーの感情分析結果を取得
-    sentiment_result = analyze_sentiment(file_path)
+    感情分析のセグメントから各指標の平均値（セグメントの長さで重み付け）を計算する。
+    最大値・90パーセンタイル・傾向も同時に計算してログに出す（sentiment.py 参照）。
+    """
+    summary = summarize_segments(segments)
+    averages = summary.averages()
+    print("感情分析の平均値:", averages)
+    print(f"感情分析の集計: {summary}", {key: {name: round(value, 1) for name, value in stats.items()}
+                                       for key, stats in summary.as_dict().items()})
+    return averages
+
+def analyze_and_aggregate_sentiment(audio: AudioBuffer) -> dict:
+    """
+    録音した音声（AudioBuffer）に対して感情分析を実施し、各指標の平均値を返す。
+    セグメントがなければ空の辞書を返す。
+    """
+    sentiment_result = analyze_sentiment(audio.wav_bytes())
     segments = sentiment_result.get("segments", [])
-    
     if not segments:
         print("感情分析のセグメントが見つかりませんでした。")
-        return
-
-    sums = {}
-    counts = {}
-    for seg in segments:
-        for key, value in seg.items():
-            if key in ("starttime", "endtime"):
-                continue
-            if isinstance(value, (int, float)):
-                sums[key] = sums.get(key, 0) + value
-                counts[key] = counts.get(key, 0) + 1
-
-    averages = { key: sums[key] / counts[key] for key in sums }
-    print("感情分析の平均値:", averages)
+        return {}
+    return aggregate_sentiment(segments)
 
+def save_sentiment_record(recognized_text: str, averages: dict) -> dict:
+    """
+    認識結果の全文（recognized_text）と感情分析の平均値を
+    Supabase の sentiment_averages テーブルに保存し、保存したレコードを返す。
+    （読み直しをしなくて済むよう、平均値もレコードに含めて返す。送信は後からまとめて行う）
+    """
     # Supabase に挿入するデータを作成（talk カラムに認識結果全文を保存）
     data = {
         "user_id": CURRENT_USER_ID,
@@ -403,13 +370,90 @@ def process_sentiment_and_save(file_path: str, recognized_text: str) -> None:
         # "confidence": averages.get("confidence")
     }
     
-    emotions = supabase.table("sentiment_averages").insert(data).execute()
-    print("Supabaseへの登録結果:", emotions)
+    # 登録は sentiment_writer がまとめて後から行う（ここではジャーナルに書いてすぐに返る）
+    row = sentiment_writer.write(data)
+    return {**averages, **row}
+
+def process_sentiment_and_save(audio: AudioBuffer, recognized_text: str) -> dict:
+    """
+    録音した音声（AudioBuffer）に対して感情分析を実施し、
+    各指標の平均値を認識結果の全文（recognized_text）とともに保存して、そのレコードを返す。
+    """
+    averages = analyze_and_aggregate_sentiment(audio)
+    if not averages:
+        return {}
+    return save_sentiment_record(recognized_text, averages)
+
+
+def submit_sentiment(audio: AudioBuffer) -> Optional[Future]:
+    """
+    録音した音声（AudioBuffer）の感情分析ジョブを AmiVoice に投げてすぐに戻る。
+    返り値はレスポンスが入る Future（AMIVOICE_APP_KEY が未設定なら None）。
+    """
+    if not amivoice_client.enabled:
+        return None
+    return amivoice_client.submit(audio.wav_bytes())
+
+
+def save_sentiment_when_done(job: Optional[Future], recognized_text: str, utterance: Utterance = None) -> Future:
+    """
+    感情分析のジョブ（submit_sentiment の返り値）が終わったら、平均値を計算して
+    認識結果の全文とともに保存し、気分（emotion_state）を更新する。
+    返り値の Future には保存したレコード（なければ空の辞書）が入る。
+    utterance を渡すと、その sentiment・record と処理時間（sentiment）も埋める。
+    """
+    saved = Future()
+    if job is None:
+        saved.set_result({})
+        return saved
+    start = time.perf_counter()
+
+    def _save(done: Future):
+        try:
+            try:
+                response = done.result()
+            except AmiVoiceError as e:
+                print("感情分析に失敗しました:", e)
+                saved.set_result({})
+                return
+            segments = sentiment_segments(response)
+            averages = aggregate_sentiment(segments) if segments else {}
+            record = {}
+            if averages:
+                record = save_sentiment_record(recognized_text, averages)
+                emotion_state.update(CURRENT_USER_ID, averages)
+            if utterance is not None:
+                utterance.sentiment = averages
+                utterance.record = record
+                utterance.latencies["sentiment"] = time.perf_counter() - start
+            saved.set_result(record)
+        except Exception as e:
+            print("感情分析の保存に失敗しました:", e)
+            saved.set_exception(e)
+
+    # 完了時のコールバックは AmiVoice のイベントループのスレッドで呼ばれるので、保存は別スレッドに渡す
+    job.add_done_callback(lambda done: sentiment_save_executor.submit(_save, done))
+    return saved
+
+
+def process_sentiment_and_save_async(audio: AudioBuffer, recognized_text: str) -> Future:
+    """
+    感情分析のジョブを投げてすぐに戻り、結果が届いたら process_sentiment_and_save と同じく
+    平均値を計算して保存する関数。返り値の Future には保存したレコード（なければ空の辞書）が入る。
+    複数の発話のジョブは AmiVoice クライアントのイベントループ上で並行して処理される。
+    """
+    return save_sentiment_when_done(submit_sentiment(audio), recognized_text)
+
 
 def get_latest_sentiment_data(user_id: str) -> dict:
     """
-    現在のユーザー(user_id)の最新の感情分析レコードを Supabase から取得する。
+    現在のユーザー(user_id)の最新の感情分析レコードを取得する。
+    このプロセスで書いたレコードがあればそれを返し（まだ送信していなくてもよい）、
+    なければ Supabase から取得する。
     """
+    latest = sentiment_writer.latest(user_id)
+    if latest is not None:
+        return latest
     res = supabase.table("sentiment_averages") \
                     .select("*") \
                     .eq("user_id", user_id) \
@@ -422,9 +466,16 @@ def get_latest_sentiment_data(user_id: str) -> dict:
     else:
         return {}
 
+def get_current_emotions(user_id: str) -> dict:
+    """
+    ユーザー(user_id)の今の気分を返す。プロセス内の emotion_state にあればそれを使い
+    （Supabase への問い合わせなし）、なければ最新の感情分析レコードを取得する。
+    """
+    return emotion_state.record(user_id) or get_latest_sentiment_data(user_id)
+
 def generate_ai_emotions_from_record(record: dict) -> str:
     """
-    Supabase に保存された感情分析結果レコード (record) をもとに、
+    感情分析結果のレコード (record。emotion_state.record() の今の気分か、Supabase のレコード) をもとに、
     エネルギー、ストレス、感情/バランス/論理の数値と解釈、さらに
     全体のポジティブ・ネガティブ集計結果を含む文章を生成します。
     """
@@ -486,78 +537,128 @@ def generate_ai_emotions_from_record(record: dict) -> str:
     )
     return emotions
 
-# #google speech to textを利用したもの
-def recognize_speech(timeout_seconds=120) -> str:
+def classify_emotion_from_buffer(audio: AudioBuffer) -> str:
     """
-    マイクから音声を取得し、日本語で認識して文字列を返す。
-    timeout_seconds: 録音の上限秒数
+    録音した音声（AudioBuffer）に対して感情分類を実施する関数。
+    読み込み済みのモデルでメモリ上のサンプルをそのまま分類する（一時ファイルは使わない）。
     """
-    print(f"音声入力を待機しています... 最大{timeout_seconds}秒")
-    recognizer = sr.Recognizer()
-    text = ""           # ここで初期化する
-    ai_emotions = "none"
-    emotion_label = "none"
-
-    with sr.Microphone() as source:
-        recognizer.adjust_for_ambient_noise(source)
-        try:
-            audio = recognizer.listen(source, timeout=timeout_seconds, phrase_time_limit=timeout_seconds)
-        except sr.WaitTimeoutError:
-            print("指定時間内に音声が入力されませんでした。")
-            return {"text": text, "ai_emotions": ai_emotions,"emotion_label": None}
-        
-    # speech_recognitionのAudioDataオブジェクトからWAVデータを取得し、一時的なWAVファイルに保存
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
-        temp_wav = fp.name
-        fp.write(audio.get_wav_data())
-
-
     try:
-        text = recognizer.recognize_google(audio, language="ja-JP")
-        # import amivoice  # amivoiceライブラリのインポート
-        # client = amivoice.AmiVoiceClient(api_key="YOUR_API_KEY")
-        # 同期的に音声認識を実施（認識結果が返るまでブロックします）
-        # text = client.recognize(temp_wav)
-        print("認識結果:", text)
-
-        # 感情分析の結果処理と Supabase 登録を実施
-        process_sentiment_and_save(temp_wav, text)
-
-        # ここに pyAudioAnalysisの感情分類を追加
-        # emotion_label = classify_emotion(temp_wav)
-        # if emotion_label:
-        #     print("推定された感情:", emotion_label)
-        # else:
-        #     print("感情分類に失敗しました。")
+        return emotion_classifier.classify(audio)
+    except Exception as e:
+        print("分類中にエラーが発生しました:", e)
+        return None
 
-        # Supabaseに音声認識結果と感情分析結果を登録
-        process_sentiment_and_save(temp_wav, text)
+# 発話を1つ処理し終えるたびに呼ばれる関数（ベンチマークでの処理時間の収集などに使う）
+utterance_listeners = []
 
+def listen_utterance(timeout_seconds=120, gate=None, on_partial=None) -> Utterance:
+    """
+    マイクから発話を1回だけ切り出し、同じ音声バッファに対して
+    音声認識・感情分類を同時に実行して Utterance にまとめる。感情分析はジョブを投げるだけで待たず、
+    結果が届いたら保存して気分を更新する（utterance.sentiment_saved で完了を待てる）。
+    各段の処理時間は utterance.latencies に記録される。
+    gate: 切り出した AudioBuffer を受け取り、False なら以降の解析（クラウド呼び出し）を
+          行わずに空の Utterance を返す関数（ウェイクワード判定など）
+    on_partial: ストリーミング認識が有効なとき、発話中の途中結果のテキストを受け取る関数
+                （gate を渡した場合は、途中までの音声が gate を通ってから呼ぶ）
+    """
+    utterance = _listen_utterance(timeout_seconds, gate, on_partial)
+    for listener in utterance_listeners:
+        listener(utterance)
+    return utterance
 
-        # 最新の感情分析レコードを取得
-        record = get_latest_sentiment_data(CURRENT_USER_ID)
-        if record:
-            ai_emotions = generate_ai_emotions_from_record(record)
-            print("感情分析の情報:", ai_emotions)
+def _listen_utterance(timeout_seconds, gate, on_partial) -> Utterance:
+    print(f"音声入力を待機しています... 最大{timeout_seconds}秒")
+    utterance = Utterance()
+
+    # gate の判定は1つの発話につき1回だけ行い、途中結果と最終結果で使い回す
+    gate_result = [None if gate is not None else True]
+    gate_lock = threading.Lock()
+
+    def _judge(audio) -> bool:
+        with gate_lock:
+            if gate_result[0] is None:
+                gate_result[0] = bool(utterance.timed("wake_word", lambda: gate(audio)))
+            return gate_result[0]
+
+    transcriber = None
+    if on_partial is not None and ASR_STREAMING_ENABLED:
+        def _on_partial_text(text, audio):
+            # 呼びかけと確認できるまでは、途中結果を先の処理（LLMなど）に渡さない。
+            # ウェイクワードは発話の先頭 WAKE_WORD_SEARCH_SECONDS 秒で判定するので、そこまで届いてから1回だけ判定する
+            if gate_result[0] is None and audio.duration < WAKE_WORD_SEARCH_SECONDS:
+                return
+            if _judge(audio):
+                on_partial(text)
+
+        transcriber = PartialTranscriber(asr_backend, _on_partial_text)
+        utterance.partials = transcriber.partials
+
+    # 開きっぱなしの入力ストリームのリングバッファから発話を切り出す（前回の続きから読む）
+    try:
+        utterance.audio = utterance.timed(
+            "capture", lambda: capture_service.listen(
+                timeout=timeout_seconds, phrase_time_limit=timeout_seconds,
+                on_partial=transcriber.feed if transcriber else None, partial_interval=PARTIAL_INTERVAL_SECONDS,
+            )
+        )
+    except sr.WaitTimeoutError:
+        print("指定時間内に音声が入力されませんでした。")
+        return utterance
+    finally:
+        if transcriber is not None:
+            transcriber.close()
+
+    # 呼びかけでない発話は、音声認識・感情分析に渡さずにここで捨てる
+    # （途中結果で判定済みならその結果を使う）
+    if not _judge(utterance.audio):
+        return utterance
+
+    # 録音は16kHz・モノラル・int16の AudioBuffer のまま各段に渡す（WAVへの変換は必要な段が一度だけ行う）
+    audio = utterance.audio
+    archive_audio(audio)
+
+    # 感情分析は AmiVoice にジョブを投げるだけにして待たない（結果は届いたときに保存する）
+    sentiment_job = submit_sentiment(audio)
+    # 設定したASRバックエンド（Google / 常駐Whisper / ヘッジ）での認識と、感情分類を同時に行う
+    stages = {"asr": lambda: asr_backend.recognize(audio)}
+    if EMOTION_CLASSIFICATION_ENABLED:
+        stages["emotion"] = lambda: classify_emotion_from_buffer(audio)
+    results = utterance.run_stages(stages)
+
+    utterance.emotion_label = results.get("emotion")
+    if utterance.emotion_label:
+        print("推定された感情:", utterance.emotion_label)
+
+    asr_error = utterance.errors.get("asr")
+    if isinstance(asr_error, sr.UnknownValueError):
+        print("音声を認識できませんでした。")
+    elif isinstance(asr_error, sr.RequestError):
+        print("音声認識サービスに接続できませんでした。")
+    elif asr_error is not None:
+        print("音声認識中にエラーが発生しました:", asr_error)
+    elif "asr" in results:
+        utterance.asr = results["asr"]
+        utterance.text = utterance.asr.text
+        print("認識結果:", utterance.text)
+        # 感情分析の結果が届いたら、音声認識結果とともに1回だけ登録し、気分を更新する
+        utterance.sentiment_saved = save_sentiment_when_done(sentiment_job, utterance.text, utterance)
+        # 解釈文はそれまでの発話から更新された今の気分で作る（感情分析の完了は待たない）
+        # （プロセス内の気分がないか古ければ、get_current_emotions が最新の感情分析レコードを取得する）
+        mood = get_current_emotions(CURRENT_USER_ID)
+        if mood:
+            utterance.ai_emotions = generate_ai_emotions_from_record(mood)
+            print("感情分析の情報:", utterance.ai_emotions)
         else:
             print("感情分析レコードが取得できませんでした。")
-        # return {"text": text, "ai_emotions": ai_emotions},audio
-                # 結果を辞書で返す（感情ラベルを含む）
-        return {
-            "text": text,
-            "ai_emotions": ai_emotions,
-            "emotion_label": emotion_label
-        }
 
+    print("[発話] 処理時間:", utterance.latency_summary())
+    return utterance
 
-    except sr.UnknownValueError:
-        print("音声を認識できませんでした。")
-        return {"text": text, "ai_emotions": ai_emotions, "emotion_label": None}
-    except sr.RequestError:
-        print("音声認識サービスに接続できませんでした。")
-        return {"text": text, "ai_emotions": ai_emotions, "emotion_label": None}
-    finally:
-        # 作成した一時ファイルを削除
-        if os.path.exists(temp_wav):
-            os.remove(temp_wav)
-
+def recognize_speech(timeout_seconds=120) -> dict:
+    """
+    マイクから音声を取得し、日本語で認識して
+    {"text": 認識結果, "ai_emotions": 感情の解釈文, "emotion_label": 感情ラベル} を返す。
+    timeout_seconds: 録音の上限秒数
+    """
+    return listen_utterance(timeout_seconds).as_dict()
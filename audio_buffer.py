@@ -0,0 +1,128 @@
+# audio_buffer.py
+"""
+録音した音声を各処理で共有するための標準形式。
+
+以前は同じ音声を、WAVバイト列への変換 → 一時ファイル → sr.AudioFile での読み直し →
+pyAudioAnalysis での読み直し、と処理ごとに変換・リサンプリングしていた。
+AudioBuffer は 16kHz・モノラル・int16 に固定した NumPy 配列を持ち、
+変換は作るときの一度だけにする。スライスはコピーせずにビューを返し、
+各ライブラリ向けの形式（float32、AudioData、WAVバイト列）は必要になったときに一度だけ作って使い回す。
+"""
+import io
+import wave
+from typing import Optional, Union
+
+import numpy as np
+import speech_recognition as sr
+
+CANONICAL_SAMPLE_RATE = 16000
+CANONICAL_CHANNELS = 1
+CANONICAL_DTYPE = np.int16
+SAMPLE_WIDTH = 2
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """線形補間による簡易リサンプリング"""
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    duration = len(samples) / src_rate
+    dst_len = int(round(duration * dst_rate))
+    src_times = np.arange(len(samples)) / src_rate
+    dst_times = np.arange(dst_len) / dst_rate
+    return np.interp(dst_times, src_times, samples).astype(np.float32)
+
+
+class AudioBuffer:
+    """
+    16kHz・モノラル・int16 の音声。samples は読み取り専用として扱う（書き換えない）。
+    """
+
+    sample_rate = CANONICAL_SAMPLE_RATE
+    channels = CANONICAL_CHANNELS
+    dtype = CANONICAL_DTYPE
+
+    def __init__(self, samples: np.ndarray):
+        samples = np.asarray(samples)
+        if samples.dtype != CANONICAL_DTYPE or samples.ndim != 1:
+            raise ValueError("AudioBuffer には1次元の int16 配列を渡してください（変換は from_pcm で行う）")
+        self.samples = samples
+        self._float32: Optional[np.ndarray] = None
+        self._audio_data: Optional[sr.AudioData] = None
+        self._wav_bytes: Optional[bytes] = None
+
+    @classmethod
+    def from_pcm(cls, samples: np.ndarray, samplerate: int) -> "AudioBuffer":
+        """
+        任意のサンプルレート・チャンネル数（(サンプル数, チャンネル数) の2次元可）・型のPCMを一度だけ変換する。
+        float の場合は -1〜1 とみなす。
+        """
+        samples = np.asarray(samples)
+        is_float = np.issubdtype(samples.dtype, np.floating)
+        if samples.ndim == 2:
+            samples = samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1)
+        if samples.dtype == CANONICAL_DTYPE and samplerate == CANONICAL_SAMPLE_RATE:
+            return cls(samples)
+        samples = samples.astype(np.float32)
+        if is_float:
+            samples = samples * 32768.0
+        samples = resample(samples, samplerate, CANONICAL_SAMPLE_RATE)
+        return cls(np.clip(np.rint(samples), -32768, 32767).astype(CANONICAL_DTYPE))
+
+    @classmethod
+    def from_audio_data(cls, audio: sr.AudioData) -> "AudioBuffer":
+        raw = audio.get_raw_data(convert_rate=CANONICAL_SAMPLE_RATE, convert_width=SAMPLE_WIDTH)
+        return cls(np.frombuffer(raw, dtype=CANONICAL_DTYPE))
+
+    @classmethod
+    def from_file(cls, source: Union[str, bytes, io.BytesIO]) -> "AudioBuffer":
+        """WAVなどの音声ファイル（パス・バイト列・BytesIO）を一度だけデコードする"""
+        import soundfile as sf
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        data, rate = sf.read(source, dtype="int16", always_2d=True)
+        return cls.from_pcm(data, rate)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __getitem__(self, index: slice) -> "AudioBuffer":
+        """サンプル単位のスライス（コピーしない）"""
+        if not isinstance(index, slice):
+            raise TypeError("AudioBuffer はスライスでのみ切り出せます")
+        return AudioBuffer(self.samples[index])
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def slice_seconds(self, start: float, end: Optional[float] = None) -> "AudioBuffer":
+        """start 秒から end 秒までのビューを返す"""
+        stop = None if end is None else int(end * self.sample_rate)
+        return self[int(start * self.sample_rate):stop]
+
+    def to_float32(self) -> np.ndarray:
+        """-1〜1 の float32 配列（Whisper などの入力形式）"""
+        if self._float32 is None:
+            self._float32 = self.samples.astype(np.float32) / 32768.0
+        return self._float32
+
+    def to_audio_data(self) -> sr.AudioData:
+        """speech_recognition の AudioData（Google音声認識など）"""
+        if self._audio_data is None:
+            self._audio_data = sr.AudioData(self.samples.tobytes(), self.sample_rate, SAMPLE_WIDTH)
+        return self._audio_data
+
+    def wav_bytes(self) -> bytes:
+        """WAV形式のバイト列（感情分析APIへの送信や保存用）"""
+        if self._wav_bytes is None:
+            out = io.BytesIO()
+            with wave.open(out, "wb") as w:
+                w.setnchannels(self.channels)
+                w.setsampwidth(SAMPLE_WIDTH)
+                w.setframerate(self.sample_rate)
+                w.writeframes(self.samples.tobytes())
+            self._wav_bytes = out.getvalue()
+        return self._wav_bytes
+
+    def __repr__(self) -> str:
+        return f"AudioBuffer({self.duration:.2f}s, {self.sample_rate}Hz, mono, int16)"
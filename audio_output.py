@@ -0,0 +1,182 @@
+# audio_output.py
+"""
+常駐型の音声出力エンジン。
+
+読み上げのたびに mpg123 のプロセスを起動してデバイスを開くのではなく、
+sounddevice の出力ストリームを1本だけ開いたままにしておき、
+MP3/WAV/PCM をプロセス内でデコードしてそのストリームに流し込む。
+"""
+import io
+import time
+import threading
+from collections import deque
+from typing import Optional, Union
+
+import numpy as np
+import soundfile as sf
+
+from audio_buffer import resample
+
+# gTTSの出力(24kHz/モノラル)に合わせる
+OUTPUT_SAMPLE_RATE = 24000
+OUTPUT_BLOCK_SIZE = 512
+# 再生を待つ上限は、先に並んでいる音声と自分の長さにこの秒数を足したもの
+PLAYBACK_TIMEOUT_MARGIN = 2.0
+
+
+class _Clip:
+    """再生待ちの音声1件分（float32モノラル）"""
+
+    def __init__(self, samples: np.ndarray):
+        self.samples = samples
+        self.position = 0
+        self.done = threading.Event()
+        self.interrupted = False
+
+
+def decode_audio(source: Union[str, bytes, io.BytesIO]) -> tuple:
+    """
+    音声ファイル（パス・バイト列）をデコードし、(float32モノラル配列, サンプルレート) を返す。
+    libsndfile がMP3に対応していない環境では pydub(ffmpeg) で読み込む。
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        data, rate = sf.read(source, dtype="float32", always_2d=True)
+        return data.mean(axis=1), rate
+    except (RuntimeError, sf.LibsndfileError):
+        from pydub import AudioSegment
+        if isinstance(source, io.BytesIO):
+            source.seek(0)
+        segment = AudioSegment.from_file(source).set_channels(1)
+        samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+        return samples / float(1 << (8 * segment.sample_width - 1)), segment.frame_rate
+
+
+def default_output_stream(**kwargs):
+    """スピーカーの出力ストリーム。PortAudio のない環境（台本での再生など）でも読み込めるよう、ここで import する"""
+    import sounddevice as sd
+    return sd.OutputStream(**kwargs)
+
+
+class PlaybackEngine:
+    """
+    1本の出力ストリームを使い回して音声を順番に再生するエンジン。
+    play() で再生キューに追加し、stop() で再生中・再生待ちの音声を破棄、
+    flush() でキューが空になるまで待つ。timeline を渡すと、再生したブロックの時刻と音量を記録する。
+    """
+
+    def __init__(self, samplerate: int = OUTPUT_SAMPLE_RATE, blocksize: int = OUTPUT_BLOCK_SIZE, device=None,
+                 timeline=None, stream_factory=None):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.device = device
+        # 再生したブロックを記録する echo.PlaybackTimeline（入力側のエコー抑制に使う）
+        self.timeline = timeline
+        # 出力ストリームを作る関数（既定はスピーカー。replay.null_output_factory で差し替えられる）
+        self.stream_factory = stream_factory or default_output_stream
+        self._clips: deque = deque()
+        self._lock = threading.Lock()
+        self._stream = None
+
+    def start(self) -> None:
+        """出力ストリームを開く（既に開いていれば何もしない）"""
+        with self._lock:
+            if self._stream is not None:
+                return
+            self._stream = self.stream_factory(
+                samplerate=self.samplerate,
+                blocksize=self.blocksize,
+                channels=1,
+                dtype="float32",
+                device=self.device,
+                callback=self._callback,
+            )
+            self._stream.start()
+
+    def close(self) -> None:
+        """再生を止めて出力ストリームを閉じる"""
+        self.stop()
+        with self._lock:
+            if self._stream is not None:
+                self._stream.stop()
+                self._stream.close()
+                self._stream = None
+
+    def _callback(self, outdata, frames, time_info, status) -> None:
+        """オーディオスレッドから呼ばれ、再生キューの先頭から frames 分を書き込む"""
+        out = outdata[:, 0]
+        filled = 0
+        with self._lock:
+            while filled < frames and self._clips:
+                clip = self._clips[0]
+                n = min(frames - filled, len(clip.samples) - clip.position)
+                out[filled:filled + n] = clip.samples[clip.position:clip.position + n]
+                clip.position += n
+                filled += n
+                if clip.position >= len(clip.samples):
+                    self._clips.popleft()
+                    clip.done.set()
+        out[filled:] = 0
+        if filled and self.timeline is not None:
+            self.timeline.record(time.monotonic(), out[:filled], self.samplerate)
+
+    def play_pcm(self, samples: np.ndarray, samplerate: int, wait: bool = True) -> bool:
+        """
+        PCM(float32 または int16)を再生する。
+        wait=True なら再生が終わるまで待ち、最後まで再生できたかを返す。
+        """
+        if samples.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768.0
+        samples = resample(np.asarray(samples, dtype=np.float32).reshape(-1), samplerate, self.samplerate)
+        self.start()
+        clip = _Clip(samples)
+        with self._lock:
+            queued = sum(len(c.samples) - c.position for c in self._clips)
+            self._clips.append(clip)
+        if not wait:
+            return True
+        timeout = (queued + len(samples)) / self.samplerate + PLAYBACK_TIMEOUT_MARGIN
+        if not clip.done.wait(timeout):
+            # 出力ストリームが止まった・デバイスが外れたなど。待ち続けずに失敗として返す
+            print(f"[再生] {timeout:.1f}秒たっても再生が終わらないため中断します（出力ストリームを開き直します）")
+            self._reset_stream()
+            return False
+        return not clip.interrupted
+
+    def _reset_stream(self) -> None:
+        """再生待ちを破棄し、止まった出力ストリームを閉じる（次の再生で開き直す）"""
+        self.stop()
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.stop()
+                stream.close()
+            except Exception as e:
+                print("出力ストリームを閉じられませんでした:", e)
+
+    def play(self, source: Union[str, bytes, io.BytesIO], wait: bool = True) -> bool:
+        """音声ファイル（MP3/WAV のパスまたはバイト列）をデコードして再生する"""
+        samples, rate = decode_audio(source)
+        return self.play_pcm(samples, rate, wait=wait)
+
+    def stop(self) -> None:
+        """再生中・再生待ちの音声をすべて破棄する"""
+        with self._lock:
+            clips = list(self._clips)
+            self._clips.clear()
+        for clip in clips:
+            clip.interrupted = True
+            clip.done.set()
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """再生待ちの音声がすべて再生し終わるまで待つ"""
+        with self._lock:
+            clips = list(self._clips)
+        for clip in clips:
+            clip.done.wait(timeout)
+
+    def is_playing(self) -> bool:
+        with self._lock:
+            return bool(self._clips)
@@ -0,0 +1,138 @@
+# benchmarks/bench_flows.py
+"""
+会話フローのヘッドレスベンチマーク。
+
+マイクの代わりに台本（WAVと無音の並び、replay.py 参照）を流し、スピーカーの代わりに
+音声を捨てる（--record なら保存する）出力を使って、実機なしで
+- main: main.main_loop の繰り返し（待機 → 発話 → 意図判定 → 各機能）
+- insert_task: task_registration.insert_task
+- notify: notifications.notify_and_wait_for_completion
+を実行し、発話ごとの段別処理時間（capture / wake_word / asr / sentiment など）と
+音声合成・意図判定の投機の統計を表示する。
+Supabase / OpenAI / 音声認識のAPIは実際に呼ぶので、config.py と接続先は実行環境で用意すること。
+
+使い方:
+    python benchmarks/bench_flows.py bench_audio/chat.json --flow main
+    python benchmarks/bench_flows.py bench_audio/task.json --flow insert_task --speed 2
+    python benchmarks/bench_flows.py bench_audio/notify.json --flow notify --task-title 散歩 --record out.wav
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# 台本の後、フローが終わるのを待つ秒数
+GRACE_SECONDS = 10.0
+
+
+def run_flow(flow, stream, grace: float) -> bool:
+    """フローを別スレッドで実行し、終わるか、台本を流し終えて grace 秒たつまで待つ。終わったら True"""
+    done = threading.Event()
+
+    def _target():
+        try:
+            flow()
+        finally:
+            done.set()
+
+    threading.Thread(target=_target, name="bench-flow", daemon=True).start()
+    while not done.wait(0.2):
+        if stream.finished.is_set():
+            return done.wait(grace)
+    return True
+
+
+def summarize(utterances) -> None:
+    print("\n== 発話ごとの処理時間 ==")
+    stages = {}
+    for i, utterance in enumerate(utterances, 1):
+        print(f"{i:2d}: 「{utterance.text}」 {utterance.latency_summary()}")
+        for name, seconds in utterance.latencies.items():
+            stages.setdefault(name, []).append(seconds)
+    if not stages:
+        print("発話がありませんでした。")
+        return
+    print("\n== 段ごとの集計 ==")
+    for name, values in stages.items():
+        values = np.array(values) * 1000
+        print(f"{name:10s} 回数 {len(values):3d} 平均 {values.mean():7.0f}ms "
+              f"p90 {np.percentile(values, 90):7.0f}ms 最大 {values.max():7.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会話フローのヘッドレスベンチマーク")
+    parser.add_argument("script", help="台本のJSON")
+    parser.add_argument("--flow", choices=("main", "insert_task", "notify"), default="main")
+    parser.add_argument("--speed", type=float, default=1.0, help="台本の再生速度")
+    parser.add_argument("--record", help="読み上げた音声を保存するWAVのパス")
+    parser.add_argument("--task-id", default="bench-task")
+    parser.add_argument("--task-title", default="ベンチマーク")
+    parser.add_argument("--grace", type=float, default=GRACE_SECONDS)
+    args = parser.parse_args()
+
+    # audio.py を読み込む前に、入出力を台本と空の出力に差し替える
+    os.environ["RABBIT_AUDIO_SCRIPT"] = os.path.abspath(args.script)
+    os.environ["RABBIT_AUDIO_SINK"] = "record" if args.record else "null"
+    os.environ["RABBIT_AUDIO_SCRIPT_SPEED"] = str(args.speed)
+
+    import audio
+    utterances = []
+    audio.utterance_listeners.append(utterances.append)
+
+    audio.asr_backend.load()
+    audio.capture_service.start()
+    stream = audio.input_stream_factory.streams[0]
+    print(f"台本: {args.script} ({stream.duration:.1f}秒, {args.speed}倍速) / フロー: {args.flow}")
+
+    if args.flow == "main":
+        import main as app
+
+        def flow():
+            while not stream.finished.is_set():
+                app.main_loop_once()
+            app.main_loop_once()
+    elif args.flow == "insert_task":
+        from task_registration import insert_task as flow
+    else:
+        from notifications import notify_and_wait_for_completion
+
+        def flow():
+            notify_and_wait_for_completion({"id": args.task_id, "title": args.task_title,
+                                            "scheduled_time": time.strftime("%H:%M:%S")})
+
+    start = time.perf_counter()
+    completed = run_flow(flow, stream, args.grace)
+    elapsed = time.perf_counter() - start
+    # 読み上げ待ちの音声と、結果待ちの感情分析が残っていれば終わるまで待つ
+    audio.playback_engine.flush(timeout=args.grace)
+    for utterance in utterances:
+        if utterance.sentiment_saved is not None:
+            try:
+                utterance.sentiment_saved.result(timeout=args.grace)
+            except Exception:
+                pass
+
+    summarize(utterances)
+    print("\n== 全体 ==")
+    print(f"フロー{'完了' if completed else '未完了（台本の終了後もフローが続いていたため打ち切り）'}: "
+          f"{elapsed:.1f}秒（台本 {stream.duration / args.speed:.1f}秒）")
+    print("音声合成:", audio.tts_selector.stats())
+    if args.flow == "main":
+        print("意図判定の投機:", app.speculative_intent.stats())
+        print("待機:", app.idle_monitor.stats())
+    sink = audio.output_stream_factory.streams[0] if audio.output_stream_factory.streams else None
+    if sink is not None:
+        print(f"読み上げ時間: {sink.played_seconds:.1f}秒")
+        if args.record:
+            sink.save(args.record)
+            print("読み上げた音声を保存しました:", args.record)
+
+
+if __name__ == "__main__":
+    main()
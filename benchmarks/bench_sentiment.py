@@ -0,0 +1,91 @@
+# benchmarks/bench_sentiment.py
+"""
+感情分析セグメントの集計のベンチマーク。
+
+data.json（実際の AmiVoice のレスポンス）のセグメントを、長い会話を想定して
+指定の数まで時刻をずらして繰り返し、
+- 以前の辞書のループによる単純平均（aggregate_segments_loop）
+- 行列にまとめた重み付き集計（summarize_segments: 平均・最大値・パーセンタイル・傾向）
+の1回あたりの処理時間を比べる。あわせて、単純平均と重み付き平均の差が大きい指標を表示する。
+
+使い方:
+    python benchmarks/bench_sentiment.py
+    python benchmarks/bench_sentiment.py --segments 12 100 500 2000 --repeat 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from sentiment import summarize_segments, aggregate_segments_loop  # noqa: E402
+
+SAMPLE_RESPONSE = os.path.join(BASE_DIR, "data.json")
+
+
+def load_segments(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["sentiment_analysis"]["segments"]
+
+
+def make_session(base: list, count: int, seed: int = 0) -> list:
+    """base のセグメントを count 個になるまで、時刻をずらし値を少し揺らして並べる"""
+    rng = np.random.default_rng(seed)
+    span = max(seg["endtime"] for seg in base)
+    segments = []
+    for i in range(count):
+        seg = dict(base[i % len(base)])
+        offset = (i // len(base)) * span
+        seg["starttime"] += offset
+        seg["endtime"] += offset
+        for key, value in seg.items():
+            if key not in ("starttime", "endtime"):
+                seg[key] = max(0, int(value + rng.integers(-3, 4)))
+        segments.append(seg)
+    return segments
+
+
+def time_per_call(fn, segments: list, repeat: int) -> float:
+    fn(segments)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(segments)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="感情分析セグメントの集計のベンチマーク")
+    parser.add_argument("--data", default=SAMPLE_RESPONSE)
+    parser.add_argument("--segments", type=int, nargs="+", default=[12, 100, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    base = load_segments(args.data)
+    print(f"{args.data}: {len(base)}セグメント")
+    print(f"{'セグメント数':>8s} {'ループ(平均のみ)':>16s} {'行列(4種の集計)':>16s} {'比':>6s}")
+    for count in args.segments:
+        segments = make_session(base, count)
+        loop = time_per_call(aggregate_segments_loop, segments, args.repeat)
+        matrix = time_per_call(summarize_segments, segments, args.repeat)
+        print(f"{count:12d} {loop * 1e6:14.0f}us {matrix * 1e6:14.0f}us {loop / matrix:6.2f}")
+
+    summary = summarize_segments(base)
+    plain = aggregate_segments_loop(base)
+    weighted = summary.averages()
+    print(f"\n{summary}")
+    print("単純平均と重み付き平均の差が大きい指標:")
+    diffs = sorted(weighted, key=lambda key: abs(weighted[key] - plain[key]), reverse=True)[:5]
+    stats = summary.as_dict()
+    for key in diffs:
+        s = stats[key]
+        print(f"  {key:22s} 単純 {plain[key]:6.1f} 重み付き {weighted[key]:6.1f} "
+              f"最大 {s['max']:5.0f} p{summary.q:g} {s[f'p{summary.q:g}']:5.0f} 傾向 {s['trend']:+7.1f}/分")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_vad.py
+"""
+VAD終端検出のベンチマーク。
+
+録音済みWAVを30msフレームで VADEndpointer に流し、積極度ごとに
+- 検出した発話区間
+- 話し終わり（エネルギーが最後にしきい値を超えたフレームの末尾）から終了イベントまでの遅れ
+- 1フレームあたりの処理時間とリアルタイム比
+を表示する。比較として、speech_recognition の pause_threshold による待ち時間も表示する。
+
+使い方:
+    python benchmarks/bench_vad.py                     # temp_recording.wav を使う
+    python benchmarks/bench_vad.py a.wav b.wav --trailing-silence 1.0
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from vad import VADEndpointer, AGGRESSIVENESS_PRESETS, SPEECH_START, SPEECH_END, frame_energy  # noqa: E402
+from noise_floor import NoiseFloorEstimator  # noqa: E402
+from audio_buffer import AudioBuffer  # noqa: E402
+
+SAMPLE_RATE = AudioBuffer.sample_rate
+FRAME_MS = 30
+# 比較対象: speech_recognition の既定値と old/otamshi.py で使っていた値
+LEGACY_PAUSE_THRESHOLDS = (0.8, 2.0)
+
+
+def load_wav(path: str) -> np.ndarray:
+    """音声ファイルを読み、16kHzモノラルの int16 配列にする（変換は AudioBuffer に任せる）"""
+    return AudioBuffer.from_file(path).samples
+
+
+def bench_file(path: str, trailing_silence: float) -> None:
+    samples = load_wav(path)
+    frame_size = SAMPLE_RATE * FRAME_MS // 1000
+    # 話し終わり後の挙動を測るため、末尾に無音（元音声の最小フレーム程度の雑音）を足す
+    noise = np.random.default_rng(0).normal(0, 1, int(trailing_silence * SAMPLE_RATE))
+    frames = [samples[i:i + frame_size] for i in range(0, len(samples) - frame_size + 1, frame_size)]
+    quiet = min(frame_energy(f) for f in frames) if frames else 0.0
+    tail = (noise * quiet).astype(np.int16)
+    samples = np.concatenate([samples, tail])
+    frames = [samples[i:i + frame_size] for i in range(0, len(samples) - frame_size + 1, frame_size)]
+
+    estimator = NoiseFloorEstimator(path=None)
+    threshold = estimator.calibrate(frame_energy(f) for f in frames)
+    duration = len(samples) / SAMPLE_RATE
+    print(f"\n== {os.path.basename(path)} ({duration:.2f}秒, しきい値 {threshold:.0f}) ==")
+
+    for aggressiveness in sorted(AGGRESSIVENESS_PRESETS):
+        endpointer = VADEndpointer(frame_size, SAMPLE_RATE, aggressiveness=aggressiveness)
+        segments = []
+        start = None
+        last_loud_end = None
+        delays = []
+        t0 = time.perf_counter()
+        for i, frame in enumerate(frames):
+            position = i * frame_size
+            if endpointer.in_speech and endpointer.is_speech_frame(frame, threshold):
+                last_loud_end = position + frame_size
+            event = endpointer.process(frame, position, threshold)
+            if event is None:
+                continue
+            if event[0] == SPEECH_START:
+                start = event[1]
+                last_loud_end = position + frame_size
+            elif event[0] == SPEECH_END:
+                segments.append((start, event[1]))
+                # 終了イベントを出したフレームの末尾 - 話し終わり
+                delays.append((position + frame_size - last_loud_end) / SAMPLE_RATE)
+        elapsed = time.perf_counter() - t0
+        per_frame_us = elapsed / max(1, len(frames)) * 1e6
+        rtf = elapsed / duration
+        spans = ", ".join(f"{s / SAMPLE_RATE:.2f}-{e / SAMPLE_RATE:.2f}s" for s, e in segments) or "なし"
+        delay = f"{np.mean(delays) * 1000:.0f}ms" if delays else "-"
+        print(f"積極度{aggressiveness}: 区間 [{spans}] 終端遅れ 平均{delay} "
+              f"処理 {per_frame_us:.1f}µs/フレーム RTF {rtf:.4f}")
+
+    for pause in LEGACY_PAUSE_THRESHOLDS:
+        print(f"参考: pause_threshold={pause}秒 の場合の終端遅れ 約{pause * 1000:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VAD終端検出のベンチマーク")
+    parser.add_argument("wavs", nargs="*", default=[os.path.join(BASE_DIR, "temp_recording.wav")])
+    parser.add_argument("--trailing-silence", type=float, default=1.0, help="末尾に足す無音の秒数")
+    args = parser.parse_args()
+    for path in args.wavs:
+        bench_file(path, args.trailing_silence)
+
+
+if __name__ == "__main__":
+    main()
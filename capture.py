@@ -0,0 +1,346 @@
+# capture.py
+"""
+常時録音のキャプチャサービス。
+
+マイクの入力ストリームを1本だけ開いたままにし、オーディオスレッドから
+リングバッファへ書き込み続ける。発話の切り出しはリングバッファから読むだけなので、
+recognize_speech を続けて呼んでもデバイスを開き直すことはなく、
+呼び出しの合間に話された音声も失われない。
+"""
+import time
+import threading
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+import speech_recognition as sr
+
+from audio_buffer import AudioBuffer
+from noise_floor import NoiseFloorEstimator
+from vad import VADEndpointer, SPEECH_START, SPEECH_END, frame_energy
+
+CAPTURE_SAMPLE_RATE = AudioBuffer.sample_rate
+CAPTURE_FRAME_MS = 30
+CAPTURE_RING_SECONDS = 60
+
+# 発話区間の判定
+CALIBRATION_SECONDS = 1.0
+DEFAULT_PRE_ROLL_SECONDS = 0.3
+# ノイズフロアの追従処理を起こす間隔（秒）
+NOISE_ADAPT_INTERVAL = 1.0
+# 読み上げ中、しきい値を超える（回り込みでない）フレームがこの長さ続いたら話し始めたとみなす（ミリ秒）
+BARGE_IN_SUSTAIN_MS = 180
+# 読み上げていないときに、読み上げが始まったかを確かめる間隔（秒）
+BARGE_IN_IDLE_INTERVAL = 0.1
+# 割り込んだ後、次に見張りを始めるまでの間隔（秒）
+BARGE_IN_COOLDOWN = 0.5
+
+
+def default_input_stream(**kwargs):
+    """マイクの入力ストリーム。PortAudio のない環境（台本での再生など）でも読み込めるよう、ここで import する"""
+    import sounddevice as sd
+    return sd.InputStream(**kwargs)
+
+
+class RingBuffer:
+    """
+    int16 の音声サンプルを保持するリングバッファ（書き込み1スレッド・読み出し1スレッド用）。
+    位置は録音開始からの通しのサンプル番号で表す。書き込み側はデータをコピーしてから
+    書き込み位置を進めるだけなので、ロックを取らない。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = np.zeros(capacity, dtype=np.int16)
+        self._write_pos = 0
+        self._data_ready = threading.Event()
+
+    @property
+    def write_position(self) -> int:
+        return self._write_pos
+
+    @property
+    def oldest_position(self) -> int:
+        """まだ上書きされていない最も古いサンプルの位置"""
+        return max(0, self._write_pos - self.capacity)
+
+    def write(self, samples: np.ndarray) -> None:
+        n = len(samples)
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            self._write_pos += n - self.capacity
+            n = self.capacity
+        start = self._write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        self._buf[:n - first] = samples[first:]
+        # コピーが終わってから位置を公開する
+        self._write_pos += n
+        self._data_ready.set()
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """[start, end) のサンプルをコピーして返す（上書き済みの部分は切り詰める）"""
+        start = max(start, self.oldest_position)
+        end = min(end, self._write_pos)
+        if end <= start:
+            return np.zeros(0, dtype=np.int16)
+        i = start % self.capacity
+        j = i + (end - start)
+        if j <= self.capacity:
+            return self._buf[i:j].copy()
+        return np.concatenate((self._buf[i:], self._buf[:j - self.capacity]))
+
+    def wait_for(self, position: int, timeout: float) -> bool:
+        """書き込み位置が position に達するまで待つ"""
+        deadline = time.monotonic() + timeout
+        while self._write_pos < position:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._data_ready.clear()
+            if self._write_pos >= position:
+                break
+            self._data_ready.wait(remaining)
+        return True
+
+
+class CaptureService:
+    """
+    マイク入力を常時リングバッファに溜め、listen() で発話を1つずつ切り出すサービス。
+    読み出し位置(cursor)は listen() をまたいで引き継がれる。
+    発話判定のしきい値は起動時に一度だけ調整し、その後はバックグラウンドで雑音に追従させる。
+    """
+
+    def __init__(self, samplerate: int = CAPTURE_SAMPLE_RATE, frame_ms: int = CAPTURE_FRAME_MS,
+                 ring_seconds: int = CAPTURE_RING_SECONDS, device=None, echo_gate=None, stream_factory=None,
+                 noise_floor: Optional[NoiseFloorEstimator] = None):
+        self.samplerate = samplerate
+        self.frame_size = samplerate * frame_ms // 1000
+        self.device = device
+        self.ring = RingBuffer(samplerate * ring_seconds)
+        # 自分の読み上げの回り込みを抑制する echo.EchoGate（None なら抑制しない）
+        self.echo_gate = echo_gate
+        # 入力ストリームを作る関数（既定はマイク。replay.scripted_input_factory で台本の音声に差し替えられる）
+        self.stream_factory = stream_factory or default_input_stream
+        # 最後に書き込んだ位置とその時刻（サンプル位置を時刻に直すのに使う）
+        self._clock_anchor = (0, time.monotonic())
+        self.noise_floor = noise_floor or NoiseFloorEstimator()
+        self.cursor = 0
+        self.overflows = 0
+        self.barge_ins = 0
+        self._barge_in: Optional[Tuple[Callable[[], bool], Callable[[], None]]] = None
+        self._stream = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """入力ストリームを開く（既に開いていれば何もしない）"""
+        with self._lock:
+            if self._stream is not None:
+                return
+            self._stream = self.stream_factory(
+                samplerate=self.samplerate,
+                blocksize=self.frame_size,
+                channels=1,
+                dtype="int16",
+                device=self.device,
+                callback=self._callback,
+            )
+            self._stream.start()
+            self.cursor = self.ring.write_position
+        if not self.noise_floor.is_calibrated:
+            self.calibrate()
+        threading.Thread(target=self._adapt_noise_floor, name="noise-floor", daemon=True).start()
+        if self._barge_in is not None:
+            threading.Thread(target=self._watch_barge_in, name="barge-in", daemon=True).start()
+
+    def watch_barge_in(self, is_speaking: Callable[[], bool], on_barge_in: Callable[[], None]) -> None:
+        """
+        読み上げ中（is_speaking() が True の間）にユーザーが話し始めたら on_barge_in() を呼ぶ。
+        自分の読み上げの回り込みは echo_gate で除く（二重発話と判定されたフレームは話し始めとして数える）。
+        start() の前に呼ぶこと。
+        """
+        self._barge_in = (is_speaking, on_barge_in)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._stream is not None:
+                self._stream.stop()
+                self._stream.close()
+                self._stream = None
+
+    def _callback(self, indata, frames, time_info, status) -> None:
+        """オーディオスレッドから呼ばれる。リングバッファに書き込むだけにする"""
+        if status:
+            self.overflows += 1
+        self.ring.write(indata[:, 0])
+        self._clock_anchor = (self.ring.write_position, time.monotonic())
+
+    @property
+    def energy_threshold(self) -> float:
+        return self.noise_floor.threshold
+
+    def calibrate(self, seconds: float = CALIBRATION_SECONDS) -> float:
+        """今から seconds 秒の音声でノイズフロアを調整する（起動時に一度だけ呼ばれる）"""
+        start = self.ring.write_position
+        energies = []
+        for position, frame in self.frames(start, timeout=seconds + 1.0):
+            energies.append(frame_energy(frame))
+            if position + len(frame) - start >= self.seconds_to_samples(seconds):
+                break
+        return self.noise_floor.calibrate(energies)
+
+    def _adapt_noise_floor(self) -> None:
+        """
+        バックグラウンドで全フレームのエネルギーをノイズフロア推定に流し続ける（発話中のフレームは印を付ける）。
+        フレームが届くたびに起きるのではなく、NOISE_ADAPT_INTERVAL 秒ごとに溜まった分をまとめて処理する。
+        保存済みのノイズフロアで始めた場合は、最初に届いた分で値を確かめる。
+        """
+        position = self.ring.write_position
+        endpointer = VADEndpointer(self.frame_size, self.samplerate)
+        while self._stream is not None:
+            time.sleep(NOISE_ADAPT_INTERVAL)
+            position = max(position, self.ring.oldest_position)
+            n_frames = (self.ring.write_position - position) // self.frame_size
+            if n_frames == 0:
+                continue
+            end = position + n_frames * self.frame_size
+            samples = self.ring.read(position, end).reshape(n_frames, self.frame_size)
+            energies = np.sqrt(np.mean(samples.astype(np.float32) ** 2, axis=1))
+            if self.noise_floor.needs_verify:
+                self.noise_floor.verify(energies)
+            for i, energy in enumerate(energies):
+                frame_position = position + i * self.frame_size
+                # 読み上げの回り込みは雑音として学習しない
+                if self.is_echo(frame_position, self.frame_size, float(energy), learn=False):
+                    continue
+                endpointer.process(samples[i], frame_position, self.energy_threshold)
+                self.noise_floor.update(float(energy), is_speech=endpointer.in_speech)
+            position = end
+
+    def _watch_barge_in(self, sustain_ms: int = BARGE_IN_SUSTAIN_MS) -> None:
+        """読み上げ中だけフレームごとに起き、しきい値を超える回り込みでない音声が続いたら割り込む"""
+        is_speaking, on_barge_in = self._barge_in
+        sustain = max(1, sustain_ms * self.samplerate // 1000 // self.frame_size)
+        while self._stream is not None:
+            # 読み上げていない間は、フレームごとに起きずに間隔を空けて確かめる
+            if not is_speaking():
+                time.sleep(BARGE_IN_IDLE_INTERVAL)
+                continue
+            run = 0
+            for position, frame in self.frames(self.ring.write_position, timeout=1.0):
+                if not is_speaking():
+                    break
+                energy = frame_energy(frame)
+                if energy > self.energy_threshold and not self.is_echo(position, len(frame), energy, learn=False):
+                    run += 1
+                else:
+                    run = 0
+                if run >= sustain:
+                    self.barge_ins += 1
+                    print("[割り込み] 読み上げ中に話し始めたため、読み上げを止めます")
+                    on_barge_in()
+                    # 止めた読み上げの残りの回り込みを数えないよう、少し空けてから見張りを再開する
+                    time.sleep(BARGE_IN_COOLDOWN)
+                    break
+
+    def position_to_time(self, position: int) -> float:
+        """サンプル位置を、そのサンプルが録音された時刻（time.monotonic()）に直す"""
+        anchor_position, anchor_time = self._clock_anchor
+        return anchor_time - (anchor_position - position) / self.samplerate
+
+    def is_echo(self, position: int, n_samples: int, energy: float, learn: bool = True) -> bool:
+        """位置 position からの n_samples サンプル（RMS が energy）が自分の読み上げの回り込みか"""
+        if self.echo_gate is None:
+            return False
+        start_time = self.position_to_time(position)
+        return self.echo_gate.is_echo(energy, start_time, start_time + n_samples / self.samplerate, learn=learn)
+
+    def seconds_to_samples(self, seconds: float) -> int:
+        return int(seconds * self.samplerate)
+
+    def skip_to_now(self) -> None:
+        """溜まっている音声を読み飛ばし、次の listen() をこれから入る音声から始める"""
+        self.cursor = self.ring.write_position
+
+    def frames(self, start: int, timeout: float) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        位置 start からフレーム単位で (位置, サンプル) を順に返す。
+        新しい音声が timeout 秒届かなければ終了する。
+        """
+        position = max(start, self.ring.oldest_position)
+        while True:
+            if not self.ring.wait_for(position + self.frame_size, timeout):
+                return
+            # リングバッファを一周以上追い越された場合は、残っている最古の位置から読む
+            position = max(position, self.ring.oldest_position)
+            yield position, self.ring.read(position, position + self.frame_size)
+            position += self.frame_size
+
+    def _read_without_echo(self, start: int, end: int, echo_positions) -> np.ndarray:
+        """[start, end) を読み、抑制したフレームを無音にして返す"""
+        samples = self.ring.read(start, end)
+        for position in echo_positions:
+            if start <= position < end:
+                samples[position - start:position - start + self.frame_size] = 0
+        return samples
+
+    def listen(self, timeout: Optional[float] = None, phrase_time_limit: Optional[float] = None,
+               pause_seconds: Optional[float] = None,
+               on_partial: Optional[Callable[[AudioBuffer], None]] = None,
+               partial_interval: float = 0.8) -> AudioBuffer:
+        """
+        リングバッファから発話を1つ切り出し、AudioBuffer（16kHz・モノラル・int16）として返す。
+        発話の終わりはVADで判定する（pause_seconds を指定するとハングオーバー時間を上書きする）。
+        timeout 秒以内に話し始めなければ sr.WaitTimeoutError を送出する。
+        on_partial を渡すと、発話中 partial_interval 秒ごとに、それまでの音声を AudioBuffer で渡す
+        （すぐに戻る関数を渡すこと）。
+        """
+        self.start()
+        start = max(self.cursor, self.ring.oldest_position)
+        timeout_samples = self.seconds_to_samples(timeout) if timeout else None
+        limit_samples = self.seconds_to_samples(phrase_time_limit) if phrase_time_limit else None
+        pre_roll = self.seconds_to_samples(DEFAULT_PRE_ROLL_SECONDS)
+        hangover_ms = None if pause_seconds is None else int(pause_seconds * 1000)
+        endpointer = VADEndpointer(self.frame_size, self.samplerate, hangover_ms=hangover_ms)
+
+        speech_start = None
+        speech_end = None
+        end = start
+        partial_samples = self.seconds_to_samples(partial_interval)
+        last_partial = None
+        # 自分の読み上げと重なって抑制したフレームの位置
+        echo_positions = []
+        # フレームが届かない（デバイス停止など）場合に備えて、待ち時間にも上限を設ける
+        frame_wait = 1.0 if timeout is None else timeout + 1.0
+        for position, frame in self.frames(start, frame_wait):
+            end = position + len(frame)
+            if self.is_echo(position, len(frame), frame_energy(frame)):
+                echo_positions.append(position)
+                frame = np.zeros_like(frame)
+            event = endpointer.process(frame, position, self.energy_threshold)
+            if speech_start is None:
+                if event is not None and event[0] == SPEECH_START:
+                    speech_start = max(start, event[1] - pre_roll)
+                elif timeout_samples is not None and end - start >= timeout_samples:
+                    self.cursor = end
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                continue
+            if event is not None and event[0] == SPEECH_END:
+                speech_end = event[1]
+                break
+            if limit_samples is not None and end - speech_start >= limit_samples:
+                break
+            if on_partial is not None and end - (last_partial or speech_start) >= partial_samples:
+                last_partial = end
+                on_partial(AudioBuffer(self._read_without_echo(speech_start, end, echo_positions)))
+
+        self.cursor = end
+        if speech_start is None:
+            raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+        # 終端の無音は少しだけ残し、ハングオーバー分の無音は認識に渡さない
+        if speech_end is not None:
+            end = min(end, speech_end + self.seconds_to_samples(0.1))
+        samples = self._read_without_echo(speech_start, end, echo_positions)
+        if echo_positions:
+            print(f"[エコー] 読み上げと重なる {len(echo_positions)} フレームを抑制しました"
+                  f"（累計 {self.echo_gate.suppressed_frames}）")
+        return AudioBuffer(samples)
@@ -0,0 +1,101 @@
+# echo.py
+"""
+自分の読み上げ音声（エコー）を聞き取らないためのゲート。
+
+speak() の音声がマイクに回り込むと、次の発話として音声認識と意図判定に送られてしまう。
+PlaybackTimeline は出力ストリームに書き込んだブロックの時刻とRMS（リファレンス信号）を記録し、
+EchoGate は入力フレームの時刻に再生音が重なっているかを調べる。
+重なっているフレームは、再生音の大きさから予想される回り込みの大きさを差し引いても
+十分に大きい（ユーザーが読み上げに割り込んで話している）場合を除いて抑制する。
+回り込みの大きさ（マイク/再生音のRMS比）は抑制したフレームから学習する。
+"""
+import os
+import threading
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+ECHO_GATE_ENABLED = os.environ.get("RABBIT_ECHO_GATE", "1") == "1"
+# 再生してからマイクに届くまでの遅れと残響を見込んで、再生後もこの秒数は重なりとみなす
+ECHO_TAIL_SECONDS = float(os.environ.get("RABBIT_ECHO_TAIL_SECONDS", "0.3"))
+# 予想される回り込みの何倍を超えたら、割り込み発話として通すか
+ECHO_DOUBLE_TALK_RATIO = 3.0
+# 再生履歴を残す秒数
+ECHO_HISTORY_SECONDS = 10.0
+
+
+class PlaybackTimeline:
+    """
+    再生したブロックの (開始時刻, 終了時刻, RMS) を記録する。時刻は time.monotonic()。
+    RMS はマイク側と比べられるよう int16 のスケールで持つ。
+    record() はオーディオスレッドから呼ばれるので、deque に追加するだけにする。
+    """
+
+    def __init__(self, history_seconds: float = ECHO_HISTORY_SECONDS):
+        self.history_seconds = history_seconds
+        self._blocks: deque = deque()
+
+    def record(self, start_time: float, samples: np.ndarray, samplerate: int) -> None:
+        if len(samples) == 0:
+            return
+        rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float32)))) * 32768.0
+        self._blocks.append((start_time, start_time + len(samples) / samplerate, rms))
+        while self._blocks and self._blocks[0][1] < start_time - self.history_seconds:
+            self._blocks.popleft()
+
+    def reference_energy(self, start_time: float, end_time: float, tail: float = ECHO_TAIL_SECONDS) -> Optional[float]:
+        """
+        [start_time, end_time] の入力に回り込みうる再生音の最大RMSを返す（重なりがなければ None）。
+        再生ブロックの終了から tail 秒までは重なりとみなす。
+        """
+        level = None
+        # オーディオスレッドが追加中でも読めるよう、いったんコピーしてから新しい順に見る
+        for block_start, block_end, rms in reversed(list(self._blocks)):
+            if block_end + tail < start_time:
+                break
+            if block_start <= end_time:
+                level = rms if level is None else max(level, rms)
+        return level
+
+
+class EchoGate:
+    """
+    入力フレームが自分の読み上げの回り込みかを判定し、抑制したフレーム数を数える。
+    """
+
+    def __init__(self, timeline: PlaybackTimeline, double_talk_ratio: float = ECHO_DOUBLE_TALK_RATIO):
+        self.timeline = timeline
+        self.double_talk_ratio = double_talk_ratio
+        self.suppressed_frames = 0
+        self.double_talk_frames = 0
+        # マイクでのRMS / 再生音のRMS（最初は大きめに見積もり、抑制したフレームから学習する）
+        self.coupling = 1.0
+        self._lock = threading.Lock()
+
+    def is_echo(self, energy: float, start_time: float, end_time: float, learn: bool = True) -> bool:
+        """
+        RMS が energy で [start_time, end_time] に録音されたフレームが回り込みなら True。
+        learn=False のときは回り込みの学習もフレーム数の集計もしない（同じフレームを何度も見る場合用）。
+        """
+        reference = self.timeline.reference_energy(start_time, end_time)
+        if reference is None or reference <= 0:
+            return False
+        with self._lock:
+            expected = self.coupling * reference
+            if energy > expected * self.double_talk_ratio:
+                if learn:
+                    self.double_talk_frames += 1
+                return False
+            if learn:
+                self.coupling = 0.95 * self.coupling + 0.05 * (energy / reference)
+                self.suppressed_frames += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "suppressed_frames": self.suppressed_frames,
+                "double_talk_frames": self.double_talk_frames,
+                "coupling": self.coupling,
+            }
@@ -0,0 +1,112 @@
+# emotion_classifier.py
+"""
+pyAudioAnalysis の SVM による感情分類を常駐させる。
+
+以前は発話ごとに aT.file_classification を呼んでいたため、そのたびに
+学習済みモデル（emotion_svm_model）と正規化用の平均・標準偏差（emotion_svm_modelMEANS）を
+pickle から読み直し、さらに一時ファイルに書いた WAV を読み直していた。
+EmotionClassifier は最初に一度だけモデルを読み込み、その後は AudioBuffer の
+int16 サンプルから直接、file_classification と同じ手順
+（中期特徴量 → 時間方向の平均 → 正規化 → SVM）で分類する。
+1回ごとの処理時間を記録し、stats() で確認できる。
+"""
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_buffer import AudioBuffer
+
+EMOTION_MODEL_PATH = os.environ.get(
+    "RABBIT_EMOTION_MODEL",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "emotion_svm_model"),
+)
+EMOTION_MODEL_TYPE = "svm"
+# これより短い発話は特徴量が安定しないので分類しない（秒）
+MIN_CLASSIFY_SECONDS = 0.5
+
+
+class EmotionClassifier:
+    """学習済みの感情分類モデル（pyAudioAnalysis 形式）を読み込んだまま使う分類器"""
+
+    def __init__(self, model_path: str = EMOTION_MODEL_PATH, model_type: str = EMOTION_MODEL_TYPE):
+        self.model_path = model_path
+        self.model_type = model_type
+        self.classifier = None
+        self.mean: Optional[np.ndarray] = None
+        self.std: Optional[np.ndarray] = None
+        self.class_names: List[str] = []
+        self.load_seconds: Optional[float] = None
+        self.latencies: List[float] = []
+        self._windows: Tuple[float, float, float, float] = (1.0, 1.0, 0.05, 0.025)
+        self._compute_beat = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.classifier is not None
+
+    def load(self) -> None:
+        """モデルと正規化用の値を一度だけ読み込む"""
+        with self._lock:
+            if self.classifier is not None:
+                return
+            from pyAudioAnalysis import audioTrainTest as aT
+            start = time.perf_counter()
+            (classifier, mean, std, class_names, mid_window, mid_step, short_window, short_step,
+             compute_beat) = aT.load_model(self.model_path)
+            self.mean = np.asarray(mean, dtype=np.float64)
+            self.std = np.asarray(std, dtype=np.float64)
+            self.class_names = list(class_names)
+            self._windows = (mid_window, mid_step, short_window, short_step)
+            self._compute_beat = bool(compute_beat)
+            self.classifier = classifier
+            self.load_seconds = time.perf_counter() - start
+            print(f"[感情分類] モデルを読み込みました: {os.path.basename(self.model_path)} "
+                  f"({len(self.class_names)}クラス, {self.load_seconds * 1000:.0f}ms)")
+
+    def features(self, audio: AudioBuffer) -> np.ndarray:
+        """file_classification と同じ特徴量ベクトル（正規化済み）を作る"""
+        from pyAudioAnalysis import MidTermFeatures as aF
+        rate = audio.sample_rate
+        mid_window, mid_step, short_window, short_step = self._windows
+        mid_features, short_features, _ = aF.mid_feature_extraction(
+            audio.samples, rate, mid_window * rate, mid_step * rate,
+            round(rate * short_window), round(rate * short_step),
+        )
+        vector = mid_features.mean(axis=1)
+        if self._compute_beat:
+            beat, beat_confidence = aF.beat_extraction(short_features, short_step)
+            vector = np.append(vector, [beat, beat_confidence])
+        return (vector - self.mean) / self.std
+
+    def classify_with_probabilities(self, audio: AudioBuffer) -> Tuple[Optional[str], Dict[str, float]]:
+        """感情ラベルとクラスごとの確率を返す。短すぎる発話は (None, {})"""
+        if audio.duration < MIN_CLASSIFY_SECONDS:
+            return None, {}
+        self.load()
+        start = time.perf_counter()
+        vector = self.features(audio).reshape(1, -1)
+        with self._lock:
+            class_id = int(self.classifier.predict(vector)[0])
+            probabilities = self.classifier.predict_proba(vector)[0]
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        label = self.class_names[class_id]
+        print(f"[感情分類] {label} ({latency * 1000:.0f}ms, 音声 {audio.duration:.1f}秒)")
+        return label, dict(zip(self.class_names, map(float, probabilities)))
+
+    def classify(self, audio: AudioBuffer) -> Optional[str]:
+        """感情ラベルを返す"""
+        return self.classify_with_probabilities(audio)[0]
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "load_ms": self.load_seconds * 1000 if self.load_seconds is not None else None,
+            "calls": len(latencies),
+            "latency_mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else None,
+            "latency_max_ms": latencies[-1] * 1000 if latencies else None,
+        }
@@ -0,0 +1,125 @@
+# emotion_state.py
+"""
+ユーザーごとの気分（感情分析の各指標）をプロセス内に持っておくモデル。
+
+以前は最新の気分を知るために、毎回 Supabase の sentiment_averages を読み直していた。
+EmotionStateModel は発話ごとの平均値を受け取り、指標ごとに時間で減衰する重み付き平均
+（半減期 half_life 秒。古い発話ほど重みが小さい）を更新していく。
+- update(): 発話1つ分の平均値を取り込む（指標数に比例する処理だけで、履歴は持たない）
+- record(): 今の気分を sentiment_averages のレコードと同じキーの辞書で返す
+  （mood_weight は残っている重みの合計で、長く話していないと小さくなる）
+状態は save_interval 秒ごと（と終了時）にファイルへ書き出し、再起動後も引き継ぐ。
+"""
+import os
+import json
+import math
+import time
+import atexit
+import threading
+from typing import Dict, Optional
+
+EMOTION_STATE_FILE = os.environ.get(
+    "RABBIT_EMOTION_STATE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "emotion_state.json"),
+)
+# 発話の重みが半分になるまでの秒数
+EMOTION_HALF_LIFE = float(os.environ.get("RABBIT_EMOTION_HALF_LIFE", "600"))
+# 残っている重みがこれより小さければ、気分はわからないものとして扱う
+MIN_MOOD_WEIGHT = 0.05
+
+
+class EmotionStateModel:
+    """
+    ユーザーごとに {指標: 値}・重みの合計・最終更新時刻（UNIX時刻）を持つ。
+    新しい発話の重みを1とし、前回からの経過時間に応じて既存の重みを 0.5 ** (経過秒 / half_life) 倍する。
+    """
+
+    def __init__(self, path: Optional[str] = EMOTION_STATE_FILE, half_life: float = EMOTION_HALF_LIFE,
+                 save_interval: float = 60.0):
+        self.path = path
+        self.half_life = half_life
+        self.save_interval = save_interval
+        self.updates = 0
+        self._users: Dict[str, dict] = {}
+        self._dirty = False
+        self._last_saved = time.monotonic()
+        self._lock = threading.Lock()
+        self.load()
+        atexit.register(self.save)
+
+    def _decay(self, elapsed: float) -> float:
+        return 0.5 ** (max(elapsed, 0.0) / self.half_life)
+
+    def update(self, user_id: str, averages: dict, now: Optional[float] = None) -> None:
+        """発話1つ分の感情分析の平均値を取り込む（数値でない値は無視する）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._users.setdefault(user_id, {"values": {}, "weight": 0.0, "updated": now})
+            old_weight = state["weight"] * self._decay(now - state["updated"])
+            values = state["values"]
+            for key, value in averages.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool) or math.isnan(value):
+                    continue
+                previous = values.get(key)
+                if previous is None or old_weight <= 0:
+                    values[key] = float(value)
+                else:
+                    values[key] = (previous * old_weight + value) / (old_weight + 1.0)
+            state["weight"] = old_weight + 1.0
+            state["updated"] = now
+            self.updates += 1
+            self._dirty = True
+            due = time.monotonic() - self._last_saved >= self.save_interval
+        if due:
+            self.save()
+
+    def record(self, user_id: str, now: Optional[float] = None) -> dict:
+        """
+        今の気分を {指標: 値, "user_id", "mood_weight", "updated_at"} で返す。
+        まだ発話がないか、重みが MIN_MOOD_WEIGHT を下回るほど古ければ空の辞書を返す。
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                return {}
+            weight = state["weight"] * self._decay(now - state["updated"])
+            if weight < MIN_MOOD_WEIGHT:
+                return {}
+            return {**state["values"], "user_id": user_id, "mood_weight": weight,
+                    "updated_at": state["updated"]}
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                users = json.load(f).get("users", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        with self._lock:
+            self._users = {
+                user_id: {"values": dict(state.get("values", {})), "weight": float(state.get("weight", 0.0)),
+                          "updated": float(state.get("updated", 0.0))}
+                for user_id, state in users.items()
+            }
+        print(f"[気分] {len(self._users)}人分の状態を読み込みました")
+
+    def save(self) -> None:
+        """状態をファイルに書き出す（一時ファイル経由で置き換える）"""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"half_life": self.half_life, "users": self._users}
+            payload = json.dumps(data, ensure_ascii=False)
+            self._dirty = False
+            self._last_saved = time.monotonic()
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print("[気分] 状態を保存できませんでした:", e)
@@ -0,0 +1,128 @@
+# idle.py
+"""
+待機中の省電力リスニング。
+
+これまでのメインループは、誰も話していなくても5秒ごとに listen() を呼び、
+30msフレームごとにVAD（エネルギー・ゼロ交差率）を計算し続けていた。
+IdleMonitor は check_interval ごとにだけ起きて、その間に溜まった音声を
+10msの小さなフレームに分けてRMSだけをまとめて計算する（デューティサイクル動作）。
+しきい値を超えるフレームが sustain_ms 続いたときだけ、通常の listen / 認識処理を起こす。
+
+CPU使用率と1分あたりの起動回数は stats() で取得でき、report_interval ごとに表示する。
+"""
+import os
+import time
+import threading
+from typing import Optional
+
+import numpy as np
+
+IDLE_CHECK_INTERVAL = float(os.environ.get("RABBIT_IDLE_CHECK_INTERVAL", "0.25"))
+IDLE_FRAME_MS = 10
+# この長さだけ続けてしきい値を超えたら発話の可能性ありとして起こす
+IDLE_SUSTAIN_MS = int(os.environ.get("RABBIT_IDLE_SUSTAIN_MS", "90"))
+IDLE_REPORT_SECONDS = float(os.environ.get("RABBIT_IDLE_REPORT_SECONDS", "60"))
+# 起こしたとき、検出位置よりどれだけ前から listen() に読ませるか
+IDLE_PRE_ROLL_SECONDS = 0.3
+
+
+class IdleMonitor:
+    """
+    CaptureService のリングバッファを間欠的に見て、持続したエネルギーを検出する。
+    wait_for_activity() が True を返したときは capture.cursor が検出位置の少し前に
+    合わせてあるので、続けて listen() を呼べば話し始めから切り出せる。
+    """
+
+    def __init__(self, capture, check_interval: float = IDLE_CHECK_INTERVAL, frame_ms: int = IDLE_FRAME_MS,
+                 sustain_ms: int = IDLE_SUSTAIN_MS, report_interval: float = IDLE_REPORT_SECONDS):
+        self.capture = capture
+        self.check_interval = check_interval
+        self.frame_size = capture.samplerate * frame_ms // 1000
+        self.sustain_frames = max(1, sustain_ms // frame_ms)
+        self.report_interval = report_interval
+        self.wakeups = 0
+        self.checks = 0
+        self._run = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_cpu = time.process_time()
+        self._window_wakeups = 0
+        self._last_stats = {"cpu_percent": 0.0, "wakeups_per_minute": 0.0}
+
+    def _detect(self, samples: np.ndarray, position: int) -> Optional[int]:
+        """
+        位置 position からの samples を小フレームに分けてRMSを計算し、しきい値超えが
+        sustain_frames 続いたフレーム列の先頭のインデックス（サンプル単位）を返す。見つからなければ None。
+        直前のチェックから続いている超過フレーム数も引き継ぐ。自分の読み上げの回り込みは数えない。
+        """
+        n_frames = len(samples) // self.frame_size
+        if n_frames == 0:
+            return None
+        frames = samples[:n_frames * self.frame_size].astype(np.float32).reshape(n_frames, self.frame_size)
+        energies = np.sqrt(np.mean(frames ** 2, axis=1))
+        loud = energies > self.capture.energy_threshold
+        for i, is_loud in enumerate(loud):
+            if is_loud and self.capture.is_echo(position + i * self.frame_size, self.frame_size,
+                                                float(energies[i]), learn=False):
+                is_loud = False
+            self._run = self._run + 1 if is_loud else 0
+            if self._run >= self.sustain_frames:
+                first = i + 1 - self._run
+                self._run = 0
+                return first * self.frame_size
+        return None
+
+    def wait_for_activity(self, timeout: Optional[float] = None) -> bool:
+        """
+        持続したエネルギーを検出するまで待ち、検出したら True を返す。
+        timeout 秒たっても検出しなければ False（メインループが通知の処理などに戻れるようにする）。
+        """
+        self.capture.start()
+        ring = self.capture.ring
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # 読み終えた位置は capture.cursor で管理する（間に listen() が呼ばれても二重に見ない）
+        self._run = 0
+        try:
+            while True:
+                self._maybe_report()
+                time.sleep(self.check_interval)
+                self.checks += 1
+                position = max(self.capture.cursor, ring.oldest_position)
+                end = ring.write_position
+                # 小フレームの端数は次回に回す
+                end -= (end - position) % self.frame_size
+                offset = self._detect(ring.read(position, end), position)
+                if offset is not None:
+                    pre_roll = self.capture.seconds_to_samples(IDLE_PRE_ROLL_SECONDS)
+                    self.capture.cursor = max(ring.oldest_position, position + offset - pre_roll)
+                    with self._lock:
+                        self.wakeups += 1
+                        self._window_wakeups += 1
+                    return True
+                self.capture.cursor = end
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+        finally:
+            self._maybe_report()
+
+    def _maybe_report(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - self._window_start
+            if elapsed < self.report_interval:
+                return
+            cpu = time.process_time()
+            self._last_stats = {
+                "cpu_percent": (cpu - self._window_cpu) / elapsed * 100,
+                "wakeups_per_minute": self._window_wakeups / elapsed * 60,
+            }
+            self._window_start = now
+            self._window_cpu = cpu
+            self._window_wakeups = 0
+            stats = self._last_stats
+        print(f"[待機] CPU {stats['cpu_percent']:.1f}% / 起動 {stats['wakeups_per_minute']:.1f}回/分")
+
+    def stats(self) -> dict:
+        """直近の集計区間のCPU使用率（プロセス全体）と1分あたりの起動回数、累計の起動回数"""
+        with self._lock:
+            return {**self._last_stats, "wakeups": self.wakeups, "checks": self.checks}
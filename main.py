@@ -3,7 +3,11 @@ import time
 import datetime
 import threading
 import queue
-from audio import recognize_speech,speak
+from audio import listen_utterance, speak_async, synthesize, capture_service, asr_backend, wake_word_spotter
+from audio import emotion_classifier, EMOTION_CLASSIFICATION_ENABLED
+from prewarm import prewarm_static_prompts
+from idle import IdleMonitor
+from streaming import SpeculativeStage
 from intent import extract_intent_info
 from task_registration import insert_task
 from notifications import fetch_tasks, notify_and_wait_for_completion
@@ -12,6 +16,10 @@ from config import OPENAI_API_KEY, SUPABASE_URL, SUPABASE_KEY, CURRENT_USER_ID,
 
 # タスク通知を一時保管するキュー
 notification_queue = queue.Queue()
+# 待機中は間欠的なエネルギー検出だけを回し、声らしい音が続いたときだけ認識処理を起こす
+idle_monitor = IdleMonitor(capture_service)
+# 発話中の途中結果で意図判定を先に始め、最終結果と一致すればその結果を使う
+speculative_intent = SpeculativeStage(extract_intent_info, name="意図判定")
 
 def process_user_input(user_text):
     """
@@ -21,8 +29,9 @@ def process_user_input(user_text):
     - TaskRegistration: タスク登録機能 (task_registration.py) を呼び出す
     - rabbitChat: 雑談機能 (rabbit_chat.py) を呼び出す
     - Silent: 発言がなかった場合は何もしない
+    意図判定は、発話中の途中結果で先に始めていて最終結果と一致すればその結果を使う。
     """
-    intent = extract_intent_info(user_text)
+    intent = speculative_intent.resolve(user_text)
     print(f"main分岐: {intent}")
     
     if intent == "TaskRegistration":
@@ -59,30 +68,45 @@ def process_notification_queue():
         notify_and_wait_for_completion(task)
         notification_queue.task_done()
 
-def main_loop():
+def main_loop_once():
     """
-    メインループ:
-    ① 音声入力を短いタイムアウト（5秒）でチェックし、あれば優先的に処理する。
+    メインループの1回分:
+    ① 省電力の待機（最大1秒）で声らしい音が続いたときだけ、音声入力を短いタイムアウト（5秒）で処理する。
     ② 音声入力処理が終わったら、キューに保管されているタスク通知を処理する。
     """
-    while True:
-        # ①音声入力のチェック
-        user_text = recognize_speech(timeout_seconds=5)['text']
-        # ②気持ちのチェック
-        user_emotions = recognize_speech(timeout_seconds=5)['ai_emotions']
+    # ①音声入力と気持ちのチェック（1回の録音からテキストと感情の両方を得る）
+    if idle_monitor.wait_for_activity(timeout=1.0):
+        # 「ラビット」と呼びかけられた発話だけを音声認識・意図判定に回す
+        speculative_intent.start_turn()
+        utterance = listen_utterance(timeout_seconds=5, gate=wake_word_spotter.detect_audio,
+                                     on_partial=speculative_intent.on_partial)
+        user_text = utterance.text
+        user_emotions = utterance.ai_emotions
 
         if user_text:
             process_user_input(user_text)
             # process_user_emotions(user_emotions)
-        
-        # ② 音声入力処理が終わったら、キューにあるタスク通知を実行
-        process_notification_queue()
-        
-        time.sleep(0.5)
+
+    # ② 音声入力処理が終わったら、キューにあるタスク通知を実行
+    process_notification_queue()
+
+def main_loop():
+    """メインループ: main_loop_once() を繰り返す"""
+    while True:
+        main_loop_once()
 
 if __name__ == "__main__":
-    # 起動時に一度だけ発話する
-    speak("起動しました。")
+    # 音声認識モデルを読み込んでおく（Whisperの場合、最初の発話で読み込み待ちが起きないようにする）
+    asr_backend.load()
+    # 感情分類を使う場合は、モデルもここで一度だけ読み込んでおく
+    if EMOTION_CLASSIFICATION_ENABLED:
+        emotion_classifier.load()
+    # マイクの入力ストリームを開く（初回起動時のみ、ここで周囲の雑音レベルを調整する）
+    capture_service.start()
+    # 起動時に一度だけ発話し、その間に固定フレーズの音声を先に合成しておく
+    startup_speech = speak_async("起動しました。")
+    prewarm_static_prompts(synthesize)
+    startup_speech.result()
     # タスク監視スレッドを開始（このスレッドは常にバックグラウンドでタスクの監視・キューへの追加を行う）
     monitor_thread = threading.Thread(target=task_monitor, daemon=True)
     monitor_thread.start()
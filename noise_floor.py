@@ -0,0 +1,152 @@
+# noise_floor.py
+"""
+周囲の雑音レベル（ノイズフロア）の推定。
+
+以前は聞き取りのたびに adjust_for_ambient_noise で約1秒かけて調整していたが、
+- 起動時に一度だけ（保存済みの値があればそれを読み込んで）しきい値を決め、
+- その後は発話でないフレームのエネルギーからパーセンタイルで継続的に追従し、
+- しきい値をファイルに保存して再起動後も引き継ぐ
+ようにする。
+部屋がうるさくなったときに追従できるよう、発話かどうかに関わらず直近のフレームの
+低いパーセンタイル（静かな瞬間の大きさ）がノイズフロアを上回り続けたら、それに合わせて引き上げる。
+保存済みの値は起動直後の音声で確かめ（verify）、大きくずれていれば調整し直す。
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from typing import Iterable, Optional
+
+import numpy as np
+
+NOISE_FLOOR_FILE = os.environ.get(
+    "RABBIT_NOISE_FLOOR_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "noise_floor.json"),
+)
+
+# ノイズフロアに掛ける倍率（これを超えるエネルギーを発話とみなす）
+NOISE_FLOOR_RATIO = 2.5
+# しきい値の下限・上限（int16スケールのRMS）
+MIN_ENERGY_THRESHOLD = 50.0
+MAX_ENERGY_THRESHOLD = 4000.0
+# 直近の全フレーム（発話を含む）のこのパーセンタイルがノイズフロアを上回れば、部屋がうるさくなったとみなす
+SUSTAINED_PERCENTILE = 5.0
+# 保存済みのノイズフロアと起動直後の実測がこの倍率以上ずれていれば調整し直す
+SAVED_FLOOR_TOLERANCE = 3.0
+
+
+class NoiseFloorEstimator:
+    """
+    フレームごとのRMSエネルギーから発話判定のしきい値を推定する。
+    直近 window_frames 個の非発話フレームの percentile パーセンタイルをノイズフロアとする。
+    ただし直近 window_frames 個の全フレームの SUSTAINED_PERCENTILE パーセンタイルの方が大きければ、そちらを使う。
+    """
+
+    def __init__(self, path: Optional[str] = NOISE_FLOOR_FILE, percentile: float = 20.0,
+                 window_frames: int = 500, update_every: int = 30, save_interval: float = 60.0):
+        self.path = path
+        self.percentile = percentile
+        self.update_every = update_every
+        self.save_interval = save_interval
+        self.noise_floor: Optional[float] = None
+        self.threshold = 300.0
+        self._energies: deque = deque(maxlen=window_frames)
+        self._recent: deque = deque(maxlen=window_frames)
+        self._since_update = 0
+        self._last_saved = time.monotonic()
+        self._lock = threading.Lock()
+        # 保存済みの値を読み込んだときは、verify() で実測と比べるまで確かめていない扱いにする
+        self.needs_verify = self.load()
+        atexit.register(self.save)
+
+    @property
+    def is_calibrated(self) -> bool:
+        return self.noise_floor is not None
+
+    def _set_floor(self, floor: float) -> None:
+        self.noise_floor = floor
+        self.threshold = float(np.clip(floor * NOISE_FLOOR_RATIO, MIN_ENERGY_THRESHOLD, MAX_ENERGY_THRESHOLD))
+
+    def calibrate(self, energies: Iterable[float]) -> float:
+        """起動時の一度きりの調整。与えたフレームエネルギーからしきい値を決める"""
+        values = np.fromiter(energies, dtype=np.float32)
+        if len(values) == 0:
+            return self.threshold
+        with self._lock:
+            self._energies.extend(values.tolist())
+            self._recent.extend(values.tolist())
+            self._set_floor(float(np.percentile(values, self.percentile)))
+            self.needs_verify = False
+        print(f"[ノイズ] 初期調整: ノイズフロア {self.noise_floor:.0f}, しきい値 {self.threshold:.0f}")
+        self.save()
+        return self.threshold
+
+    def verify(self, energies: Iterable[float]) -> bool:
+        """
+        保存済みのノイズフロアを起動直後のフレームエネルギーと比べる。
+        SAVED_FLOOR_TOLERANCE 倍以上ずれていれば（部屋や機器が変わったなど）それで調整し直し、False を返す。
+        """
+        values = np.fromiter(energies, dtype=np.float32)
+        if not self.needs_verify or len(values) == 0:
+            return True
+        measured = max(float(np.percentile(values, self.percentile)), 1.0)
+        saved = max(self.noise_floor, 1.0)
+        self.needs_verify = False
+        if max(measured / saved, saved / measured) < SAVED_FLOOR_TOLERANCE:
+            return True
+        print(f"[ノイズ] 保存済みのノイズフロア {self.noise_floor:.0f} が実測 {measured:.0f} と合わないため調整し直します")
+        self.calibrate(values)
+        return False
+
+    def update(self, energy: float, is_speech: bool = False) -> None:
+        """
+        フレームエネルギーを1つ取り込む。発話のフレーム（is_speech）はノイズフロアの推定には使わず、
+        部屋がうるさくなったかの判定にだけ使う。update_every フレームごとにパーセンタイルを計算し直す。
+        """
+        with self._lock:
+            self._recent.append(energy)
+            if not is_speech:
+                self._energies.append(energy)
+            self._since_update += 1
+            if self._since_update < self.update_every:
+                return
+            self._since_update = 0
+            candidates = []
+            if self._energies:
+                candidates.append(float(np.percentile(self._energies, self.percentile)))
+            # 発話と判定されたフレームばかりでも、静かな瞬間すらノイズフロアより大きいなら雑音が増えている
+            if len(self._recent) == self._recent.maxlen:
+                candidates.append(float(np.percentile(self._recent, SUSTAINED_PERCENTILE)))
+            if not candidates:
+                return
+            floor = max(candidates)
+            # 急な変化で判定が揺れないよう、少しずつ近づける
+            if self.noise_floor is not None:
+                floor = 0.8 * self.noise_floor + 0.2 * floor
+            self._set_floor(floor)
+        if time.monotonic() - self._last_saved > self.save_interval:
+            self.save()
+
+    def load(self) -> bool:
+        """保存済みのノイズフロアを読み込む"""
+        if not self.path:
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self._set_floor(float(saved["noise_floor"]))
+            return True
+        except (FileNotFoundError, KeyError, ValueError, json.JSONDecodeError):
+            return False
+
+    def save(self) -> None:
+        if not self.path or self.noise_floor is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"noise_floor": self.noise_floor, "threshold": self.threshold,
+                       "updated_at": time.time()}, f)
+        os.replace(tmp_path, self.path)
+        self._last_saved = time.monotonic()
@@ -13,7 +13,7 @@ from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from datetime import datetime, timedelta
 import time
-from audio import speak, recognize_speech
+from audio import speak, recognize_speech, PRIORITY_NOTIFICATION
 from config import OPENAI_API_KEY, SUPABASE_URL, SUPABASE_KEY, CURRENT_USER_ID, supabase
 # from notifications import mark_task_completed, handle_incomplete_task
 
@@ -148,13 +148,13 @@ def record_task_completion(task_id: str, is_completed: bool):
         response = supabase.table("task_completions").insert(data).execute()
         if response.data:
             print(f"[DB] タスク({task_id}) を記録したよ（完了: {is_completed}）")
-            speak("完了登録したよ。" if is_completed else "未完了として記録したよ。")
+            speak("完了登録したよ。" if is_completed else "未完了として記録したよ。", priority=PRIORITY_NOTIFICATION)
         else:
             print("[DB] 登録に失敗:", response)
-            speak("タスクの登録に失敗しちゃった。")
+            speak("タスクの登録に失敗しちゃった。", priority=PRIORITY_NOTIFICATION)
     except Exception as e:
         print("DB登録でエラーが発生しました:", str(e))
-        speak("タスク完了の登録でエラーが発生したみたい。")
+        speak("タスク完了の登録でエラーが発生したみたい。", priority=PRIORITY_NOTIFICATION)
 
 
 def get_task_completion_response(title: str, is_completed: bool) -> str:
@@ -197,7 +197,7 @@ def notify_and_wait_for_completion(task: dict):
     # 🐰 タスクのリマインドメッセージ
     message = get_motivational_message(title,scheduled_time, task_rate, overall_rate)
     print(message)
-    speak(message)
+    speak(message, priority=PRIORITY_NOTIFICATION)
 
     # 🎤 最初の音声入力（タスクへの返答）
     user_input = recognize_speech(timeout_seconds=180)
@@ -209,7 +209,7 @@ def notify_and_wait_for_completion(task: dict):
         is_completed = status == "Completed"
     except Exception as e:
         print("完了判定エラー:", e)
-        speak("うまく判断できなかったみたい。また教えてくれる？")
+        speak("うまく判断できなかったみたい。また教えてくれる？", priority=PRIORITY_NOTIFICATION)
         is_completed = False
     print(f"[完了判定] タスク({task_id}) の完了状況: {is_completed}")
 
@@ -218,7 +218,7 @@ def notify_and_wait_for_completion(task: dict):
 
     # ✅ タスク内容に応じた自然なフィードバック（達成率と連続実績を含む）
     feedback_msg = get_task_completion_response(title, is_completed)
-    speak(feedback_msg)
+    speak(feedback_msg, priority=PRIORITY_NOTIFICATION)
 
     # ✅ 未完了だった場合の処理
     if not is_completed:
@@ -237,7 +237,7 @@ def notify_and_wait_for_completion(task: dict):
         user_text = user_reply.get("text", "").strip()
         if not user_text:
             if i == 0:
-                speak("ふふ、静かだね。じゃあまたね〜")
+                speak("ふふ、静かだね。じゃあまたね〜", priority=PRIORITY_NOTIFICATION)
             break
 
         chat_history.append({"role": "user", "content": user_text})
@@ -245,7 +245,7 @@ def notify_and_wait_for_completion(task: dict):
         reply = response.content.strip()
         chat_history.append({"role": "assistant", "content": reply})
         print(f"[雑談{i+1}]: {reply}")
-        speak(reply)
+        speak(reply, priority=PRIORITY_NOTIFICATION)
 
 def handle_incomplete_task(task_id: str):
     """
@@ -0,0 +1,96 @@
+# prewarm.py
+"""
+起動時に固定フレーズの音声を先に合成しておく（プリウォーム）。
+
+各モジュールのソースから speak("...") / speak_async("...") に文字列リテラルで渡している
+発話を探し出し、読み上げと同じ文単位でバックグラウンドのスレッドプールで合成する。
+合成結果はTTSキャッシュに入るので、初めてその発話をするときも合成待ちが発生しない。
+"""
+import os
+import ast
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Iterable, List, Optional
+
+from speech_pipeline import split_sentences
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 固定フレーズを探すモジュール
+PROMPT_SOURCES = ["main.py", "task_registration.py", "notifications.py", "rabbit_chat.py"]
+
+SPEAK_FUNCTIONS = {"speak", "speak_async"}
+
+
+def _string_literals(node: ast.AST) -> List[str]:
+    """引数が文字列リテラル（または "A" if 条件 else "B"）なら、その文字列を返す"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.IfExp):
+        return _string_literals(node.body) + _string_literals(node.orelse)
+    # f文字列など実行時に決まるものは対象外
+    return []
+
+
+def find_static_prompts(sources: Optional[Iterable[str]] = None) -> List[str]:
+    """ソースコードを解析し、speak() に渡している固定フレーズを出現順に重複なく返す"""
+    prompts: List[str] = []
+    for source in sources or PROMPT_SOURCES:
+        path = source if os.path.isabs(source) else os.path.join(BASE_DIR, source)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                tree = ast.parse(f.read(), filename=path)
+        except (OSError, SyntaxError) as e:
+            print(f"[プリウォーム] {source} を読み込めませんでした:", e)
+            continue
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not node.args:
+                continue
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else getattr(func, "attr", None)
+            if name in SPEAK_FUNCTIONS:
+                for text in _string_literals(node.args[0]):
+                    if text not in prompts:
+                        prompts.append(text)
+    return prompts
+
+
+def prewarm_static_prompts(synthesize: Callable[[str], object],
+                           prompts: Optional[Iterable[str]] = None,
+                           max_workers: int = 4) -> List[Future]:
+    """
+    固定フレーズを文単位でバックグラウンド合成する。すぐに戻り、各文の Future を返す。
+    """
+    sentences: List[str] = []
+    for prompt in prompts if prompts is not None else find_static_prompts():
+        for sentence in split_sentences(prompt):
+            if sentence not in sentences:
+                sentences.append(sentence)
+
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-prewarm")
+    futures = [executor.submit(synthesize, sentence) for sentence in sentences]
+
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def _report(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        failed = sum(1 for f in futures if f.exception() is not None)
+        print(f"[プリウォーム] {len(futures)}文を合成しました"
+              f"（失敗 {failed}件, {time.perf_counter() - start:.1f}秒）")
+
+    for future in futures:
+        future.add_done_callback(_report)
+    # 合成が終わり次第スレッドを終了させる（ここでは待たない）
+    executor.shutdown(wait=False)
+    return futures
+
+
+if __name__ == "__main__":
+    for prompt in find_static_prompts():
+        print(prompt)
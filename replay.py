@@ -0,0 +1,186 @@
+# replay.py
+"""
+マイク・スピーカーの代わりに使う、再現可能な入出力。
+
+- ScriptedInputStream: 台本（WAVファイルと無音の並び）を、実時間（または speed 倍速）で
+  sounddevice の InputStream と同じようにコールバックへ流す
+- NullOutputStream: 出力ストリームの代わりに、同じ間隔でコールバックから音声を引き取って捨てる
+  （record=True なら再生した音声を溜めておき、WAVに保存できる）
+
+台本はJSONのリストで、要素は {"wav": "パス"}（台本ファイルからの相対パス可）か {"silence": 秒数}。
+起動時の雑音レベルの調整に最初の1秒が使われるので、先頭には1秒以上の無音を入れておく。
+    [{"silence": 1.0}, {"wav": "rabbit_task.wav"}, {"silence": 2.0}, {"wav": "tomorrow_9am.wav"}]
+audio.py は環境変数 RABBIT_AUDIO_SCRIPT（台本のパス）と RABBIT_AUDIO_SINK（"null" / "record"）を
+見て、これらを実機のマイク・スピーカーの代わりに使う。
+"""
+import os
+import json
+import time
+import wave
+import threading
+from typing import Callable, List, Optional, Union
+
+import numpy as np
+
+from audio_buffer import AudioBuffer
+
+AUDIO_SCRIPT = os.environ.get("RABBIT_AUDIO_SCRIPT")
+AUDIO_SINK = os.environ.get("RABBIT_AUDIO_SINK", "null" if AUDIO_SCRIPT else "")
+# 台本の再生速度（2.0 なら実時間の半分で流す）
+AUDIO_SCRIPT_SPEED = float(os.environ.get("RABBIT_AUDIO_SCRIPT_SPEED", "1.0"))
+# 無音区間に混ぜる雑音のRMS（完全な0だとノイズフロアの推定が極端になるため）
+SCRIPT_NOISE_RMS = 5.0
+
+
+def load_script(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        steps = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for step in steps:
+        if "wav" in step and not os.path.isabs(step["wav"]):
+            step["wav"] = os.path.join(base, step["wav"])
+    return steps
+
+
+def render_script(steps: List[dict], seed: int = 0) -> np.ndarray:
+    """台本を1本の 16kHz・int16 モノラル音声にする（WAVは AudioBuffer の形式に一度だけ変換する）"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for step in steps:
+        if "wav" in step:
+            parts.append(AudioBuffer.from_file(step["wav"]).samples)
+        elif "silence" in step:
+            n = int(float(step["silence"]) * AudioBuffer.sample_rate)
+            parts.append(rng.normal(0, SCRIPT_NOISE_RMS, n).astype(np.int16))
+        else:
+            raise ValueError(f"台本の要素が不正です: {step}")
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int16)
+
+
+class _PacedStream:
+    """blocksize ごとに、実時間 / speed の間隔でコールバックを呼ぶスレッドを持つストリームの共通部分"""
+
+    def __init__(self, samplerate: int, blocksize: int, callback: Callable, speed: float):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.speed = speed
+        self._running = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        interval = self.blocksize / self.samplerate / self.speed
+        next_time = time.monotonic()
+        while self._running.is_set():
+            self._tick()
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _tick(self) -> None:
+        raise NotImplementedError
+
+
+class ScriptedInputStream(_PacedStream):
+    """
+    sd.InputStream の代わりに、台本の音声をブロックごとにコールバックへ渡す。
+    台本を流し終えたら finished をセットし、その後は無音（小さな雑音）を流し続ける。
+    """
+
+    def __init__(self, script: Union[str, List[dict]], samplerate: int = AudioBuffer.sample_rate,
+                 blocksize: int = 480, callback: Callable = None, speed: float = AUDIO_SCRIPT_SPEED,
+                 channels: int = 1, dtype: str = "int16", device=None):
+        if samplerate != AudioBuffer.sample_rate:
+            raise ValueError(f"台本の再生は {AudioBuffer.sample_rate}Hz のみ対応しています")
+        super().__init__(samplerate, blocksize, callback, speed)
+        steps = load_script(script) if isinstance(script, str) else script
+        self.samples = render_script(steps)
+        self.position = 0
+        self.finished = threading.Event()
+        self._rng = np.random.default_rng(1)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.samplerate
+
+    def _tick(self) -> None:
+        block = self.samples[self.position:self.position + self.blocksize]
+        self.position += len(block)
+        if len(block) < self.blocksize:
+            self.finished.set()
+            tail = self._rng.normal(0, SCRIPT_NOISE_RMS, self.blocksize - len(block)).astype(np.int16)
+            block = np.concatenate([block, tail])
+        self.callback(block.reshape(-1, 1), self.blocksize, None, None)
+
+
+class NullOutputStream(_PacedStream):
+    """
+    sd.OutputStream の代わりに、再生キューから音声を引き取って捨てる（record=True なら溜める）。
+    再生にかかる時間は実機と同じ（speed 倍速）なので、読み上げの待ち時間も再現される。
+    """
+
+    def __init__(self, samplerate: int, blocksize: int, callback: Callable, record: bool = False,
+                 speed: float = AUDIO_SCRIPT_SPEED, channels: int = 1, dtype: str = "float32", device=None):
+        super().__init__(samplerate, blocksize, callback, speed)
+        self.record = record
+        self.blocks: List[np.ndarray] = []
+        self.played_seconds = 0.0
+        self._outdata = np.zeros((blocksize, 1), dtype=np.float32)
+
+    def _tick(self) -> None:
+        self.callback(self._outdata, self.blocksize, None, None)
+        block = self._outdata[:, 0]
+        if np.any(block):
+            self.played_seconds += self.blocksize / self.samplerate
+            if self.record:
+                self.blocks.append(block.copy())
+
+    def recorded(self) -> np.ndarray:
+        """録っておいた再生音声（無音のブロックは含まない）"""
+        return np.concatenate(self.blocks) if self.blocks else np.zeros(0, dtype=np.float32)
+
+    def save(self, path: str) -> None:
+        samples = np.clip(self.recorded() * 32768.0, -32768, 32767).astype(np.int16)
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.samplerate)
+            w.writeframes(samples.tobytes())
+
+
+def scripted_input_factory(script: Union[str, List[dict]], speed: float = AUDIO_SCRIPT_SPEED):
+    """CaptureService(stream_factory=...) に渡す、sd.InputStream と同じ引数で作れる関数を返す"""
+    def factory(samplerate, blocksize, callback, **kwargs):
+        stream = ScriptedInputStream(script, samplerate=samplerate, blocksize=blocksize,
+                                     callback=callback, speed=speed)
+        factory.streams.append(stream)
+        return stream
+    factory.streams = []
+    return factory
+
+
+def null_output_factory(record: bool = False, speed: float = AUDIO_SCRIPT_SPEED):
+    """PlaybackEngine(stream_factory=...) に渡す、sd.OutputStream と同じ引数で作れる関数を返す"""
+    def factory(samplerate, blocksize, callback, **kwargs):
+        stream = NullOutputStream(samplerate, blocksize, callback, record=record, speed=speed)
+        factory.streams.append(stream)
+        return stream
+    factory.streams = []
+    return factory
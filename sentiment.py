@@ -0,0 +1,167 @@
+# sentiment.py
+"""
+AmiVoice の感情分析セグメントの集計。
+
+以前は指標ごとに辞書のループで単純平均を取っていたため、短いセグメントも長いセグメントも
+同じ重みで数えていた。ここではセグメントの並びを一度だけ (セグメント数, 指標数) の行列にし、
+全指標について
+- mean: セグメントの長さ（endtime - starttime）で重み付けした平均
+- max: 最大値
+- percentile: 長さで重み付けしたパーセンタイル（既定は90）
+- trend: 長さで重み付けした回帰直線の傾き（1分あたりの変化量。話しているうちに上がったか下がったか）
+をまとめて計算する。セグメントにない指標は欠損（NaN）として扱い、その指標の計算から外す。
+"""
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 指標ではないキー（ミリ秒）
+TIME_KEYS = ("starttime", "endtime")
+DEFAULT_PERCENTILE = 90.0
+
+
+def sentiment_metrics(segments: Sequence[dict], scan_all: bool = False) -> Tuple[str, ...]:
+    """
+    セグメントに含まれる数値の指標名（最初に現れた順）。
+    通常はすべてのセグメントが同じキーを持つので、scan_all=False ならキーの数の合計が
+    揃っていれば最初のセグメントのキーを使う（足りないキーは segments_to_matrix で見つかる）。
+    """
+    if not segments:
+        return ()
+    first = segments[0]
+    metrics = {key: None for key, value in first.items() if key not in TIME_KEYS and _is_number(value)}
+    if not scan_all and sum(map(len, segments)) == len(first) * len(segments):
+        return tuple(metrics)
+    for seg in segments:
+        for key, value in seg.items():
+            if key not in metrics and key not in TIME_KEYS and _is_number(value):
+                metrics[key] = None
+    return tuple(metrics)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def segments_to_matrix(segments: Sequence[dict], metrics: Optional[Sequence[str]] = None
+                       ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Tuple[str, ...]]:
+    """
+    セグメントの並びを (開始秒, 長さ秒, 値の行列, 指標名) にする。
+    値の行列は (セグメント数, 指標数) の float64 で、セグメントにない指標は NaN。
+    """
+    detect = metrics is None
+    metrics = sentiment_metrics(segments) if detect else tuple(metrics)
+    n = len(segments)
+    try:
+        # 全セグメントが全指標と時刻を持つ場合は、itemgetter で1回の走査で行列にする
+        columns = metrics + TIME_KEYS
+        flat = np.fromiter(chain.from_iterable(map(itemgetter(*columns), segments)),
+                           dtype=np.float64, count=n * len(columns))
+    except KeyError:
+        if detect:
+            metrics = sentiment_metrics(segments, scan_all=True)
+        columns = metrics + TIME_KEYS
+        nan = float("nan")
+        flat = np.array([[seg.get(key, nan) for key in metrics] + [seg.get(key, 0) for key in TIME_KEYS]
+                         for seg in segments], dtype=np.float64)
+    m = len(metrics)
+    table = flat.reshape(n, len(columns))
+    values = table[:, :m]
+    starts = table[:, m] / 1000.0
+    durations = np.maximum(table[:, m + 1] - table[:, m], 0.0) / 1000.0
+    return starts, durations, values, metrics
+
+
+class SentimentSummary:
+    """
+    感情分析の集計結果。mean / max / percentile / trend は指標の並び（metrics）に対応する配列。
+    値がひとつもない指標は NaN になる。
+    """
+
+    def __init__(self, metrics: Tuple[str, ...], mean: np.ndarray, maximum: np.ndarray,
+                 percentile: np.ndarray, trend: np.ndarray, q: float, duration: float, segments: int):
+        self.metrics = metrics
+        self.mean = mean
+        self.max = maximum
+        self.percentile = percentile
+        self.trend = trend
+        self.q = q
+        self.duration = duration
+        self.segments = segments
+
+    @staticmethod
+    def _to_dict(metrics: Sequence[str], values: np.ndarray) -> Dict[str, float]:
+        return {key: float(value) for key, value in zip(metrics, values) if not np.isnan(value)}
+
+    def averages(self) -> Dict[str, float]:
+        """指標ごとの平均値（sentiment_averages に保存する形）"""
+        return self._to_dict(self.metrics, self.mean)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        """{指標: {"mean", "max", "p90", "trend"}} の形（p90 のキーは q による）"""
+        columns = (("mean", self.mean), ("max", self.max), (f"p{self.q:g}", self.percentile),
+                   ("trend", self.trend))
+        result = {}
+        for i, key in enumerate(self.metrics):
+            if np.isnan(self.mean[i]):
+                continue
+            result[key] = {name: float(values[i]) for name, values in columns}
+        return result
+
+    def __repr__(self) -> str:
+        return f"SentimentSummary({len(self.metrics)}指標, {self.segments}セグメント, {self.duration:.1f}秒)"
+
+
+def summarize_segments(segments: Sequence[dict], q: float = DEFAULT_PERCENTILE,
+                       metrics: Optional[Sequence[str]] = None) -> SentimentSummary:
+    """セグメントの並びから全指標の重み付き平均・最大値・パーセンタイル・傾向を計算する"""
+    starts, durations, values, metrics = segments_to_matrix(segments, metrics)
+    n, m = values.shape
+    # 長さの情報がなければ（すべて0なら）単純平均にする
+    weights = durations if durations.sum() > 0 else np.ones(n)
+    present = ~np.isnan(values)
+    w = weights[:, None] * present                      # (n, m) 欠損は重み0
+    filled = np.where(present, values, 0.0)
+    total = w.sum(axis=0)
+    valid = total > 0
+    safe_total = np.where(valid, total, 1.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, (w * filled).sum(axis=0) / safe_total, np.nan)
+        maximum = np.where(present.any(axis=0), np.where(present, values, -np.inf).max(axis=0, initial=-np.inf),
+                           np.nan)
+
+        # 重み付きパーセンタイル: 指標ごとに値で並べ、累積の重みが q% に届く最初の値
+        # （並べ替えは連続したメモリで行うよう (指標数, セグメント数) に転置して行う）
+        order = np.argsort(np.where(present, values, np.inf).T, axis=1)
+        sorted_values = np.take_along_axis(filled.T, order, axis=1)
+        cumulative = np.cumsum(np.take_along_axis(w.T, order, axis=1), axis=1)
+        index = np.minimum((cumulative < (total * (q / 100.0) - 1e-9)[:, None]).sum(axis=1), max(n - 1, 0))
+        percentile = np.where(valid, sorted_values[np.arange(m), index] if n else np.nan, np.nan)
+
+        # 傾向: セグメントの中央の時刻（分）に対する重み付き最小二乗の傾き
+        mid = (starts + durations / 2.0) / 60.0
+        t_mean = (w * mid[:, None]).sum(axis=0) / safe_total
+        dt = (mid[:, None] - t_mean) * present
+        dx = np.where(present, values - mean, 0.0)
+        variance = (w * dt * dt).sum(axis=0)
+        trend = np.where(variance > 0, (w * dt * dx).sum(axis=0) / np.where(variance > 0, variance, 1.0), 0.0)
+        trend = np.where(valid, trend, np.nan)
+
+    return SentimentSummary(metrics, mean, maximum, percentile, trend, q, float(durations.sum()), n)
+
+
+def aggregate_segments_loop(segments: List[dict]) -> dict:
+    """以前の集計（指標ごとの単純平均を辞書のループで計算）。ベンチマークの比較用"""
+    sums = {}
+    counts = {}
+    for seg in segments:
+        for key, value in seg.items():
+            if key in TIME_KEYS:
+                continue
+            if isinstance(value, (int, float)):
+                sums[key] = sums.get(key, 0) + value
+                counts[key] = counts.get(key, 0) + 1
+    return {key: sums[key] / counts[key] for key in sums}
@@ -0,0 +1,99 @@
+# speech_pipeline.py
+"""
+文単位でパイプライン化した読み上げ。
+
+長い返答を「。！？」で文に分割し、N文目を再生している間にN+1文目を合成する。
+最初の1文が合成できた時点で再生を始めるため、返答全体の合成を待たずに話し始められる。
+"""
+import re
+import time
+import queue
+import threading
+from typing import Callable, List, Optional
+
+# 文末記号（全角・半角）までを1文として区切る
+SENTENCE_PATTERN = re.compile(r"[^。！？!?]*[。！？!?]+[」』）)]*|[^。！？!?]+$")
+# 読み上げる文字（かな・漢字・英数字）。記号や空白だけの文は合成しない
+SPEAKABLE_PATTERN = re.compile(r"\w")
+
+_END = object()
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    テキストを日本語の文末記号（。！？）で文に分割する。
+    例: "こんにちは。元気？" -> ["こんにちは。", "元気？"]
+    記号だけの断片（"。。" など）は読み上げるものがないので含めない。
+    """
+    sentences = [s.strip() for s in SENTENCE_PATTERN.findall(text)]
+    return [s for s in sentences if SPEAKABLE_PATTERN.search(s)]
+
+
+class PipelinedSpeaker:
+    """
+    synthesize(文) -> 音声 と play(音声) を受け取り、合成と再生を並行して行う読み上げ器。
+    play が False を返したら（再生が打ち切られたら）残りの文は読み上げない。
+    lookahead は再生待ちにしておく合成済みの文の数。
+    """
+
+    def __init__(self, synthesize: Callable[[str], object], play: Callable[[object], Optional[bool]],
+                 lookahead: int = 1):
+        self.synthesize = synthesize
+        self.play = play
+        self.lookahead = lookahead
+        self.last_ttfa: Optional[float] = None
+
+    def _produce(self, sentences: List[str], chunks: queue.Queue,
+                 cancelled: threading.Event, stop: threading.Event) -> None:
+        """別スレッドで文を順に合成し、キューへ渡す"""
+        try:
+            for sentence in sentences:
+                if cancelled.is_set() or stop.is_set():
+                    break
+                chunks.put(self.synthesize(sentence))
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(_END)
+
+    def speak(self, text: str, cancel_event: Optional[threading.Event] = None) -> Optional[float]:
+        """
+        テキストを読み上げ、最初の音声が鳴り始めるまでの時間(秒)を返す。
+        cancel_event がセットされたら、次の文から先は読み上げない。
+        """
+        sentences = split_sentences(text)
+        if not sentences:
+            return None
+
+        start = time.perf_counter()
+        ttfa = None
+        chunks: queue.Queue = queue.Queue(maxsize=self.lookahead)
+        cancelled = cancel_event if cancel_event is not None else threading.Event()
+        stop_producer = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(sentences, chunks, cancelled, stop_producer), daemon=True
+        )
+        producer.start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is _END or cancelled.is_set():
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if ttfa is None:
+                    ttfa = time.perf_counter() - start
+                    self.last_ttfa = ttfa
+                    print(f"[TTS] 最初の音声まで {ttfa * 1000:.0f}ms（全{len(sentences)}文）")
+                if self.play(chunk) is False:
+                    cancelled.set()
+                    break
+        finally:
+            # 再生側で例外が起きた場合も合成スレッドを止める
+            stop_producer.set()
+            while producer.is_alive():
+                try:
+                    chunks.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.05)
+        return ttfa
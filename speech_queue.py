@@ -0,0 +1,137 @@
+# speech_queue.py
+"""
+優先度付きの非同期読み上げキュー。
+
+読み上げ要求は1本のワーカースレッドが優先度順に処理する。
+呼び出し側には concurrent.futures.Future が返るので、待つことも無視することもできる。
+（asyncio からは asyncio.wrap_future(future) で await できる）
+
+- タスク通知は雑談より優先して読み上げる
+- max_age を過ぎても読み上げられなかった要求は破棄する
+- barge_in() でユーザーが話し始めたときに再生を打ち切る
+"""
+import time
+import queue
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+# 数字が小さいほど優先度が高い
+PRIORITY_NOTIFICATION = 0
+PRIORITY_TASK = 1
+PRIORITY_CHAT = 2
+
+
+class SpeechRequest:
+    """キューに積まれる読み上げ要求1件分"""
+
+    def __init__(self, text: str, priority: int, max_age: Optional[float], seq: int):
+        self.text = text
+        self.priority = priority
+        self.max_age = max_age
+        self.seq = seq
+        self.created_at = time.monotonic()
+        self.future: Future = Future()
+
+    def __lt__(self, other: "SpeechRequest") -> bool:
+        # 同じ優先度なら先に積まれた順
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def is_stale(self) -> bool:
+        return self.max_age is not None and time.monotonic() - self.created_at > self.max_age
+
+
+class SpeechWorker:
+    """
+    speak_fn(text, cancel_event) で実際に読み上げ、stop_fn() で再生中の音声を止める。
+    Future の結果は、最後まで読み上げたら True、破棄・中断されたら False。
+    """
+
+    def __init__(self, speak_fn: Callable[[str, threading.Event], None], stop_fn: Callable[[], None]):
+        self.speak_fn = speak_fn
+        self.stop_fn = stop_fn
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._current: Optional[SpeechRequest] = None
+        self._current_cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+        self.interrupted = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="speech-worker", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str, priority: int = PRIORITY_CHAT, max_age: Optional[float] = None) -> Future:
+        """読み上げ要求を積み、その Future を返す"""
+        self.start()
+        request = SpeechRequest(text, priority, max_age, next(self._seq))
+        self._queue.put(request)
+        return request.future
+
+    def _run(self) -> None:
+        while True:
+            request = self._queue.get()
+            try:
+                if not request.future.set_running_or_notify_cancel():
+                    continue
+                if request.is_stale():
+                    print(f"[読み上げ] 古くなったため破棄: {request.text}")
+                    self.dropped += 1
+                    request.future.set_result(False)
+                    continue
+                with self._lock:
+                    self._current = request
+                    self._current_cancel = threading.Event()
+                    cancel_event = self._current_cancel
+                try:
+                    self.speak_fn(request.text, cancel_event)
+                except Exception as e:
+                    print("読み上げ中にエラーが発生しました:", e)
+                    request.future.set_exception(e)
+                    continue
+                finally:
+                    with self._lock:
+                        self._current = None
+                request.future.set_result(not cancel_event.is_set())
+            finally:
+                self._queue.task_done()
+
+    def barge_in(self, drop_below: int = PRIORITY_CHAT) -> None:
+        """
+        ユーザーが話し始めたときに呼ぶ。再生中の音声を止め、
+        優先度が drop_below 以下（数字が大きい）の待ち要求も破棄する。
+        """
+        with self._lock:
+            if self._current is not None:
+                self._current_cancel.set()
+                self.interrupted += 1
+        self.stop_fn()
+        self.drop_pending(drop_below)
+
+    def drop_pending(self, min_priority: int = PRIORITY_NOTIFICATION) -> int:
+        """優先度が min_priority 以下の待ち要求を破棄し、破棄件数を返す"""
+        kept = []
+        dropped = 0
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.priority >= min_priority and request.future.cancel():
+                dropped += 1
+            else:
+                kept.append(request)
+            self._queue.task_done()
+        for request in kept:
+            self._queue.put(request)
+        self.dropped += dropped
+        return dropped
+
+    def is_speaking(self) -> bool:
+        with self._lock:
+            return self._current is not None
@@ -0,0 +1,180 @@
+# streaming.py
+"""
+発話中の途中結果（部分認識）と、それを使った投機的な処理。
+
+これまでは発話が終わって最終的な認識結果が出てから extract_intent_info を呼んでいたため、
+音声認識とLLMの待ち時間がそのまま足し算になっていた。
+- PartialTranscriber: 録音中の音声を一定間隔でASRに渡し、途中の認識結果を通知する
+  （処理中に次の音声が来たら最新のものだけを残す）
+- SpeculativeStage: 途中結果が安定したら（「タスク」と「登録」を含む、同じ結果が2回続いたなど）
+  その時点で処理を先に始め、最終結果が一致すればその結果をそのまま使う。
+  一致しなければ最終結果で実行し直す。短縮できた時間をターンごとに表示する。
+"""
+import os
+import re
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Sequence, Tuple
+
+import speech_recognition as sr
+
+from audio_buffer import AudioBuffer
+
+# 途中結果を取る間隔（秒）
+PARTIAL_INTERVAL_SECONDS = float(os.environ.get("RABBIT_PARTIAL_INTERVAL", "0.8"))
+# この語をすべて含む途中結果は安定しているとみなして投機を始める
+SPECULATION_KEYWORDS: Sequence[Tuple[str, ...]] = (("タスク", "登録"),)
+
+
+def normalize_transcript(text: str) -> str:
+    """句読点・空白を除いて比較用にする"""
+    return re.sub(r"[\s、。，．,.!！?？「」]", "", text or "")
+
+
+def matched_keywords(text: str, keyword_sets: Sequence[Tuple[str, ...]] = SPECULATION_KEYWORDS) -> Optional[Tuple[str, ...]]:
+    for keywords in keyword_sets:
+        if all(keyword in text for keyword in keywords):
+            return keywords
+    return None
+
+
+class PartialTranscriber:
+    """
+    feed() で渡された途中までの音声を、1本のワーカーでASRにかける。
+    認識中に届いた音声は最新のものだけを残し、認識できたら on_partial(text, audio) を呼ぶ。
+    """
+
+    def __init__(self, backend, on_partial: Callable[[str, AudioBuffer], None]):
+        self.backend = backend
+        self.on_partial = on_partial
+        self.partials = []
+        self._pending: Optional[AudioBuffer] = None
+        self._busy = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def feed(self, audio: AudioBuffer) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._pending = audio
+            if self._busy:
+                return
+            self._busy = True
+        threading.Thread(target=self._work, name="partial-asr", daemon=True).start()
+
+    def close(self) -> None:
+        """これ以降の音声は認識しない（処理中のものは捨てる）"""
+        with self._lock:
+            self._closed = True
+            self._pending = None
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                audio, self._pending = self._pending, None
+                if audio is None or self._closed:
+                    self._busy = False
+                    return
+            try:
+                text = self.backend.recognize(audio).text
+            except (sr.UnknownValueError, sr.RequestError):
+                continue
+            except Exception as e:
+                print("途中結果の認識中にエラーが発生しました:", e)
+                continue
+            with self._lock:
+                if self._closed:
+                    self._busy = False
+                    return
+            self.partials.append(text)
+            print("途中結果:", text)
+            self.on_partial(text, audio)
+
+
+class SpeculativeStage:
+    """
+    途中結果から fn(text) を先に実行しておき、最終結果と一致すればその結果を使う。
+    1ターンごとに start_turn() → on_partial()（何度でも）→ resolve(final_text) の順に呼ぶ。
+    """
+
+    def __init__(self, fn: Callable[[str], object], name: str = "intent",
+                 keyword_sets: Sequence[Tuple[str, ...]] = SPECULATION_KEYWORDS):
+        self.fn = fn
+        self.name = name
+        self.keyword_sets = keyword_sets
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"speculative-{name}")
+        self._lock = threading.Lock()
+        self.start_turn()
+
+    def start_turn(self) -> None:
+        with self._lock:
+            self._last_partial = None
+            self._speculation: Optional[Tuple[str, Future]] = None
+
+    def _timed_call(self, text: str):
+        start = time.perf_counter()
+        result = self.fn(text)
+        return result, start, time.perf_counter()
+
+    def on_partial(self, text: str) -> None:
+        """途中結果を受け取り、安定していれば投機実行を始める（1ターンに1回まで）"""
+        normalized = normalize_transcript(text)
+        if not normalized:
+            return
+        with self._lock:
+            if self._speculation is not None:
+                return
+            keywords = matched_keywords(normalized, self.keyword_sets)
+            stable = keywords is not None or normalized == self._last_partial
+            self._last_partial = normalized
+            if not stable:
+                return
+            print(f"[投機] 途中結果「{text}」で{self.name}を先に実行します。")
+            future = self._executor.submit(self._timed_call, text)
+            self._speculation = (normalized, future)
+
+    def _matches(self, final: str) -> bool:
+        # 途中結果に言葉が続いた場合（「タスク登録じゃなくて雑談しよう」など）は意味が変わりうるので、
+        # 正規化した最終結果が投機に使った途中結果と同じときだけ一致とみなす
+        partial, _ = self._speculation
+        return final == partial
+
+    def resolve(self, final_text: str):
+        """
+        最終結果に対する fn の結果を返す。投機結果が使えればそれを使い、短縮できた時間を表示する。
+        """
+        final_at = time.perf_counter()
+        with self._lock:
+            speculation = self._speculation
+            usable = speculation is not None and self._matches(normalize_transcript(final_text))
+            self._speculation = None
+        if usable:
+            try:
+                result, started_at, finished_at = speculation[1].result()
+            except Exception as e:
+                print(f"[投機] 先行実行が失敗したため実行し直します: {e}")
+            else:
+                # 投機しなかった場合は final_at から処理時間ぶん待っていたはず
+                duration = finished_at - started_at
+                saved = duration - max(0.0, finished_at - final_at)
+                with self._lock:
+                    self.hits += 1
+                    self.saved_seconds += saved
+                print(f"[投機] {self.name}の先行結果を使用しました（{saved * 1000:.0f}ms短縮）")
+                return result
+        if speculation is None:
+            print(f"[投機] 安定した途中結果がなかったため、{self.name}を最終結果で実行します（短縮 0ms）")
+        elif not usable:
+            with self._lock:
+                self.misses += 1
+            print(f"[投機] 最終結果が途中結果と一致しないため、{self.name}を実行し直します（短縮 0ms）")
+        return self.fn(final_text)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "saved_seconds": self.saved_seconds}
@@ -1,7 +1,7 @@
 import json
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
-from audio import speak, recognize_speech
+from audio import speak, recognize_speech, PRIORITY_TASK
 from config import CURRENT_USER_ID, supabase
 from config import chat_model, SUPABASE_URL, SUPABASE_KEY, CURRENT_USER_ID, supabase
 
@@ -102,34 +102,34 @@ def insert_task():
     なお、抽出結果が不十分な場合は、個別に再入力させる。
     最終確認で「やり直し」や「キャンセル」と言われた場合は再入力や中断。
     """
-    speak("タスクの時間と内容を話してね。")
+    speak("タスクの時間と内容を話してね。", priority=PRIORITY_TASK)
     while True:
         text_for_task = recognize_speech(timeout_seconds=120)
         if not text_for_task:
-            speak("うまく聞き取れなかったよ。もう一度話してね。")
+            speak("うまく聞き取れなかったよ。もう一度話してね。", priority=PRIORITY_TASK)
             continue
 
         if detect_cancel_intent(text_for_task):
-            speak("わかったよ。タスクの登録をやめるね。")
+            speak("わかったよ。タスクの登録をやめるね。", priority=PRIORITY_TASK)
             return
 
         task_info = extract_task_info(text_for_task)
 
         # intentがキャンセルなら終了
         if task_info.get("intent") == "cancel":
-            speak("了解だよ。タスク登録はやめておくね。")
+            speak("了解だよ。タスク登録はやめておくね。", priority=PRIORITY_TASK)
             return
 
         if not task_info:
-            speak("入力内容からタスク情報を抽出できなかったよ。もう一度話してね。")
+            speak("入力内容からタスク情報を抽出できなかったよ。もう一度話してね。", priority=PRIORITY_TASK)
             continue
 
         if not task_info.get("title"):
-            speak("タスクのタイトルが見つからなかったよ。もう一度話してね。")
+            speak("タスクのタイトルが見つからなかったよ。もう一度話してね。", priority=PRIORITY_TASK)
             continue
 
         if not task_info.get("scheduled_time"):
-            speak("タスクの実行時刻が見つからなかったよ。時刻を含めて、もう一度話してね。")
+            speak("タスクの実行時刻が見つからなかったよ。時刻を含めて、もう一度話してね。", priority=PRIORITY_TASK)
             continue
 
         break
@@ -138,21 +138,21 @@ def insert_task():
     scheduled_time = task_info["scheduled_time"]
 
     while True:
-        speak(f"確認するね。毎日 {scheduled_time} に {title} で登録しても良いかな。「そうです」または「やり直す」、「キャンセル」で答えてね。")
+        speak(f"確認するね。毎日 {scheduled_time} に {title} で登録しても良いかな。「そうです」または「やり直す」、「キャンセル」で答えてね。", priority=PRIORITY_TASK)
         confirmation_raw = recognize_speech(timeout_seconds=30)
 
         if detect_cancel_intent(confirmation_raw):
-            speak("了解だよ。タスクの登録をやめておくね。")
+            speak("了解だよ。タスクの登録をやめておくね。", priority=PRIORITY_TASK)
             return
 
         confirmation = classify_confirmation(confirmation_raw)
         if confirmation == "No":
-            speak("了解！もう一度、最初からやり直すね。")
+            speak("了解！もう一度、最初からやり直すね。", priority=PRIORITY_TASK)
             return insert_task()
         elif confirmation == "Yes":
             break
         else:
-            speak("確認が取れなかったから、もう一度答えてね。")
+            speak("確認が取れなかったから、もう一度答えてね。", priority=PRIORITY_TASK)
 
     data = {
         "user_id": CURRENT_USER_ID,
@@ -164,10 +164,10 @@ def insert_task():
         res = supabase.table("tasks").insert(data).execute()
         if res.data:
             print("タスクを登録しました:", res.data)
-            speak("タスクを登録したよ。応援してるね。")
+            speak("タスクを登録したよ。応援してるね。", priority=PRIORITY_TASK)
         else:
             print("タスク登録に失敗:", res)
-            speak("タスク登録に失敗したみたい。")
+            speak("タスク登録に失敗したみたい。", priority=PRIORITY_TASK)
     except Exception as e:
         print("DB処理でエラー:", e)
-        speak("タスク登録中にエラーが発生しちゃった。")
+        speak("タスク登録中にエラーが発生しちゃった。", priority=PRIORITY_TASK)
@@ -0,0 +1,233 @@
+# tts_backends.py
+"""
+音声合成(TTS)バックエンドの切り替え。
+
+- GTTSBackend: gTTS（Googleのネットワーク合成）
+- LocalTTSBackend: pyttsx3（端末内で完結するオフライン合成）
+- TTSSelector: バックエンドごとのレイテンシを計測し、ネットワーク合成が
+  予算時間を超えたり失敗したりしたらローカル合成に切り替える
+"""
+import os
+import io
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional
+
+from tts_cache import TTSCache
+
+# ネットワーク合成を待つ上限（秒）。超えたらローカル合成で話す
+TTS_LATENCY_BUDGET = float(os.environ.get("RABBIT_TTS_LATENCY_BUDGET", "1.5"))
+# 短い相づち・確認はこの文字数以下なら、ネットワーク合成が遅延中のときに待たずにローカルで合成する
+SHORT_TEXT_CHARS = int(os.environ.get("RABBIT_TTS_SHORT_TEXT_CHARS", "12"))
+# ネットワーク合成を並行して行う数（プリウォームの4並列と、会話中の読み上げが同時に走れるように）
+TTS_PRIMARY_WORKERS = 6
+# gTTS の1リクエストの上限（秒）。応答のない接続でワーカーが埋まらないようにする
+GTTS_REQUEST_TIMEOUT = float(os.environ.get("RABBIT_GTTS_TIMEOUT", "10"))
+# "auto"（自動切り替え） / "gtts" / "local"
+TTS_BACKEND = os.environ.get("RABBIT_TTS_BACKEND", "auto")
+# pyttsx3 の書き出し先。SDカードを避けるため、あればメモリ上のtmpfsを使う
+RAM_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class TTSBackend:
+    """TTSバックエンドの共通インターフェース。synthesize は音声ファイルのバイト列を返す"""
+
+    name = "base"
+    ext = "mp3"
+
+    def synthesize(self, text: str, lang: str = "ja") -> bytes:
+        raise NotImplementedError
+
+
+class GTTSBackend(TTSBackend):
+    """gTTS によるネットワーク合成（MP3）"""
+
+    name = "gtts"
+    ext = "mp3"
+
+    def __init__(self, timeout: float = GTTS_REQUEST_TIMEOUT):
+        self.timeout = timeout
+
+    def synthesize(self, text: str, lang: str = "ja") -> bytes:
+        from gtts import gTTS
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang, timeout=self.timeout).write_to_fp(buf)
+        return buf.getvalue()
+
+
+class LocalTTSBackend(TTSBackend):
+    """pyttsx3 によるオフライン合成（WAV）。エンジンはスレッドセーフでないのでロックして使う"""
+
+    name = "pyttsx3"
+    ext = "wav"
+
+    def __init__(self, rate: Optional[int] = None):
+        self.rate = rate
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def _get_engine(self):
+        if self._engine is None:
+            import pyttsx3
+            engine = pyttsx3.init()
+            # 日本語の音声があればそれを使う
+            for voice in engine.getProperty("voices"):
+                languages = [str(lang) for lang in (voice.languages or [])]
+                if any("ja" in lang for lang in languages) or "ja" in voice.id.lower():
+                    engine.setProperty("voice", voice.id)
+                    break
+            if self.rate:
+                engine.setProperty("rate", self.rate)
+            self._engine = engine
+        return self._engine
+
+    def synthesize(self, text: str, lang: str = "ja") -> bytes:
+        with self._lock:
+            engine = self._get_engine()
+            # pyttsx3 はファイルにしか書き出せないため、一時ファイル（可能ならtmpfs上）を経由する
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav", dir=RAM_TEMP_DIR) as fp:
+                temp_wav = fp.name
+            try:
+                engine.save_to_file(text, temp_wav)
+                engine.runAndWait()
+                with open(temp_wav, "rb") as f:
+                    return f.read()
+            finally:
+                if os.path.exists(temp_wav):
+                    os.remove(temp_wav)
+
+
+class TTSSelector:
+    """
+    ネットワーク合成(primary)を優先しつつ、遅い・失敗するときはローカル合成(fallback)に切り替える。
+    合成結果は (テキスト, 言語, バックエンド名) でキャッシュし、どちらのキャッシュでも使う。
+    """
+
+    def __init__(self, cache: TTSCache, primary: TTSBackend, fallback: TTSBackend,
+                 latency_budget: float = TTS_LATENCY_BUDGET, mode: str = TTS_BACKEND,
+                 probe_interval: float = 30.0):
+        self.cache = cache
+        self.primary = primary
+        self.fallback = fallback
+        self.latency_budget = latency_budget
+        self.mode = mode
+        self.probe_interval = probe_interval
+        # バックエンドごとのレイテンシの指数移動平均（秒）
+        self.latency: Dict[str, Optional[float]] = {primary.name: None, fallback.name: None}
+        self.failures: Dict[str, int] = {primary.name: 0, fallback.name: 0}
+        self.fallback_count = 0
+        self._degraded_since: Optional[float] = None
+        # ネットワーク合成を実行中・順番待ちの数（裏で完了を待っているものも含む）
+        self._primary_busy = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=TTS_PRIMARY_WORKERS, thread_name_prefix="tts-primary")
+
+    def _record(self, backend: TTSBackend, seconds: float) -> None:
+        with self._lock:
+            previous = self.latency[backend.name]
+            self.latency[backend.name] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+
+    def _synthesize_and_store(self, backend: TTSBackend, text: str, lang: str) -> str:
+        start = time.perf_counter()
+        try:
+            data = backend.synthesize(text, lang)
+        except Exception:
+            with self._lock:
+                self.failures[backend.name] += 1
+            raise
+        self._record(backend, time.perf_counter() - start)
+        return self.cache.put(text, lang, backend.name, data, ext=backend.ext)
+
+    def _primary_is_degraded(self, probe: bool = True) -> bool:
+        """
+        ネットワーク合成が遅い状態が続いているか（一定間隔で再挑戦する）。
+        probe=False なら再挑戦の役は引き受けず、遅延中である限り True を返す。
+        """
+        with self._lock:
+            if self._degraded_since is None:
+                return False
+            if probe and time.monotonic() - self._degraded_since > self.probe_interval:
+                self._degraded_since = None
+                return False
+            return True
+
+    def _mark_degraded(self, degraded: bool) -> None:
+        with self._lock:
+            if degraded:
+                if self._degraded_since is None:
+                    self._degraded_since = time.monotonic()
+            else:
+                self._degraded_since = None
+
+    def _use_local(self, text: str, lang: str, reason: str) -> str:
+        print(f"[TTS] ローカル合成に切り替えます（{reason}）: {text}")
+        self.fallback_count += 1
+        return self._synthesize_and_store(self.fallback, text, lang)
+
+    def synthesize(self, text: str, lang: str = "ja") -> str:
+        """テキストを合成し、再生できる音声ファイルのパスを返す"""
+        if self.mode == "local":
+            backends = [self.fallback]
+        elif self.mode == "gtts":
+            backends = [self.primary]
+        else:
+            backends = [self.primary, self.fallback]
+        # キャッシュは1回だけ引く（どのバックエンドの音声でもよい）
+        path = self.cache.get_first(text, lang, [backend.name for backend in backends])
+        if path is not None:
+            return path
+
+        if self.mode == "local":
+            return self._synthesize_and_store(self.fallback, text, lang)
+        if self.mode == "gtts":
+            return self._synthesize_and_store(self.primary, text, lang)
+
+        # 短文は待たせたくないので、遅延中の再挑戦には使わない（再挑戦は長い文で行う）
+        if len(text) <= SHORT_TEXT_CHARS and self._primary_is_degraded(probe=False):
+            return self._use_local(text, lang, "短文・ネットワーク合成が遅延中")
+        if self._primary_is_degraded():
+            return self._use_local(text, lang, "ネットワーク合成が遅延中")
+
+        # ワーカーがすべて使われていれば、順番を待たずにローカルで合成する
+        with self._lock:
+            full = self._primary_busy >= TTS_PRIMARY_WORKERS
+            if not full:
+                self._primary_busy += 1
+        if full:
+            self._mark_degraded(True)
+            return self._use_local(text, lang, "ネットワーク合成の処理が詰まっている")
+
+        def _run():
+            try:
+                return self._synthesize_and_store(self.primary, text, lang)
+            finally:
+                with self._lock:
+                    self._primary_busy -= 1
+
+        # 予算時間は順番待ちと合成の合計に対してかける
+        future = self._executor.submit(_run)
+        try:
+            path = future.result(timeout=self.latency_budget)
+            self._mark_degraded(False)
+            return path
+        except FutureTimeoutError:
+            # 間に合わなかったネットワーク合成は裏で完了させ、次回以降はキャッシュから使う
+            if future.cancel():
+                with self._lock:
+                    self._primary_busy -= 1
+            self._mark_degraded(True)
+            return self._use_local(text, lang, f"{self.latency_budget}秒以内に合成できなかった")
+        except Exception as e:
+            self._mark_degraded(True)
+            return self._use_local(text, lang, f"ネットワーク合成に失敗: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "latency": dict(self.latency),
+                "failures": dict(self.failures),
+                "fallback_count": self.fallback_count,
+                "degraded": self._degraded_since is not None,
+            }
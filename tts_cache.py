@@ -0,0 +1,241 @@
+# tts_cache.py
+"""
+音声合成(TTS)結果のディスクキャッシュ。
+
+(テキスト, 言語, バックエンド) の組をSHA-256でハッシュ化したキーで音声データを保存し、
+同じフレーズを再度読み上げるときはネットワーク越しの合成を省略する。
+合計サイズが上限を超えたら、最後に使われた時刻が古いものから削除する（LRU）。
+
+コマンドラインから中身の確認・削除ができる:
+    python tts_cache.py stats
+    python tts_cache.py list
+    python tts_cache.py prune --max-mb 20
+    python tts_cache.py clear
+"""
+import os
+import json
+import time
+import atexit
+import hashlib
+import argparse
+import threading
+from typing import Callable, Optional, Sequence
+
+# キャッシュの保存先と上限サイズ（環境変数で上書き可能）
+TTS_CACHE_DIR = os.environ.get(
+    "RABBIT_TTS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache"),
+)
+TTS_CACHE_MAX_BYTES = int(os.environ.get("RABBIT_TTS_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+INDEX_FILE_NAME = "index.json"
+
+
+class TTSCache:
+    """
+    合成済み音声をコンテンツアドレスで保存するLRUキャッシュ。
+    インデックス(index.json)には各エントリのファイル名・サイズ・最終利用時刻と、
+    ヒット/ミスの累計回数を保存する。
+    """
+
+    def __init__(self, cache_dir: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._entries = self._load_index()
+        # ヒット時の最終利用時刻の更新は、終了時にまとめて書き出す
+        atexit.register(self.save)
+
+    @staticmethod
+    def make_key(text: str, lang: str, backend: str) -> str:
+        """(テキスト, 言語, バックエンド) からキャッシュキーを作る"""
+        raw = json.dumps([text, lang, backend], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, INDEX_FILE_NAME)
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        stats = index.get("stats", {})
+        self.hits = stats.get("hits", 0)
+        self.misses = stats.get("misses", 0)
+        # 実体のないエントリはインデックスから外す
+        entries = index.get("entries", {})
+        return {
+            key: entry for key, entry in entries.items()
+            if os.path.exists(os.path.join(self.cache_dir, entry["file"]))
+        }
+
+    def save(self) -> None:
+        """インデックスをディスクに書き出す（一時ファイル経由で置き換える）"""
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        if not self._dirty:
+            return
+        index = {
+            "stats": {"hits": self.hits, "misses": self.misses},
+            "entries": self._entries,
+        }
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._index_path())
+        self._dirty = False
+
+    def get(self, text: str, lang: str, backend: str) -> Optional[str]:
+        """キャッシュ済みならファイルパスを返し、なければNoneを返す"""
+        return self.get_first(text, lang, [backend])
+
+    def get_first(self, text: str, lang: str, backends: Sequence[str]) -> Optional[str]:
+        """
+        backends の順にキャッシュを探し、最初に見つかったファイルパスを返す（なければNone）。
+        何件のバックエンドを探しても、ヒット/ミスは1回として数える。
+        """
+        with self._lock:
+            for backend in backends:
+                key = self.make_key(text, lang, backend)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                path = os.path.join(self.cache_dir, entry["file"])
+                if not os.path.exists(path):
+                    del self._entries[key]
+                    self._dirty = True
+                    continue
+                entry["last_access"] = time.time()
+                self.hits += 1
+                self._dirty = True
+                return path
+            self.misses += 1
+            self._dirty = True
+            return None
+
+    def put(self, text: str, lang: str, backend: str, data: bytes, ext: str = "mp3") -> str:
+        """音声データを保存し、そのファイルパスを返す"""
+        key = self.make_key(text, lang, backend)
+        file_name = f"{key}.{ext}"
+        path = os.path.join(self.cache_dir, file_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._entries[key] = {
+                "file": file_name,
+                "size": len(data),
+                "last_access": time.time(),
+                "text": text,
+                "lang": lang,
+                "backend": backend,
+            }
+            self._dirty = True
+            self._prune_locked(self.max_bytes, keep=key)
+            self._save_locked()
+        return path
+
+    def get_or_create(self, text: str, lang: str, backend: str,
+                      synthesize: Callable[[], bytes], ext: str = "mp3") -> str:
+        """
+        キャッシュにあればそのパスを、なければ synthesize() で合成して保存したパスを返す。
+        """
+        path = self.get(text, lang, backend)
+        if path is not None:
+            return path
+        return self.put(text, lang, backend, synthesize(), ext=ext)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry["size"] for entry in self._entries.values())
+
+    def prune(self, max_bytes: Optional[int] = None) -> int:
+        """合計サイズが max_bytes 以下になるまで古いものから削除し、削除件数を返す"""
+        with self._lock:
+            removed = self._prune_locked(self.max_bytes if max_bytes is None else max_bytes)
+            self._save_locked()
+            return removed
+
+    def _prune_locked(self, max_bytes: int, keep: Optional[str] = None) -> int:
+        total = sum(entry["size"] for entry in self._entries.values())
+        removed = 0
+        # 最終利用時刻が古い順に削除する
+        for key, entry in sorted(self._entries.items(), key=lambda kv: kv[1]["last_access"]):
+            if total <= max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except FileNotFoundError:
+                pass
+            total -= entry["size"]
+            del self._entries[key]
+            removed += 1
+        if removed:
+            self._dirty = True
+        return removed
+
+    def clear(self) -> int:
+        """キャッシュを全て削除し、削除件数を返す"""
+        return self.prune(max_bytes=0)
+
+    def stats(self) -> dict:
+        """ヒット/ミス回数とエントリ数・合計サイズを返す"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "total_bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def entries(self) -> list:
+        """最終利用時刻が新しい順にエントリを返す"""
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda e: e["last_access"], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTSキャッシュの確認・削除")
+    parser.add_argument("--dir", default=TTS_CACHE_DIR, help="キャッシュディレクトリ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="ヒット率・サイズを表示")
+    sub.add_parser("list", help="キャッシュ済みのフレーズを一覧表示")
+    prune_parser = sub.add_parser("prune", help="上限サイズまで古いものから削除")
+    prune_parser.add_argument("--max-mb", type=float, default=TTS_CACHE_MAX_BYTES / (1024 * 1024))
+    sub.add_parser("clear", help="全て削除")
+    args = parser.parse_args()
+
+    cache = TTSCache(cache_dir=args.dir)
+    if args.command == "stats":
+        stats = cache.stats()
+        print(f"エントリ数: {stats['entries']}")
+        print(f"合計サイズ: {stats['total_bytes'] / 1024:.1f} KB / {stats['max_bytes'] / 1024:.1f} KB")
+        print(f"ヒット: {stats['hits']} / ミス: {stats['misses']} (ヒット率 {stats['hit_rate']:.0%})")
+    elif args.command == "list":
+        for entry in cache.entries():
+            last_access = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_access"]))
+            print(f"{last_access}  {entry['size']:>8}B  [{entry['backend']}/{entry['lang']}] {entry['text']}")
+    elif args.command == "prune":
+        removed = cache.prune(max_bytes=int(args.max_mb * 1024 * 1024))
+        print(f"{removed} 件削除しました。")
+    elif args.command == "clear":
+        removed = cache.clear()
+        print(f"{removed} 件削除しました。")
+
+
+if __name__ == "__main__":
+    main()
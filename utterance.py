@@ -0,0 +1,75 @@
+# utterance.py
+"""
+1回の録音から得られる解析結果をまとめる Utterance と、その解析段を並行実行する仕組み。
+
+以前は main_loop が recognize_speech を2回呼び（テキスト用と感情用）、
+そのたびに録音・音声認識・感情分析の保存・最新レコードの読み直しが発生していた。
+ここでは1回の録音バッファに対して、音声認識・感情分析の集計・感情分類を同時に走らせ、
+それぞれの処理時間を記録する。
+"""
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from audio_buffer import AudioBuffer
+
+# 解析段を並行実行するスレッドプール（段の数だけあればよい）
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="utterance")
+
+
+class Utterance:
+    """
+    1回の発話の解析結果。audio は録音した AudioBuffer で、すべての段がこれをそのまま使う。
+    latencies には段の名前ごとの処理時間（秒）、errors には失敗した段の例外を入れる。
+    """
+
+    def __init__(self, audio: Optional[AudioBuffer] = None):
+        self.audio = audio
+        self.text = ""
+        self.partials = []
+        self.asr = None
+        self.sentiment: Dict[str, float] = {}
+        self.record: Dict = {}
+        # 感情分析の保存が終わると、保存したレコードが入る Future（audio.save_sentiment_when_done）
+        self.sentiment_saved: Optional[Future] = None
+        self.ai_emotions = ""
+        self.emotion_label: Optional[str] = None
+        self.latencies: Dict[str, float] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.created_at = time.time()
+
+    def run_stages(self, stages: Dict[str, Callable[[], object]]) -> Dict[str, object]:
+        """
+        stages の各関数を同じスレッドプールで同時に実行し、成功した段の結果を返す。
+        失敗した段の例外は errors に入れる。
+        """
+        def _timed(name: str, fn: Callable[[], object]):
+            start = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                self.latencies[name] = time.perf_counter() - start
+
+        futures = {name: _executor.submit(_timed, name, fn) for name, fn in stages.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                self.errors[name] = e
+        return results
+
+    def timed(self, name: str, fn: Callable[[], object]):
+        """fn を実行し、その処理時間を name の段として記録する"""
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.latencies[name] = time.perf_counter() - start
+
+    def as_dict(self) -> dict:
+        """recognize_speech が従来返していた形式の辞書"""
+        return {"text": self.text, "ai_emotions": self.ai_emotions, "emotion_label": self.emotion_label}
+
+    def latency_summary(self) -> str:
+        return ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.latencies.items())
@@ -0,0 +1,113 @@
+# vad.py
+"""
+フレーム単位の音声区間検出(VAD)による発話の終端検出。
+
+speech_recognition の pause_threshold（固定の無音秒数）で発話の終わりを待つと、
+毎ターン数秒の待ち時間が発生する。ここでは 30ms フレームごとに
+- RMSエネルギー（ノイズフロアに対する比）
+- ゼロ交差率（雑音・摩擦音と有声音の区別）
+で発話かどうかを判定し、開始には連続フレーム数、終了にはハングオーバー（余韻）時間を使って
+発話の開始・終了を検出する。終了は話し終わってからハングオーバー分（既定300ms）で確定する。
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# 積極度ごとの設定（数字が大きいほど発話判定が厳しく、終了の確定が早い）
+#   energy_ratio: しきい値に掛ける倍率 / max_zcr: 発話とみなすゼロ交差率の上限
+#   onset_frames: 開始とみなす連続発話フレーム数 / hangover_ms: 終了を確定するまでの無音時間
+AGGRESSIVENESS_PRESETS = {
+    0: {"energy_ratio": 0.8, "max_zcr": 0.50, "onset_frames": 2, "hangover_ms": 450},
+    1: {"energy_ratio": 1.0, "max_zcr": 0.40, "onset_frames": 3, "hangover_ms": 300},
+    2: {"energy_ratio": 1.3, "max_zcr": 0.35, "onset_frames": 3, "hangover_ms": 240},
+    3: {"energy_ratio": 1.6, "max_zcr": 0.30, "onset_frames": 4, "hangover_ms": 180},
+}
+VAD_AGGRESSIVENESS = int(os.environ.get("RABBIT_VAD_AGGRESSIVENESS", "1"))
+
+SPEECH_START = "start"
+SPEECH_END = "end"
+
+
+def frame_energy(frame: np.ndarray) -> float:
+    """フレームのRMS（int16スケール）"""
+    if len(frame) == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+
+
+def zero_crossing_rate(frame: np.ndarray) -> float:
+    """隣り合うサンプルで符号が変わる割合（0〜1）"""
+    if len(frame) < 2:
+        return 0.0
+    signs = np.signbit(frame)
+    return float(np.count_nonzero(signs[1:] != signs[:-1])) / (len(frame) - 1)
+
+
+class VADEndpointer:
+    """
+    フレームを順に process() に渡すと、発話の開始・終了を (イベント, サンプル位置) で返す状態機械。
+    開始位置はオンセット判定に使ったフレームの先頭、終了位置は最後の発話フレームの末尾。
+    """
+
+    def __init__(self, frame_size: int, samplerate: int = 16000, aggressiveness: int = VAD_AGGRESSIVENESS,
+                 hangover_ms: Optional[int] = None):
+        preset = AGGRESSIVENESS_PRESETS[max(0, min(3, aggressiveness))]
+        self.frame_size = frame_size
+        self.samplerate = samplerate
+        self.energy_ratio = preset["energy_ratio"]
+        self.max_zcr = preset["max_zcr"]
+        self.onset_frames = preset["onset_frames"]
+        hangover_ms = preset["hangover_ms"] if hangover_ms is None else hangover_ms
+        self.hangover_frames = max(1, int(round(hangover_ms * samplerate / 1000 / frame_size)))
+        self.reset()
+
+    def reset(self) -> None:
+        self.in_speech = False
+        self._onset_count = 0
+        self._onset_start = 0
+        self._silent_count = 0
+        self._last_speech_end = 0
+
+    def is_speech_frame(self, frame: np.ndarray, energy_threshold: float) -> bool:
+        """
+        エネルギーがしきい値を超え、かつゼロ交差率が低い（有声音らしい）フレームを発話とする。
+        十分に大きいフレームはゼロ交差率に関わらず発話とする（摩擦音など）。
+        """
+        energy = frame_energy(frame)
+        threshold = energy_threshold * self.energy_ratio
+        if energy <= threshold:
+            return False
+        return energy > threshold * 3 or zero_crossing_rate(frame) <= self.max_zcr
+
+    def process(self, frame: np.ndarray, position: int, energy_threshold: float) -> Optional[Tuple[str, int]]:
+        """
+        位置 position から始まるフレームを1つ処理する。
+        発話の開始・終了が確定したら (SPEECH_START | SPEECH_END, 位置) を返し、それ以外は None。
+        """
+        is_speech = self.is_speech_frame(frame, energy_threshold)
+        frame_end = position + len(frame)
+        if not self.in_speech:
+            if not is_speech:
+                self._onset_count = 0
+                return None
+            if self._onset_count == 0:
+                self._onset_start = position
+            self._onset_count += 1
+            if self._onset_count >= self.onset_frames:
+                self.in_speech = True
+                self._silent_count = 0
+                self._last_speech_end = frame_end
+                return SPEECH_START, self._onset_start
+            return None
+
+        if is_speech:
+            self._silent_count = 0
+            self._last_speech_end = frame_end
+            return None
+        self._silent_count += 1
+        if self._silent_count >= self.hangover_frames:
+            self.in_speech = False
+            self._onset_count = 0
+            return SPEECH_END, self._last_speech_end
+        return None
@@ -0,0 +1,232 @@
+# wake_word.py
+"""
+ウェイクワード（「ラビット」）の簡易キーワードスポッター。
+
+録音した発話の先頭部分を、あらかじめ登録した「ラビット」のお手本音声と
+MFCC特徴量 + DTW（動的時間伸縮）で照合し、一致したときだけ
+音声認識（クラウド）と意図判定（OpenAI）に渡す。誰も呼びかけていない待機中の
+音声はここで捨てるので、待機中のクラウド呼び出しがほぼなくなる。
+
+お手本の登録:
+    python wake_word.py enroll            # マイクで3回「ラビット」と話して登録
+    python wake_word.py enroll a.wav b.wav # 録音済みWAVから登録
+    python wake_word.py test x.wav         # WAVを判定してスコアを表示
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from typing import List, Optional
+
+import numpy as np
+
+from audio_buffer import AudioBuffer, resample
+
+WAKE_WORD_DIR = os.environ.get(
+    "RABBIT_WAKE_WORD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "wake_word"),
+)
+# 照合するのは発話の先頭から何秒までか
+WAKE_WORD_SEARCH_SECONDS = 2.0
+# しきい値 = お手本同士の距離の最大値 × この倍率
+THRESHOLD_MARGIN = 1.3
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 400   # 25ms
+FRAME_STEP = 160     # 10ms
+N_FFT = 512
+N_MELS = 26
+N_MFCC = 13
+
+
+def _mel_filterbank(n_mels: int = N_MELS, n_fft: int = N_FFT, samplerate: int = SAMPLE_RATE) -> np.ndarray:
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    mels = np.linspace(hz_to_mel(0), hz_to_mel(samplerate / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mels) / samplerate).astype(int)
+    fbank = np.zeros((n_mels, n_fft // 2 + 1))
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            fbank[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            fbank[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return fbank
+
+
+_FBANK = _mel_filterbank()
+_DCT = np.cos(np.pi / N_MELS * (np.arange(N_MELS) + 0.5)[None, :] * np.arange(N_MFCC)[:, None])
+_WINDOW = np.hamming(FRAME_LENGTH)
+
+
+def mfcc(samples: np.ndarray) -> np.ndarray:
+    """
+    int16 / float の16kHzモノラル音声から (フレーム数, 12) のMFCCを計算する。
+    声の大きさに左右されないよう0次係数は捨てる。お手本も同じマイクで録るので、
+    平均を引く正規化（CMN）はしない（無音部分の長さで特徴がずれてしまうため）。
+    """
+    signal = samples.astype(np.float32)
+    if len(signal) < FRAME_LENGTH:
+        signal = np.pad(signal, (0, FRAME_LENGTH - len(signal)))
+    signal = np.append(signal[0], signal[1:] - 0.97 * signal[:-1])
+    n_frames = 1 + (len(signal) - FRAME_LENGTH) // FRAME_STEP
+    idx = np.arange(FRAME_LENGTH)[None, :] + FRAME_STEP * np.arange(n_frames)[:, None]
+    frames = signal[idx] * _WINDOW
+    power = np.abs(np.fft.rfft(frames, N_FFT)) ** 2 / N_FFT
+    log_mel = np.log(power @ _FBANK.T + 1e-10)
+    return (log_mel @ _DCT.T)[:, 1:]
+
+
+def subsequence_dtw(template: np.ndarray, query: np.ndarray) -> float:
+    """
+    query のどこかに template が含まれているかを、部分列DTWの正規化距離で返す（小さいほど一致）。
+    斜め・縦・1つ飛ばしの3通りの遷移だけにして、テンプレートの行ごとにまとめて計算する。
+    """
+    cost = np.linalg.norm(template[:, None, :] - query[None, :, :], axis=2)
+    acc = cost[0].copy()
+    for i in range(1, len(template)):
+        prev = acc
+        diag = np.full_like(prev, np.inf)
+        diag[1:] = prev[:-1]
+        skip = np.full_like(prev, np.inf)
+        skip[2:] = prev[:-2]
+        acc = cost[i] + np.minimum(np.minimum(prev, diag), skip)
+    return float(acc.min() / len(template))
+
+
+def read_wav(path: str) -> np.ndarray:
+    """音声ファイルを、サンプルレート・ビット数・チャンネル数によらず16kHz・モノラル・int16で読む"""
+    return AudioBuffer.from_file(path).samples
+
+
+class WakeWordSpotter:
+    """
+    登録済みのお手本と照合してウェイクワードを検出する。
+    お手本が1つもない場合は無効（すべて通す）として動く。
+    """
+
+    def __init__(self, template_dir: str = WAKE_WORD_DIR, threshold: Optional[float] = None):
+        self.template_dir = template_dir
+        self.templates: List[np.ndarray] = []
+        self.threshold = threshold
+        self.detections = 0
+        self.rejections = 0
+        self.last_score: Optional[float] = None
+        self.load()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.templates)
+
+    def load(self) -> None:
+        """お手本のWAVとしきい値（wake_word/config.json）を読み込む"""
+        paths = sorted(glob.glob(os.path.join(self.template_dir, "*.wav")))
+        self.templates = [mfcc(read_wav(path)) for path in paths]
+        if self.threshold is None:
+            try:
+                with open(os.path.join(self.template_dir, "config.json"), "r", encoding="utf-8") as f:
+                    self.threshold = float(json.load(f)["threshold"])
+            except (FileNotFoundError, KeyError, ValueError, json.JSONDecodeError):
+                self.threshold = self._estimate_threshold()
+        if not self.templates:
+            print("[ウェイクワード] お手本が登録されていないため、すべての発話を通します。")
+
+    def _estimate_threshold(self) -> Optional[float]:
+        """お手本同士の距離から、照合のしきい値を決める"""
+        if len(self.templates) < 2:
+            return None
+        distances = [subsequence_dtw(a, b) for i, a in enumerate(self.templates)
+                     for j, b in enumerate(self.templates) if i != j]
+        return max(distances) * THRESHOLD_MARGIN
+
+    def score(self, samples: np.ndarray, samplerate: int = SAMPLE_RATE) -> float:
+        """発話の先頭部分とお手本の最小距離を返す"""
+        if samplerate != SAMPLE_RATE:
+            samples = resample(samples, samplerate, SAMPLE_RATE)
+        head = samples[:int(WAKE_WORD_SEARCH_SECONDS * SAMPLE_RATE)]
+        query = mfcc(head)
+        return min(subsequence_dtw(template, query) for template in self.templates)
+
+    def detect(self, samples: np.ndarray, samplerate: int = SAMPLE_RATE) -> bool:
+        """ウェイクワードが含まれていれば True（お手本未登録なら常に True）"""
+        if not self.enabled or self.threshold is None:
+            return True
+        start = time.perf_counter()
+        self.last_score = self.score(samples, samplerate)
+        detected = self.last_score <= self.threshold
+        if detected:
+            self.detections += 1
+        else:
+            self.rejections += 1
+        print(f"[ウェイクワード] {'検出' if detected else '不一致'} "
+              f"(スコア {self.last_score:.2f} / しきい値 {self.threshold:.2f}, "
+              f"{(time.perf_counter() - start) * 1000:.0f}ms)")
+        return detected
+
+    def detect_audio(self, audio) -> bool:
+        """AudioBuffer（16kHz・モノラル・int16）を判定する"""
+        return self.detect(audio.samples, audio.sample_rate)
+
+
+def enroll(wav_paths: List[str], template_dir: str = WAKE_WORD_DIR, count: int = 3) -> None:
+    """お手本を登録し、しきい値を計算して保存する"""
+    os.makedirs(template_dir, exist_ok=True)
+    if not wav_paths:
+        import speech_recognition as sr
+        from capture import CaptureService
+        capture = CaptureService()
+        for i in range(count):
+            print(f"({i + 1}/{count}) 「ラビット」と話してください。")
+            try:
+                audio = capture.listen(timeout=10, phrase_time_limit=3)
+            except sr.WaitTimeoutError:
+                print("音声が入力されませんでした。")
+                continue
+            path = os.path.join(template_dir, f"template_{int(time.time())}_{i}.wav")
+            with open(path, "wb") as f:
+                f.write(audio.wav_bytes())
+        capture.close()
+    else:
+        for i, src in enumerate(wav_paths):
+            # 録音済みのファイルは形式がまちまちなので、16kHz・モノラル・int16のWAVにして保存する
+            dst = os.path.join(template_dir, f"template_{int(time.time())}_{i}.wav")
+            with open(dst, "wb") as f_out:
+                f_out.write(AudioBuffer.from_file(src).wav_bytes())
+
+    spotter = WakeWordSpotter(template_dir, threshold=None)
+    threshold = spotter._estimate_threshold()
+    if threshold is None:
+        print("お手本が2つ以上必要です。")
+        return
+    with open(os.path.join(template_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"threshold": threshold}, f)
+    print(f"{len(spotter.templates)}件のお手本を登録しました（しきい値 {threshold:.2f}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ウェイクワードのお手本登録・判定")
+    sub = parser.add_subparsers(dest="command", required=True)
+    enroll_parser = sub.add_parser("enroll", help="お手本を登録する")
+    enroll_parser.add_argument("wavs", nargs="*")
+    test_parser = sub.add_parser("test", help="WAVを判定する")
+    test_parser.add_argument("wavs", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "enroll":
+        enroll(args.wavs)
+    elif args.command == "test":
+        spotter = WakeWordSpotter()
+        if not spotter.enabled:
+            sys.exit(1)
+        for path in args.wavs:
+            print(path, spotter.detect(read_wav(path)))
+
+
+if __name__ == "__main__":
+    main()
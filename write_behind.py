@@ -0,0 +1,335 @@
+# write_behind.py
+"""
+Supabase への書き込みをまとめて後から行う（write-behind）バッファ。
+
+以前は発話ごとに sentiment_averages へ同期的に insert し、その応答を待ってから
+会話を続けていた。WriteBehindWriter は
+- write() で行をローカルのジャーナル（JSON Lines）に追記してすぐに返し、
+- バックグラウンドのスレッドが、件数（batch_size）か経過時間（flush_interval）で
+  溜まった行を1回の insert でまとめて送り、
+- 失敗したら間隔を倍にしながら（最大 max_backoff 秒）送り直す。
+- 同じまとまりが max_attempts 回続けて失敗するか、送り直しても通らないエラー（行の中身が不正など）なら
+  1件ずつ送り直す（送れる行は先に送る）。
+  同じまとまりの他の行が通ったのに失敗した行と、送り直しても通らないエラーの行だけを
+  デッドレターファイルに移して諦める。全件失敗したときは接続の問題とみなし、ジャーナルに残して再送を続ける。
+  デッドレターはジャーナルと同じ形式なので、ジャーナルに書き戻せば次の起動時に送り直される。
+ジャーナルには送った行の印も書くので、送る前に落ちた行は次の起動時に読み直して送る
+（送った直後、印を書く前に落ちた場合は同じ行がもう一度送られることがある）。
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+SENTIMENT_JOURNAL_FILE = os.environ.get(
+    "RABBIT_SENTIMENT_JOURNAL",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sentiment_journal.jsonl"),
+)
+# この件数が溜まるか、最初の行から flush_interval 秒たったら送る
+WRITE_BATCH_SIZE = int(os.environ.get("RABBIT_WRITE_BATCH_SIZE", "20"))
+WRITE_FLUSH_SECONDS = float(os.environ.get("RABBIT_WRITE_FLUSH_SECONDS", "5.0"))
+# 送り直すまでの待ち時間（秒）の初期値と上限
+WRITE_RETRY_BACKOFF = 1.0
+WRITE_MAX_BACKOFF = 60.0
+# 同じまとまり（1件ずつに分けた後は同じ行）がこの回数続けて失敗したら先へ進む
+WRITE_MAX_ATTEMPTS = int(os.environ.get("RABBIT_WRITE_MAX_ATTEMPTS", "5"))
+# 送り直しても通らないエラーの SQLSTATE の分類（22: データの誤り, 23: 制約違反, 42: 構文・列名の誤り）
+NON_RETRYABLE_SQLSTATE_CLASSES = ("22", "23", "42")
+
+
+def is_retryable(error: Exception) -> bool:
+    """送り直せば通る見込みのあるエラーか（接続・タイムアウト・サーバー側の一時的な失敗など）"""
+    if isinstance(error, (TypeError, ValueError)) and not isinstance(error, OSError):
+        # 行をJSONにできないなど、何度送っても同じ結果になる
+        return False
+    code = getattr(error, "code", None)
+    return not (isinstance(code, str) and code[:2] in NON_RETRYABLE_SQLSTATE_CLASSES)
+# ジャーナルの送った行がこの件数を超えたら、未送信の行だけに書き直す
+JOURNAL_COMPACT_THRESHOLD = 500
+
+
+class WriteBehindWriter:
+    """
+    insert_rows（行のリストを1回で挿入する関数）への書き込みを、ジャーナル付きでまとめて行う。
+    latest(user_id) で、まだ送っていない行も含めて最後に書いた行を返す。
+    送れなかった行は dead_letter_path（既定はジャーナルの名前 + ".dead"）に書き出す。
+    """
+
+    def __init__(self, insert_rows: Callable[[List[dict]], object], name: str = "書き込み",
+                 journal_path: Optional[str] = SENTIMENT_JOURNAL_FILE, batch_size: int = WRITE_BATCH_SIZE,
+                 flush_interval: float = WRITE_FLUSH_SECONDS, backoff: float = WRITE_RETRY_BACKOFF,
+                 max_backoff: float = WRITE_MAX_BACKOFF, max_attempts: int = WRITE_MAX_ATTEMPTS,
+                 dead_letter_path: Optional[str] = None):
+        self.insert_rows = insert_rows
+        self.name = name
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        if dead_letter_path is None and journal_path is not None:
+            dead_letter_path = journal_path + ".dead"
+        self.dead_letter_path = dead_letter_path
+        self.written = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead_letters = 0
+        self._attempts = 0
+        self._pending: Dict[str, dict] = {}
+        self._oldest: Optional[float] = None
+        self._latest: Dict[str, dict] = {}
+        self._done_in_journal = 0
+        self._retry_at = 0.0
+        self._current_backoff = backoff
+        self._journal = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._replay_journal()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- ジャーナル ----
+    def _replay_journal(self) -> None:
+        """前回送りきれなかった行を読み直し、ジャーナルを未送信の行だけに書き直す"""
+        if self.journal_path is None:
+            return
+        pending = {}
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中で落ちた最後の行
+                        continue
+                    if "row" in entry:
+                        pending[entry["key"]] = entry["row"]
+                    else:
+                        for key in entry.get("done", []):
+                            pending.pop(key, None)
+        except FileNotFoundError:
+            pass
+        self._pending = pending
+        if pending:
+            self._oldest = time.monotonic()
+            print(f"[{self.name}] 前回送れなかった {len(pending)} 件をジャーナルから読み直しました")
+        self._rewrite_journal()
+
+    def _rewrite_journal(self) -> None:
+        if self.journal_path is None:
+            return
+        if self._journal is not None:
+            self._journal.close()
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, row in self._pending.items():
+                f.write(json.dumps({"key": key, "row": row}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._done_in_journal = 0
+
+    def _append_journal(self, entry: dict) -> None:
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    # ---- 書き込み ----
+    def write(self, row: dict) -> dict:
+        """
+        行をジャーナルに書いてすぐに返す（送るのはバックグラウンド）。
+        created_at がなければ今の時刻を入れる（送るのが遅れても発話の時刻で並ぶように）。
+        """
+        row = dict(row)
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        key = uuid.uuid4().hex
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name}のバッファは閉じられています")
+            self._append_journal({"key": key, "row": row})
+            self._pending[key] = row
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if "user_id" in row:
+                self._latest[row["user_id"]] = row
+            self.written += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return row
+
+    def latest(self, user_id: str) -> Optional[dict]:
+        """このプロセスで user_id について最後に書いた行（なければ None）"""
+        with self._cond:
+            return self._latest.get(user_id)
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _due(self, now: float) -> bool:
+        if not self._pending or now < self._retry_at:
+            return False
+        return (self._closed or len(self._pending) >= self.batch_size
+                or now - self._oldest >= self.flush_interval)
+
+    def _wait_time(self, now: float) -> Optional[float]:
+        if not self._pending:
+            return None
+        due = max(self._oldest + self.flush_interval, self._retry_at)
+        return max(0.0, due - now)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._due(time.monotonic()):
+                    if self._closed and not self._pending:
+                        return
+                    self._cond.wait(self._wait_time(time.monotonic()))
+                batch = dict(list(self._pending.items())[:self.batch_size])
+                one_by_one = self._attempts >= self.max_attempts
+            if one_by_one:
+                self._send_each(batch)
+            else:
+                self._send(batch)
+
+    def _send(self, batch: Dict[str, dict]) -> bool:
+        start = time.perf_counter()
+        try:
+            self.insert_rows(list(batch.values()))
+        except Exception as e:
+            with self._cond:
+                self.failures += 1
+                self._attempts += 1
+                if not is_retryable(e):
+                    # 行の中身の問題なので、まとめて送り直しても通らない。次は1件ずつ送る
+                    self._attempts = self.max_attempts
+                    print(f"[{self.name}] {len(batch)}件の送信に失敗しました（1件ずつ送り直します）:", e)
+                    return False
+                print(f"[{self.name}] {len(batch)}件の送信に失敗しました"
+                      f"（{self._attempts}回目、{self._current_backoff:.1f}秒後に再送）:", e)
+                self._back_off()
+            return False
+        with self._cond:
+            self._attempts = 0
+            self._retry_at = 0.0
+            self._current_backoff = self.backoff
+            self.flushed += len(batch)
+            self.batches += 1
+            self._mark_done(list(batch))
+        print(f"[{self.name}] {len(batch)}件を送信しました（{(time.perf_counter() - start) * 1000:.0f}ms）")
+        return True
+
+    def _send_each(self, batch: Dict[str, dict]) -> bool:
+        """
+        まとめて送れなかった行を1件ずつ送る。送れた行はそこで終わりにし、
+        送り直しても通らないエラーの行と、他の行が通ったのに失敗した行はデッドレターに移す。
+        1件も通らなければ接続の問題とみなし、全件を残して間隔を空けてからまとめて送り直す
+        """
+        sent, failed = [], []
+        for key, row in batch.items():
+            try:
+                self.insert_rows([row])
+            except Exception as e:
+                failed.append((key, row, e))
+                continue
+            sent.append(key)
+        dead = [(key, row, e) for key, row, e in failed if sent or not is_retryable(e)]
+        for key, row, e in dead:
+            print(f"[{self.name}] 送れなかった行をデッドレターに移します:", e)
+            self._write_dead_letter(key, row, e)
+        with self._cond:
+            self.failures += len(failed)
+            self.flushed += len(sent)
+            self.batches += len(sent)
+            self.dead_letters += len(dead)
+            self._mark_done(sent + [key for key, _, _ in dead])
+            self._attempts = 0
+            if len(dead) < len(failed):
+                self._back_off()
+            else:
+                self._retry_at = 0.0
+                self._current_backoff = self.backoff
+        print(f"[{self.name}] 1件ずつ送り直しました（送信 {len(sent)}件、デッドレター {len(dead)}件、"
+              f"再送待ち {len(failed) - len(dead)}件）")
+        return not failed
+
+    def _back_off(self) -> None:
+        self._retry_at = time.monotonic() + self._current_backoff
+        self._current_backoff = min(self._current_backoff * 2, self.max_backoff)
+
+    def _mark_done(self, keys: List[str]) -> None:
+        """送った（または諦めた）行を未送信から外し、ジャーナルに印を書く。_cond を持って呼ぶ"""
+        if not keys:
+            return
+        for key in keys:
+            self._pending.pop(key, None)
+        self._oldest = time.monotonic() if self._pending else None
+        self._append_journal({"done": keys})
+        self._done_in_journal += len(keys)
+        if self._done_in_journal >= JOURNAL_COMPACT_THRESHOLD:
+            self._rewrite_journal()
+        self._cond.notify_all()
+
+    def _write_dead_letter(self, key: str, row: dict, error: Exception) -> None:
+        """送れなかった行をジャーナルと同じ形式（理由つき）でデッドレターファイルに追記する"""
+        if self.dead_letter_path is None:
+            print(f"[{self.name}] 送れなかった行を破棄しました:", json.dumps(row, ensure_ascii=False))
+            return
+        entry = {"key": key, "row": row, "error": str(error),
+                 "failed_at": datetime.now(timezone.utc).isoformat()}
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"[{self.name}] デッドレターに書き込めませんでした:", e)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """溜まっている行を今すぐ送り、送りきるまで待つ（失敗中なら再送を待つ）。送りきれたら True"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._pending:
+                self._oldest = time.monotonic() - self.flush_interval
+                self._cond.notify_all()
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """終了時に残りを送る。送りきれなかった行はジャーナルに残り、次の起動時に送られる"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            if self._pending:
+                print(f"[{self.name}] 未送信の {len(self._pending)} 件をジャーナルに残しました")
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "written": self.written,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "failures": self.failures,
+                "dead_letters": self.dead_letters,
+                "pending": len(self._pending),
+            }